@@ -0,0 +1,266 @@
+"""Reproducible OCR benchmark.
+
+Generates a deterministic synthetic corpus with PIL, runs preprocessing and the
+full OCR path across several worker counts, and reports throughput, latency,
+memory and character error rate against the ground truth.
+
+    python bench.py --workers 1 2 4 --save-baseline bench_baseline.json
+    python bench.py --workers 1 2 4 --baseline bench_baseline.json   # exits 1 on regression
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont
+
+import ocr_gui
+
+CORPUS_VERSION = 1
+FONT_DIRS = [
+    os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    '/Library/Fonts',
+    '/System/Library/Fonts',
+]
+# Candidate font files per language; a language is only included when one is installed
+SCRIPT_FONTS = {
+    'eng': ['DejaVuSans.ttf', 'DejaVuSerif.ttf', 'LiberationSans-Regular.ttf', 'arial.ttf', 'times.ttf', 'Arial.ttf'],
+    'fra': ['DejaVuSans.ttf', 'arial.ttf', 'Arial.ttf'],
+    'deu': ['DejaVuSerif.ttf', 'times.ttf', 'Arial.ttf'],
+    'spa': ['DejaVuSans.ttf', 'arial.ttf', 'Arial.ttf'],
+    'ben': ['NotoSansBengali-Regular.ttf', 'Nirmala.ttf', 'vrinda.ttf'],
+    'hin': ['NotoSansDevanagari-Regular.ttf', 'Nirmala.ttf', 'mangal.ttf'],
+    'ara': ['NotoNaskhArabic-Regular.ttf', 'DejaVuSans.ttf', 'arial.ttf'],
+    'chi_sim': ['NotoSansCJK-Regular.ttc', 'NotoSansSC-Regular.otf', 'msyh.ttc', 'simsun.ttc'],
+}
+SAMPLE_TEXT = {
+    'eng': ["The quick brown fox jumps over the lazy dog", "Invoice 2024-0173 total due 1,482.50 USD",
+            "Please sign and return the attached contract", "Shipping address: 42 Harbour Road, Leeds"],
+    'fra': ["Le vif renard brun saute par-dessus le chien", "Facture payable sous trente jours"],
+    'deu': ["Der schnelle braune Fuchs springt über den Hund", "Rechnung zahlbar innerhalb von dreißig Tagen"],
+    'spa': ["El veloz zorro marrón salta sobre el perro", "Factura pagadera en treinta días"],
+    'ben': ["আমার সোনার বাংলা আমি তোমায় ভালোবাসি"],
+    'hin': ["भारत एक विशाल देश है"],
+    'ara': ["مرحبا بكم في المكتب"],
+    'chi_sim': ["我们今天去图书馆学习"],
+}
+FONT_SIZES = [14, 18, 24, 32]
+NOISE_LEVELS = [0, 8, 20]
+SKEW_ANGLES = [0.0, 1.5, -3.0]
+
+
+def find_font(names):
+    for name in names:
+        for font_dir in FONT_DIRS:
+            if not os.path.isdir(font_dir):
+                continue
+            for root, dirs, files in os.walk(font_dir):
+                if name in files:
+                    return os.path.join(root, name)
+    return None
+
+
+def render_page(lines, font_path, size, noise, skew, rng):
+    font = ImageFont.truetype(font_path, size) if font_path else ImageFont.load_default(size)
+    line_height = int(size * 1.6)
+    width = max(int(font.getlength(line)) for line in lines) + 2 * size
+    img = Image.new('L', (width, line_height * len(lines) + 2 * size), 255)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((size, size + i * line_height), line, font=font, fill=rng.randint(0, 60))
+    if skew:
+        img = img.rotate(skew, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if noise:
+        import numpy as np
+        arr = np.asarray(img, dtype=np.int16)
+        speckle = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, noise, arr.shape)
+        img = Image.fromarray(np.clip(arr + speckle, 0, 255).astype(np.uint8))
+    return img
+
+
+def generate_corpus(out_dir, count=24, seed=1234, log=print):
+    """Create count images (plus one multi-page TIFF) in out_dir and a manifest.json of ground truth.
+
+    The same seed always produces the same corpus; an existing matching corpus is reused.
+    """
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == CORPUS_VERSION and manifest.get('seed') == seed and manifest.get('count') == count:
+            return manifest
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    fonts = {lang: find_font(names) for lang, names in SCRIPT_FONTS.items()}
+    # Latin scripts fall back to PIL's built-in font; other scripts need a real font
+    langs = [lang for lang in SAMPLE_TEXT if fonts[lang] or lang in ('eng', 'fra', 'deu', 'spa')]
+    skipped = sorted(set(SAMPLE_TEXT) - set(langs))
+    if skipped and log:
+        log(f"No font installed for: {', '.join(skipped)} (skipped)")
+    items = []
+    for index in range(count):
+        lang = 'eng' if index % 3 else rng.choice(langs)
+        lines = rng.sample(SAMPLE_TEXT[lang], min(len(SAMPLE_TEXT[lang]), rng.randint(1, 3)))
+        img = render_page(lines, fonts[lang], rng.choice(FONT_SIZES), rng.choice(NOISE_LEVELS), rng.choice(SKEW_ANGLES), rng)
+        name = f"page_{index:03d}_{lang}.png"
+        img.save(os.path.join(out_dir, name))
+        items.append({'file': name, 'lang': lang, 'text': '\n'.join(lines), 'pages': 1})
+    pages = [render_page(SAMPLE_TEXT['eng'][i:i + 2], fonts['eng'], 24, 8, 0.0, rng) for i in range(0, 4, 2)]
+    pages[0].save(os.path.join(out_dir, 'multipage.tif'), save_all=True, append_images=pages[1:])
+    items.append({'file': 'multipage.tif', 'lang': 'eng', 'pages': len(pages),
+                  'text': '\f'.join('\n'.join(SAMPLE_TEXT['eng'][i:i + 2]) for i in range(0, 4, 2))})
+    manifest = {'version': CORPUS_VERSION, 'seed': seed, 'count': count, 'items': items}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def normalise(text):
+    return ' '.join(text.split())
+
+
+def character_error_rate(results, truth):
+    errors = total = 0
+    for result in results:
+        expected = normalise(truth[result['path']])
+        errors += edit_distance(normalise(result['text']), expected)
+        total += len(expected)
+    return errors / total if total else 0.0
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def bench_preprocess(paths, repeat=3):
+    timings = []
+    for path in paths:
+        for page_no, load in ocr_gui.iter_document_pages(path):
+            img = load()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ocr_gui.preprocess_image(img)
+                timings.append(time.perf_counter() - start)
+    return {'p50_ms': round(percentile(timings, 50) * 1000, 2), 'p95_ms': round(percentile(timings, 95) * 1000, 2)}
+
+
+def bench_ocr(items, corpus_dir, workers, tesseract_cmd):
+    jobs = [(os.path.join(corpus_dir, item['file']), item['lang']) for item in items]
+    start = time.perf_counter()
+    # Cache disabled so every run measures the engine
+    with ProcessPoolExecutor(max_workers=workers, initializer=ocr_gui._init_batch_worker,
+                             initargs=(tesseract_cmd, 'eng', None)) as pool:
+        results = list(pool.map(ocr_gui.ocr_image_file, *zip(*jobs)))
+    elapsed = time.perf_counter() - start
+    failures = [result for result in results if result['error']]
+    if failures:
+        raise SystemExit(f"OCR failed for {failures[0]['path']}: {failures[0]['error']}")
+    latencies = [result['seconds'] for result in results]
+    pages = sum(result['pages'] for result in results)
+    truth = {os.path.join(corpus_dir, item['file']): item['text'] for item in items}
+    return {
+        'workers': workers,
+        'images': len(results),
+        'pages': pages,
+        'seconds': round(elapsed, 3),
+        'images_per_sec': round(len(results) / elapsed, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'peak_rss_kb': max(result['peak_rss_kb'] or 0 for result in results),
+        'cer': round(character_error_rate(results, truth), 4),
+    }
+
+
+def compare(report, baseline, throughput_tolerance, cer_tolerance, rss_tolerance=0.25):
+    """Return a list of regressions of report against baseline."""
+    problems = []
+    previous = {run['workers']: run for run in baseline.get('runs', [])}
+    for run in report['runs']:
+        old = previous.get(run['workers'])
+        if not old:
+            continue
+        if run['images_per_sec'] < old['images_per_sec'] * (1 - throughput_tolerance):
+            problems.append(f"workers={run['workers']}: throughput {run['images_per_sec']} < baseline {old['images_per_sec']}")
+        if run['cer'] > old['cer'] + cer_tolerance:
+            problems.append(f"workers={run['workers']}: CER {run['cer']} > baseline {old['cer']}")
+        if old.get('peak_rss_kb') and run['peak_rss_kb'] > old['peak_rss_kb'] * (1 + rss_tolerance):
+            problems.append(f"workers={run['workers']}: peak RSS {run['peak_rss_kb']} KB > baseline {old['peak_rss_kb']} KB")
+    old_pre = baseline.get('preprocess')
+    if old_pre and report['preprocess']['p50_ms'] > old_pre['p50_ms'] * (1 + throughput_tolerance):
+        problems.append(f"preprocess p50 {report['preprocess']['p50_ms']} ms > baseline {old_pre['p50_ms']} ms")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing and OCR on a synthetic corpus")
+    parser.add_argument('--corpus', default='bench_corpus', help="Corpus directory (generated if missing)")
+    parser.add_argument('--count', type=int, default=24, help="Number of single-page images")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--tesseract', default=None, help="Path to the tesseract executable")
+    parser.add_argument('--report', default=None, help="Write the JSON report here")
+    parser.add_argument('--baseline', default=None, help="Fail if results regress past this saved report")
+    parser.add_argument('--save-baseline', default=None, help="Save this run as the new baseline")
+    parser.add_argument('--throughput-tolerance', type=float, default=0.15, help="Allowed fractional slowdown (default: 0.15)")
+    parser.add_argument('--cer-tolerance', type=float, default=0.01, help="Allowed absolute CER increase (default: 0.01)")
+    parser.add_argument('--rss-tolerance', type=float, default=0.25, help="Allowed fractional peak RSS growth (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr, flush=True)
+    manifest = generate_corpus(args.corpus, args.count, args.seed, log)
+    items = manifest['items']
+    # Discovery first: it points TESSDATA_DIR at the installed Tesseract, where the models must go
+    tesseract_cmd = ocr_gui.resolve_tesseract_cmd(args.tesseract, log)
+    for lang in sorted({item['lang'] for item in items}):
+        ocr_gui.ensure_langdata(lang, log)
+    report = {
+        'corpus': {'seed': args.seed, 'count': args.count, 'version': CORPUS_VERSION},
+        'backend': ocr_gui.get_engine(tesseract_cmd).backend,
+        'preprocess': bench_preprocess([os.path.join(args.corpus, item['file']) for item in items]),
+        'runs': [],
+    }
+    log(f"preprocess: p50 {report['preprocess']['p50_ms']} ms, p95 {report['preprocess']['p95_ms']} ms")
+    for workers in args.workers:
+        run = bench_ocr(items, args.corpus, workers, tesseract_cmd)
+        report['runs'].append(run)
+        log(f"workers={workers}: {run['images_per_sec']} images/s, p50 {run['p50_ms']} ms, p95 {run['p95_ms']} ms, "
+            f"peak RSS {run['peak_rss_kb']} KB, CER {run['cer']:.2%}")
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(output)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(report, json.load(f), args.throughput_tolerance, args.cer_tolerance, args.rss_tolerance)
+        for problem in problems:
+            log(f"REGRESSION: {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,25 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
 from PIL import Image
-import pytesseract
 import os
-import requests
-import zipfile
 from io import BytesIO
 import threading
 import subprocess
 import sys
-from tkinter import ttk
 import json
 import time
 from pathlib import Path
 
-DEST_DIR = "Tesseract-Portable"
-GITHUB_API = "https://api.github.com/repos/UB-Mannheim/tesseract/releases"
-FALLBACK_TESSERACT_ZIP = "https://github.com/UB-Mannheim/tesseract/releases/download/v5.3.3/tesseract-ocr-w64-5.3.3-portable.zip"
+# tkinter and requests are imported where first needed, so headless runs
+# start quickly and work in containers without Tk
+tk = ttk = filedialog = messagebox = scrolledtext = None
+
 INSTALLER_URL = "https://github.com/UB-Mannheim/tesseract/releases/download/v5.4.0.20240606/tesseract-ocr-w64-setup-5.4.0.20240606.exe"
 INSTALLER_NAME = "tesseract-ocr-w64-setup-5.4.0.20240606.exe"
 TESSDATA_DIR = os.path.join(os.environ.get('ProgramFiles', ''), 'Tesseract-OCR', 'tessdata')
+# tessdata_best models share file names with the standard ones, so they live in their own directory
+TESSDATA_BEST_DIR = os.path.join(os.path.dirname(TESSDATA_DIR), 'tessdata_best')
 TESSDATA_BEST_URL = "https://github.com/tesseract-ocr/tessdata_best/raw/main/{lang_code}.traineddata"
+TESSDATA_URL = "https://github.com/tesseract-ocr/tessdata/raw/main/{lang_code}.traineddata"
+LANGDATA_PARALLEL_DOWNLOADS = 4
 LANGS = {
     'English': 'eng',
     'Bangla': 'ben',
@@ -32,6 +31,8 @@ LANGS = {
     'Spanish': 'spa',
     # Add more as needed
 }
+# Pseudo language code: detect the script of each page and pick its model
+AUTO_LANG = 'auto'
 
 # --- Update Check Constants ---
 REPO_OWNER = "needyamin"
@@ -65,6 +66,7 @@ def debug_update_check(log):
             log("Update check file not found")
         log(f"\nTesting GitHub API Connection:")
         try:
+            import requests
             headers = {
                 'Accept': 'application/vnd.github.v3+json',
                 'User-Agent': 'ANSNEW-Tech-Text2Image'
@@ -91,44 +93,7 @@ def debug_update_check(log):
     except Exception as e:
         log(f"Debug Error: {str(e)}")
 
-# --- Tesseract Portable Auto-Update Functions ---
-def get_latest_portable_url():
-    resp = requests.get(GITHUB_API)
-    resp.raise_for_status()
-    releases = resp.json()
-    for release in releases[:10]:  # Check the latest 10 releases
-        for asset in release.get("assets", []):
-            name = asset["name"].lower()
-            if name.endswith(".zip") and "portable" in name:
-                return asset["browser_download_url"]
-    # Fallback to a known working version
-    return FALLBACK_TESSERACT_ZIP
-
-def download_and_extract_tesseract(url, dest_dir, log_callback=None):
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    total = int(response.headers.get('content-length', 0))
-    downloaded = 0
-    chunks = []
-    for chunk in response.iter_content(chunk_size=8192):
-        if chunk:
-            chunks.append(chunk)
-            downloaded += len(chunk)
-            if log_callback:
-                percent = int(downloaded * 100 / total) if total else 0
-                log_callback(f"Downloading Tesseract: {percent}% ({downloaded // 1024} KB)")
-    if log_callback:
-        log_callback("Extracting Tesseract...")
-    with zipfile.ZipFile(BytesIO(b''.join(chunks))) as z:
-        z.extractall(dest_dir)
-    for root, dirs, files in os.walk(dest_dir):
-        if "tesseract.exe" in files:
-            exe_path = os.path.join(root, "tesseract.exe")
-            if log_callback:
-                log_callback(f"Tesseract ready at: {exe_path}")
-            return exe_path
-    raise Exception("tesseract.exe not found after extraction.")
-
+# --- Tesseract Installer (Windows) ---
 def run_installer_with_elevation(installer_path, log_callback=None):
     try:
         # Use ShellExecuteEx to run installer as admin (silent mode)
@@ -152,25 +117,117 @@ def run_installer_with_elevation(installer_path, log_callback=None):
             log_callback(f"Installer error: {e}")
         raise
 
+# --- Tesseract Discovery ---
+# Resolved executable, version and languages, reused while the executable and tessdata are unchanged
+TESSERACT_INFO_FILE = Path(os.environ.get('OCR_TESSERACT_INFO', Path.home() / '.ocr_gui_tesseract.json'))
+UNIX_TESSERACT_PATHS = [
+    '/usr/bin/tesseract',
+    '/usr/local/bin/tesseract',
+    '/opt/homebrew/bin/tesseract',
+    '/opt/local/bin/tesseract',
+    '/snap/bin/tesseract',
+]
+_TESSERACT_INFO = None
+
 def find_installed_tesseract():
-    possible_paths = [
-        os.path.join(os.environ.get('ProgramFiles', ''), 'Tesseract-OCR', 'tesseract.exe'),
-        os.path.join(os.environ.get('ProgramFiles(x86)', ''), 'Tesseract-OCR', 'tesseract.exe'),
-        os.path.join('C:\\', 'Program Files', 'Tesseract-OCR', 'tesseract.exe'),
-        os.path.join('C:\\', 'Program Files (x86)', 'Tesseract-OCR', 'tesseract.exe'),
-    ]
+    """Locate tesseract on PATH, then in the usual install locations for this platform."""
+    import shutil
+    found = shutil.which('tesseract')
+    if found:
+        return os.path.abspath(found)
+    if os.name == 'nt':
+        possible_paths = [
+            os.path.join(os.environ.get('ProgramFiles', ''), 'Tesseract-OCR', 'tesseract.exe'),
+            os.path.join(os.environ.get('ProgramFiles(x86)', ''), 'Tesseract-OCR', 'tesseract.exe'),
+            os.path.join('C:\\', 'Program Files', 'Tesseract-OCR', 'tesseract.exe'),
+            os.path.join('C:\\', 'Program Files (x86)', 'Tesseract-OCR', 'tesseract.exe'),
+        ]
+    else:
+        possible_paths = UNIX_TESSERACT_PATHS
     for path in possible_paths:
-        if os.path.isfile(path):
+        if os.path.isfile(path) and os.access(path, os.X_OK):
             return path
     return None
 
+def _run_tesseract(path, *args):
+    kwargs = {}
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+    proc = subprocess.run([path, *args], capture_output=True, text=True, timeout=30, **kwargs)
+    # Older releases print --version and --list-langs to stderr
+    return proc.stdout + proc.stderr
+
+def tesseract_version(path):
+    for line in _run_tesseract(path, '--version').splitlines():
+        if line.lower().startswith('tesseract'):
+            return line.split()[1].lstrip('v')
+    raise Exception(f"Could not read the version of {path}")
+
+def probe_tesseract(path):
+    """Ask the tesseract at path for its version, tessdata directory and installed languages."""
+    import re
+    info = {'path': path, 'version': tesseract_version(path), 'tessdata_dir': None, 'langs': []}
+    lines = _run_tesseract(path, '--list-langs').splitlines()
+    for index, line in enumerate(lines):
+        if line.startswith('List of available languages'):
+            match = re.search(r'"(.+?)[\\/]?"', line)
+            info['tessdata_dir'] = match.group(1) if match else None
+            info['langs'] = sorted(l.strip() for l in lines[index + 1:] if l.strip())
+            break
+    return info
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_mtime, st.st_size]
+
+def load_tesseract_info(path=None, info_file=TESSERACT_INFO_FILE):
+    """Return probe_tesseract() results for path (default: the discovered one), or None if not found.
+
+    Results are kept in info_file and reused without running anything as long
+    as the executable's mtime/size and the tessdata directory's mtime (which
+    changes when models are added) still match, so repeat launches skip
+    probing entirely.
+    """
+    try:
+        cached = json.loads(Path(info_file).read_text(encoding='utf-8'))
+        if (path is None or cached['path'] == path) and _file_signature(cached['path']) == cached['signature'] and \
+                (not cached['tessdata_dir'] or os.stat(cached['tessdata_dir']).st_mtime == cached['tessdata_mtime']):
+            return cached
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    path = path or find_installed_tesseract()
+    if not path:
+        return None
+    info = probe_tesseract(path)
+    info['signature'] = _file_signature(path)
+    info['tessdata_mtime'] = os.stat(info['tessdata_dir']).st_mtime if info['tessdata_dir'] and os.path.isdir(info['tessdata_dir']) else None
+    try:
+        write_atomic(str(info_file), json.dumps(info, indent=2))
+    except OSError:
+        pass  # Read-only home directory: probe again next time
+    return info
+
+def use_tesseract_info(info):
+    """Make info (from load_tesseract_info) the default executable and tessdata location."""
+    global _TESSERACT_INFO, TESSDATA_DIR, TESSDATA_BEST_DIR
+    _TESSERACT_INFO = info
+    if info.get('tessdata_dir'):
+        TESSDATA_DIR = info['tessdata_dir']
+        TESSDATA_BEST_DIR = os.path.join(os.path.dirname(TESSDATA_DIR), 'tessdata_best')
+
+TESSERACT_INSTALL_HINT = ("Tesseract not found. Install it with your package manager, "
+                          "e.g. 'apt install tesseract-ocr' or 'brew install tesseract'.")
+
 def ensure_tesseract_exists(log_callback=None):
-    # Check if tesseract.exe exists in PATH or common locations
-    exe_path = find_installed_tesseract()
-    if exe_path:
+    # Check PATH and common locations (cached between launches)
+    info = load_tesseract_info()
+    if info:
+        use_tesseract_info(info)
         if log_callback:
-            log_callback(f"Tesseract found at: {exe_path}")
-        return exe_path
+            log_callback(f"Tesseract {info['version']} found at: {info['path']}")
+        return info['path']
+    if os.name != 'nt':
+        raise Exception(TESSERACT_INSTALL_HINT)
     # Download installer if not present
     if log_callback:
         log_callback("Tesseract not found. Downloading installer...")
@@ -185,68 +242,3392 @@ def ensure_tesseract_exists(log_callback=None):
         return exe_path
     raise Exception("Tesseract installation failed.")
 
+# --- Download Manager ---
+DOWNLOAD_MIN_CHUNK = 64 * 1024
+DOWNLOAD_MAX_CHUNK = 4 * 1024 * 1024
+DOWNLOAD_RETRIES = 5
+
+def download_file(url, dest_path, sha256=None, session=None, log_callback=None, label=None,
+                  retries=DOWNLOAD_RETRIES, progress_callback=None):
+    """Stream url to dest_path, resuming interrupted transfers.
+
+    Data is written to dest_path + '.part'. If that file already exists (from a
+    failed run or an earlier retry) an HTTP Range request continues from its
+    size; servers that ignore Range simply restart from zero. Bytes are kept as
+    sent (identity encoding is requested) so offsets line up; a response that
+    is compressed anyway is decoded but not resumed. A 416 is taken as
+    complete only if Content-Range or sha256 confirms it, otherwise the stale
+    partial file is discarded. Chunk size grows while reads are fast and
+    shrinks when they stall. When sha256 is given the finished file is
+    verified before being renamed into place, so dest_path only ever holds a
+    complete download.
+
+    progress_callback, if given, is called with (bytes_done, bytes_total or 0).
+    """
+    import requests
+    from urllib3.exceptions import HTTPError as Urllib3Error
+    label = label or os.path.basename(dest_path)
+    part_path = dest_path + '.part'
+    session = session or requests
+    attempt = 0
+    while True:
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+        encoded = False
+        try:
+            with session.get(url, stream=True, headers=headers, timeout=(15, 60)) as response:
+                if response.status_code == 416 and offset:
+                    # Range not satisfiable: done if the partial file is the whole file, else it is stale
+                    size = response.headers.get('content-range', '').rpartition('/')[2]
+                    if (size.isdigit() and int(size) == offset) or (sha256 and _file_sha256(part_path) == sha256.lower()):
+                        break
+                    if log_callback:
+                        log_callback(f"Discarding a stale partial download of {label}")
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+                encoded = response.headers.get('content-encoding', 'identity').lower() != 'identity'
+                if response.status_code != 206 or encoded:
+                    offset = 0
+                length = int(response.headers.get('content-length', 0))
+                # Content-Length of a compressed body says nothing about the decoded size
+                total = offset + length if length and not encoded else 0
+                done = offset
+                chunk_size = DOWNLOAD_MIN_CHUNK
+                last_percent = -1
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    while True:
+                        start = time.perf_counter()
+                        chunk = response.raw.read(chunk_size, decode_content=encoded)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        done += len(chunk)
+                        elapsed = time.perf_counter() - start
+                        if elapsed < 0.05 and len(chunk) == chunk_size:
+                            chunk_size = min(chunk_size * 2, DOWNLOAD_MAX_CHUNK)
+                        elif elapsed > 0.5:
+                            chunk_size = max(chunk_size // 2, DOWNLOAD_MIN_CHUNK)
+                        if progress_callback:
+                            progress_callback(done, total)
+                        percent = int(done * 100 / total) if total else 0
+                        if log_callback and percent != last_percent:
+                            last_percent = percent
+                            log_callback(f"Downloading {label}: {percent}% ({done // 1024} KB)")
+                if total and done < total:
+                    raise Urllib3Error(f"connection closed at {done} of {total} bytes")
+            break
+        except (requests.RequestException, Urllib3Error, OSError) as e:
+            if encoded and os.path.isfile(part_path):
+                # Decoded bytes do not line up with the server's byte ranges
+                os.remove(part_path)
+            attempt += 1
+            if attempt > retries:
+                raise
+            if log_callback:
+                log_callback(f"Download of {label} interrupted ({e}); resuming (attempt {attempt}/{retries})...")
+            time.sleep(min(2 ** attempt, 30))
+    if sha256:
+        digest = _file_sha256(part_path)
+        if digest != sha256.lower():
+            os.remove(part_path)
+            raise Exception(f"SHA-256 mismatch for {label}: expected {sha256}, got {digest}")
+    os.replace(part_path, dest_path)
+    return dest_path
+
+def _file_sha256(path):
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_MAX_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 # --- Tesseract Installer Download Function ---
 def download_tesseract_installer(url, dest_path, log_callback=None):
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    total = int(response.headers.get('content-length', 0))
-    downloaded = 0
-    with open(dest_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-                downloaded += len(chunk)
-                if log_callback:
-                    percent = int(downloaded * 100 / total) if total else 0
-                    log_callback(f"Downloading Tesseract installer: {percent}% ({downloaded // 1024} KB)")
+    download_file(url, dest_path, log_callback=log_callback, label="Tesseract installer")
     if log_callback:
         log_callback(f"Installer downloaded to: {dest_path}")
     return dest_path
 
 # --- Language Data Download ---
-def ensure_langdata(lang_code, log_callback=None, use_best=False):
+def langdata_url(lang_code, use_best=False):
+    return (TESSDATA_BEST_URL if use_best else TESSDATA_URL).format(lang_code=lang_code)
+
+def make_download_session(pool_size=LANGDATA_PARALLEL_DOWNLOADS):
+    """requests.Session whose connection pool can serve pool_size concurrent downloads."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def ensure_langdata(lang_code, log_callback=None, use_best=False, session=None):
     if not os.path.isdir(TESSDATA_DIR):
         return  # Tesseract not installed yet
-    traineddata_path = os.path.join(TESSDATA_DIR, f"{lang_code}.traineddata")
+    tessdata_dir = TESSDATA_BEST_DIR if use_best else TESSDATA_DIR
+    traineddata_path = os.path.join(tessdata_dir, f"{lang_code}.traineddata")
     if os.path.isfile(traineddata_path):
         if log_callback:
             size = os.path.getsize(traineddata_path)
-            log_callback(f"Language data '{lang_code}' present ({size // 1024} KB)")
+            log_callback(f"Language data '{lang_code}' ({'best' if use_best else 'standard'}) present ({size // 1024} KB)")
         return
-    url = TESSDATA_BEST_URL.format(lang_code=lang_code) if use_best else f"https://github.com/tesseract-ocr/tessdata/raw/main/{lang_code}.traineddata"
+    url = langdata_url(lang_code, use_best)
     try:
+        os.makedirs(tessdata_dir, exist_ok=True)
         if log_callback:
             log_callback(f"Downloading language data: {lang_code} ({'best' if use_best else 'standard'})...")
-        r = requests.get(url, stream=True)
-        r.raise_for_status()
-        with open(traineddata_path, 'wb') as f:
-            for chunk in r.iter_content(8192):
-                if chunk:
-                    f.write(chunk)
+        download_file(url, traineddata_path, session=session, log_callback=log_callback, label=f"{lang_code}.traineddata")
         if log_callback:
             log_callback(f"Language data '{lang_code}' installed.")
     except Exception as e:
         if log_callback:
             log_callback(f"Failed to download language data '{lang_code}': {e}")
 
+def ensure_model_langdata(lang_code, model='fast', log_callback=None):
+    """ensure_langdata for every model set a 'fast', 'best' or 'tiered' engine will load.
+
+    For AUTO_LANG that is the script detection data; detected languages are
+    fetched when first seen.
+    """
+    if lang_code == AUTO_LANG:
+        # Tiered engines detect with their fast half
+        ensure_langdata('osd', log_callback, use_best=model == 'best')
+        return
+    if model != 'best':
+        ensure_langdata(lang_code, log_callback)
+    if model != 'fast':
+        ensure_langdata(lang_code, log_callback, use_best=True)
+
+def prefetch_langdata(lang_codes=None, use_best=False, workers=LANGDATA_PARALLEL_DOWNLOADS, tessdata_dir=None,
+                      session=None, log_callback=None):
+    """Download all missing .traineddata files for lang_codes (default: every entry in LANGS) in parallel.
+
+    Downloads share one pooled session and each file is written atomically, so
+    a model is either absent or complete. Progress is reported as one
+    aggregate percentage. Returns {lang_code: 'present' | 'installed' | 'failed: ...'}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    if not tessdata_dir:
+        tessdata_dir = TESSDATA_DIR
+        if use_best and os.path.isdir(TESSDATA_DIR):
+            os.makedirs(TESSDATA_BEST_DIR, exist_ok=True)
+            tessdata_dir = TESSDATA_BEST_DIR
+    if not os.path.isdir(tessdata_dir):
+        raise Exception(f"Tessdata directory not found: {tessdata_dir}")
+    lang_codes = list(dict.fromkeys(lang_codes or LANGS.values()))
+    results = {}
+    missing = []
+    for lang_code in lang_codes:
+        if os.path.isfile(os.path.join(tessdata_dir, f"{lang_code}.traineddata")):
+            results[lang_code] = 'present'
+        else:
+            missing.append(lang_code)
+    if not missing:
+        return results
+    session = session or make_download_session(workers)
+    progress = {lang_code: (0, 0) for lang_code in missing}
+    lock = threading.Lock()
+    last_percent = [-1]
+
+    def report(lang_code, done, total):
+        with lock:
+            progress[lang_code] = (done, total)
+            done_sum = sum(d for d, t in progress.values())
+            total_sum = sum(t for d, t in progress.values())
+            # Only meaningful once every download knows its size
+            if total_sum and all(t for d, t in progress.values()):
+                percent = int(done_sum * 100 / total_sum)
+                if log_callback and percent != last_percent[0]:
+                    last_percent[0] = percent
+                    log_callback(f"Downloading {len(missing)} language model(s): {percent}% ({done_sum // 1024} of {total_sum // 1024} KB)")
+
+    def fetch(lang_code):
+        try:
+            download_file(langdata_url(lang_code, use_best), os.path.join(tessdata_dir, f"{lang_code}.traineddata"),
+                          session=session, label=f"{lang_code}.traineddata",
+                          progress_callback=lambda done, total: report(lang_code, done, total))
+            return lang_code, 'installed'
+        except Exception as e:
+            return lang_code, f'failed: {e}'
+
+    if log_callback:
+        log_callback(f"Fetching {', '.join(missing)} ({'best' if use_best else 'standard'}) with {workers} parallel download(s)...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for lang_code, status in pool.map(fetch, missing):
+            results[lang_code] = status
+            if log_callback:
+                log_callback(f"Language data '{lang_code}': {status}")
+    return results
+
+# --- Instrumentation ---
+class _StageTimer:
+    """Context manager that adds the elapsed wall time of a stage to a timings dict."""
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB, or None if it cannot be read."""
+    try:
+        if os.name == 'nt':
+            import ctypes
+            from ctypes import wintypes
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return None
+            return counters.PeakWorkingSetSize // 1024
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and KB elsewhere
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    except Exception:
+        return None
+
+_PROFILED_JOB = threading.local()
+# From 3.12 cProfile sits on sys.monitoring: one profiler per process, seeing every thread
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+def carry_profile(fn):
+    """Wrap fn so that, when another thread runs it, it is profiled into the profiling
+    JobMetrics of the thread calling carry_profile, if there is one. Where the
+    job's own profiler already sees every thread fn is returned unchanged."""
+    metrics = getattr(_PROFILED_JOB, 'metrics', None)
+    if metrics is None or PROFILER_SEES_ALL_THREADS:
+        return fn
+    def run(*args, **kwargs):
+        return metrics.profile_call(fn, *args, **kwargs)
+    return run
+
+class JobMetrics:
+    """Wall-time and memory measurements for one OCR job.
+
+    timings is the stage -> seconds dict that preprocess_image and
+    recognize_document fill in; stage() times any other block into it. With
+    profile=True a cProfile capture of the calling thread runs until finish(),
+    and work it hands to other threads through carry_profile (the page
+    producer, tile and region pools) gets a profiler of its own on that
+    thread. finish() merges them all into stats. On Python 3.12+ the one
+    capture covers every thread; a job started while another profiler is
+    active runs unprofiled.
+    """
+    def __init__(self, job, profile=False):
+        self.job = job
+        self.timings = {}
+        self.started = time.time()
+        self.seconds = None
+        self.peak_rss_kb = None
+        self.extra = {}
+        self._start = time.perf_counter()
+        self.profiler = None
+        self.stats = None
+        if profile:
+            import cProfile
+            self._thread_profilers = []
+            self._active = 0
+            self._condition = threading.Condition()
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Another profiling tool (or job) already holds the process-wide profiler
+                self.profiler = None
+            else:
+                _PROFILED_JOB.metrics = self
+
+    def stage(self, name):
+        return _StageTimer(self.timings, name)
+
+    def profile_call(self, fn, *args, **kwargs):
+        """Run fn on this thread under its own profiler, kept for merging at finish().
+        fn runs unprofiled when no second profiler can be started."""
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None
+        with self._condition:
+            self._active += 1
+        _PROFILED_JOB.metrics = self
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if profiler:
+                profiler.disable()
+            _PROFILED_JOB.metrics = None
+            with self._condition:
+                if profiler:
+                    self._thread_profilers.append(profiler)
+                self._active -= 1
+                self._condition.notify_all()
+
+    def finish(self, profile_path=None, **extra):
+        self.seconds = time.perf_counter() - self._start
+        self.peak_rss_kb = peak_rss_kb()
+        self.extra.update(extra)
+        if self.profiler:
+            import pstats
+            self.profiler.disable()
+            if getattr(_PROFILED_JOB, 'metrics', None) is self:
+                _PROFILED_JOB.metrics = None
+            with self._condition:
+                # A producer thread may still be winding down after the last page
+                self._condition.wait_for(lambda: not self._active, timeout=5)
+                profilers = [self.profiler] + self._thread_profilers
+            self.stats = pstats.Stats()
+            for profiler in profilers:
+                profiler.create_stats()
+                if profiler.stats:
+                    self.stats.add(profiler)
+            if profile_path:
+                self.stats.dump_stats(profile_path)
+        return self
+
+    def profile_summary(self, limit=15):
+        """Top functions by cumulative time from the merged cProfile captures, as text."""
+        if not self.stats:
+            return ''
+        import io
+        buffer = io.StringIO()
+        self.stats.stream = buffer
+        self.stats.sort_stats('cumulative').print_stats(limit)
+        return buffer.getvalue()
+
+    def to_dict(self):
+        return {
+            'job': self.job,
+            'started': round(self.started, 3),
+            'seconds': round(self.seconds, 4) if self.seconds is not None else None,
+            'timings': {stage: round(seconds, 4) for stage, seconds in self.timings.items()},
+            'peak_rss_kb': self.peak_rss_kb,
+            **self.extra,
+        }
+
+def metrics_to_prometheus(records):
+    """Aggregate metric dicts (JobMetrics.to_dict) into Prometheus text exposition format."""
+    stage_totals = {}
+    job_seconds = 0.0
+    failures = 0
+    peak = 0
+    for record in records:
+        job_seconds += record.get('seconds') or 0.0
+        failures += bool(record.get('error'))
+        peak = max(peak, record.get('peak_rss_kb') or 0)
+        for stage, seconds in record.get('timings', {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+    lines = [
+        '# HELP ocr_jobs_total OCR jobs completed.',
+        '# TYPE ocr_jobs_total counter',
+        f'ocr_jobs_total {len(records)}',
+        '# HELP ocr_job_failures_total OCR jobs that raised an error.',
+        '# TYPE ocr_job_failures_total counter',
+        f'ocr_job_failures_total {failures}',
+        '# HELP ocr_job_seconds_total Wall time spent in OCR jobs.',
+        '# TYPE ocr_job_seconds_total counter',
+        f'ocr_job_seconds_total {job_seconds:.6f}',
+        '# HELP ocr_stage_seconds_total Wall time spent per pipeline stage.',
+        '# TYPE ocr_stage_seconds_total counter',
+    ]
+    for stage in sorted(stage_totals):
+        lines.append(f'ocr_stage_seconds_total{{stage="{stage}"}} {stage_totals[stage]:.6f}')
+    lines += [
+        '# HELP ocr_peak_rss_bytes Highest peak resident set size seen in any worker.',
+        '# TYPE ocr_peak_rss_bytes gauge',
+        f'ocr_peak_rss_bytes {peak * 1024}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+class MetricsSink:
+    """Writes job metrics to a JSON lines file, or a Prometheus text dump for paths ending in .prom.
+
+    JSON lines are appended as each job finishes; the Prometheus dump is
+    rewritten with aggregated totals on close().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.prometheus = str(path).endswith('.prom')
+        self.records = []
+        self._file = None if self.prometheus else open(path, 'a', encoding='utf-8')
+
+    def record(self, metrics):
+        if self.prometheus:
+            self.records.append(metrics)
+        else:
+            self._file.write(json.dumps(metrics, ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def close(self):
+        if self.prometheus:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(metrics_to_prometheus(self.records))
+        else:
+            self._file.close()
+
 # --- Image Preprocessing ---
-def preprocess_image(image_path):
-    from PIL import ImageOps
-    img = Image.open(image_path)
-    img = img.convert('L')  # Grayscale
-    img = ImageOps.autocontrast(img)
-    # Simple thresholding
-    img = img.point(lambda x: 0 if x < 128 else 255, '1')
+# Anything that changes preprocess_image output must be reflected here, since
+# these parameters are part of the OCR cache key.
+PREPROCESS_PARAMS = {
+    'target_dpi': 300,            # higher-resolution scans are decoded/reduced towards this
+    'max_pixels': 250_000_000,    # hard cap; anything larger is downscaled
+    'tile_pixels': 16_000_000,    # pages larger than this are OCR'd as tiles
+    'tile_size': 4096,
+    'tile_overlap': 128,          # only used where no blank seam is found
+    'min_x_height': 20,           # smaller text is scaled up to this x-height in px (0 = never upscale)
+    'max_x_height': 48,           # larger text is scaled down to this, to save work (0 = never downscale)
+    'denoise': 3,                 # median filter size (0 = off)
+    'deskew': True,
+    'max_skew': 5.0,              # degrees searched either side of horizontal
+    'binarize': 'sauvola',        # 'sauvola', 'otsu', 'fixed' or 'none'
+    'threshold': 128,             # cutoff for 'fixed'
+    'sauvola_window': 25,
+    'sauvola_k': 0.2,
+    'layout': False,              # OCR only detected text blocks instead of the whole page
+}
+
+def otsu_threshold(arr):
+    """Return the Otsu threshold of a uint8 array."""
+    import numpy as np
+    return otsu_threshold_from_histogram(np.bincount(arr.ravel(), minlength=256))
+
+def otsu_threshold_from_histogram(hist):
+    """Otsu threshold from a 256-bin histogram, e.g. PIL's Image.histogram().
+
+    Pixels below the returned value are ink. When several cuts separate the
+    classes equally well, as with every cut between the two levels of a
+    bilevel image, the middle one is used.
+    """
+    import numpy as np
+    hist = np.asarray(hist, dtype=np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    cum_mean = np.cumsum(hist * np.arange(256))
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    best = np.flatnonzero(between >= between.max() * (1 - 1e-9))
+    # Cut t puts levels 0..t in the dark class
+    return int(best[0] + best[-1]) // 2 + 1
+
+def sauvola_binarize(arr, window=25, k=0.2, r=128.0, strip=512):
+    """Adaptive Sauvola binarization using integral images. Returns a bool array, True = ink.
+
+    Works in horizontal strips so the float64 integral images never cover more
+    than strip + window rows, keeping memory proportional to the image width.
+    """
+    import numpy as np
+    half = window // 2
+    padded = np.pad(arr, half + 1, mode='edge')
+    h, w = arr.shape
+    area = float(window * window)
+    ink = np.empty(arr.shape, dtype=bool)
+    for top in range(0, h, strip):
+        rows = min(strip, h - top)
+        block = padded[top:top + rows + window].astype(np.float64)
+        integral = block.cumsum(0).cumsum(1)
+        integral_sq = (block ** 2).cumsum(0).cumsum(1)
+        def window_sum(table):
+            return (table[window:window + rows, window:window + w] - table[:rows, window:window + w]
+                    - table[window:window + rows, :w] + table[:rows, :w])
+        mean = window_sum(integral) / area
+        var = window_sum(integral_sq) / area - mean ** 2
+        std = np.sqrt(np.maximum(var, 0))
+        ink[top:top + rows] = arr[top:top + rows] < mean * (1 + k * (std / r - 1))
+    return ink
+
+def text_bands(ink, strip=512):
+    """Measure the text line bands of a bool ink array: an array of (height, x_height, ink) rows.
+
+    Row profiles are taken per vertical strip, so residual skew and
+    misaligned columns do not smear lines together. A band is a run of rows
+    above the strip's blank-row level (which discounts borders and rules);
+    its x_height is the longest run of rows at half the band's typical row
+    density or more, i.e. the lower-case core between ascenders and
+    descenders. Bands much smaller than the typical one (descender and comma
+    slivers between lines, specks) are dropped.
+    """
+    import numpy as np
+    h, w = ink.shape
+    if not h or not w:
+        return np.zeros((0, 3))
+    profiles = np.add.reduceat(ink, np.arange(0, w, strip), axis=1, dtype=np.int64)
+    bands = []
+    for profile in profiles.T:
+        floor = np.percentile(profile, 10)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], (profile > floor).astype(np.int8), [0]))))
+        for start, end in zip(edges[0::2], edges[1::2]):
+            band = profile[start:end] - floor
+            core = band >= 0.5 * np.percentile(band, 75)
+            core_edges = np.flatnonzero(np.diff(np.concatenate(([0], core.astype(np.int8), [0]))))
+            bands.append((end - start, (core_edges[1::2] - core_edges[0::2]).max(), band.sum()))
+    bands = np.array(bands, dtype=np.float64).reshape(-1, 3)
+    if bands.size:
+        bands = bands[bands[:, 0] >= _weighted_median(bands[:, 0], bands[:, 2]) / 2]
+    return bands
+
+def _weighted_median(values, weights):
+    import numpy as np
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    return float(values[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+def estimate_line_height(ink):
+    """Typical height in px of the text line bands in a bool ink array, or None (see text_bands)."""
+    bands = text_bands(ink)
+    return _weighted_median(bands[:, 0], bands[:, 2]) if bands.size else None
+
+def estimate_x_height(ink):
+    """Typical lower-case x-height in px of the text in a bool ink array, or None (see text_bands)."""
+    bands = text_bands(ink)
+    return _weighted_median(bands[:, 1], bands[:, 2]) if bands.size else None
+
+def estimate_skew(ink, max_skew=5.0, step=0.5):
+    """Angle in degrees that maximises the row-profile variance of ink, i.e. straightens text lines."""
+    import numpy as np
+    # A reduced copy is plenty to find the angle and keeps the search cheap
+    small = Image.fromarray((ink * 255).astype(np.uint8))
+    small.thumbnail((800, 800))
+    best_angle, best_score = 0.0, -1.0
+    # Nearest to level first, so a blank or featureless page is left unrotated
+    for angle in sorted(np.arange(-max_skew, max_skew + step / 2, step), key=abs):
+        rotated = np.asarray(small.rotate(angle, resample=Image.NEAREST, fillcolor=0))
+        score = float(np.var(rotated.sum(axis=1, dtype=np.int64)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+# Large-format scans legitimately exceed PIL's decompression bomb limit. Only
+# files chosen locally (GUI, CLI and their worker processes) get this limit;
+# the HTTP service keeps PIL's default and its own cap, SERVICE_MAX_PIXELS.
+MAX_DECODE_PIXELS = 1_000_000_000
+
+def allow_large_images():
+    """Raise PIL's decompression bomb limit to MAX_DECODE_PIXELS, for trusted local files only."""
+    Image.MAX_IMAGE_PIXELS = MAX_DECODE_PIXELS
+
+def image_dpi(img):
+    dpi = img.info.get('dpi')
+    try:
+        return float(dpi[0]) if dpi else None
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def reducible(img):
+    """img in a mode Image.reduce() accepts; bilevel, palette and 16-bit pages become grayscale."""
+    return img.convert('L') if img.mode in ('1', 'P', 'I;16') else img
+
+def reduce_to_dpi(img, target_dpi):
+    """Integer box-reduce img towards target_dpi when its recorded DPI is much higher."""
+    dpi = image_dpi(img)
+    if not dpi or not target_dpi:
+        return img
+    factor = int(dpi / target_dpi)
+    if factor < 2:
+        return img
+    reduced = reducible(img).reduce(factor)
+    reduced.info['dpi'] = (dpi / factor, dpi / factor)
+    return reduced
+
+def open_for_ocr(source, target_dpi=300):
+    """Open an image decoding as little as possible.
+
+    JPEGs above target_dpi use draft mode, which decodes straight at 1/2, 1/4
+    or 1/8 scale; anything else above it is box-reduced right after decoding.
+    """
+    img = Image.open(source)
+    dpi = image_dpi(img)
+    if img.format == 'JPEG' and dpi and target_dpi and dpi >= target_dpi * 2:
+        full_width = img.width
+        img.draft('L', (int(img.width * target_dpi / dpi), int(img.height * target_dpi / dpi)))
+        achieved = dpi * img.width / full_width
+        img.info['dpi'] = (achieved, achieved)
+    img.load()
+    return reduce_to_dpi(img, target_dpi)
+
+def _compose(outer, inner):
+    """The affine (a, b, c, d, e, f) applying inner, then outer."""
+    a, b, c, d, e, f = outer
+    A, B, C, D, E, F = inner
+    return (a * A + b * D, a * B + b * E, a * C + b * F + c, d * A + e * D, d * B + e * E, d * C + e * F + f)
+
+IDENTITY = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+def preprocess_image(image, params=None, timings=None, geometry=None):
+    """Prepare an image (file path or PIL image) for OCR.
+
+    Stages: decode, grayscale, denoise, deskew, scaling of text whose x-height
+    (see estimate_x_height) is outside min_x_height..max_x_height into that
+    range, and binarization. Per-stage wall times are added to
+    timings when a dict is given. When geometry is a dict, geometry['to_source']
+    is set to the affine (a, b, c, d, e, f) taking a point (x, y) of the result
+    to (a*x + b*y + c, d*x + e*y + f) in the decoded input, see PageLayout.mapped.
+    """
+    import math
+    import numpy as np
+    from PIL import ImageFilter, ImageOps
+    params = {**PREPROCESS_PARAMS, **(params or {})}
+    if isinstance(image, Image.Image):
+        img = image
+    else:
+        with _StageTimer(timings, 'decode'):
+            img = open_for_ocr(image, params['target_dpi'])
+    to_source = IDENTITY
+
+    def resized(img, size, resample):
+        nonlocal to_source
+        to_source = _compose(to_source, (img.width / size[0], 0.0, 0.0, 0.0, img.height / size[1], 0.0))
+        return img.resize(size, resample)
+
+    with _StageTimer(timings, 'grayscale'):
+        img = ImageOps.autocontrast(img.convert('L'))
+        if params['max_pixels'] and img.width * img.height > params['max_pixels']:
+            factor = (img.width * img.height / params['max_pixels']) ** 0.5
+            img = resized(img, (int(img.width / factor), int(img.height / factor)), Image.BOX)
+    if params['denoise']:
+        with _StageTimer(timings, 'denoise'):
+            img = img.filter(ImageFilter.MedianFilter(params['denoise']))
+    if params['deskew']:
+        with _StageTimer(timings, 'deskew'):
+            arr = np.asarray(img)
+            angle = estimate_skew(arr < otsu_threshold(arr), params['max_skew'])
+            if angle:
+                rotated = img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+                # The inverse rotation about the centres, as Image.rotate computes it
+                cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+                to_source = _compose(to_source, (cos, -sin, img.width / 2 - cos * rotated.width / 2 + sin * rotated.height / 2,
+                                                 sin, cos, img.height / 2 - sin * rotated.width / 2 - cos * rotated.height / 2))
+                img = rotated
+    if params['min_x_height'] or params['max_x_height']:
+        # After deskew, so text lines are level when measured
+        with _StageTimer(timings, 'scale'):
+            arr = np.asarray(img)
+            x_height = estimate_x_height(arr < otsu_threshold(arr))
+            if x_height:
+                target = x_height
+                if params['min_x_height']:
+                    target = max(target, params['min_x_height'])
+                if params['max_x_height']:
+                    target = min(target, params['max_x_height'])
+                scale = min(max(target / x_height, 0.5), 3.0)
+                if scale != 1.0:
+                    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+                    img = resized(img, size, Image.LANCZOS if scale > 1 else Image.BOX)
+    if geometry is not None:
+        geometry['to_source'] = to_source
+    with _StageTimer(timings, 'binarize'):
+        arr = np.asarray(img)
+        method = params['binarize']
+        if method == 'sauvola':
+            ink = sauvola_binarize(arr, params['sauvola_window'], params['sauvola_k'])
+        elif method == 'otsu':
+            ink = arr < otsu_threshold(arr)
+        elif method == 'fixed':
+            ink = arr < params['threshold']
+        else:
+            return img
+        img = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
     return img
 
+# --- Document Pages ---
+PDF_RENDER_DPI = 300
+# PDFium is not thread-safe, even across documents: every pypdfium2 call in the
+# process (service workers, concurrent GUI jobs) goes through this lock
+_PDFIUM_LOCK = threading.Lock()
+
+def _pdf_page_count(path):
+    import shutil
+    pdfinfo = shutil.which('pdfinfo')
+    if not pdfinfo:
+        raise Exception("PDF support requires the pypdfium2 package or poppler's pdftoppm/pdfinfo.")
+    output = subprocess.run([pdfinfo, path], capture_output=True, text=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith('Pages:'):
+            return int(line.split(':', 1)[1])
+    raise Exception(f"Could not read page count of {path}")
+
+def iter_pdf_pages(path, dpi=PDF_RENDER_DPI):
+    """Yield (page_number, load) for each page of a PDF, rendered locally on demand."""
+    try:
+        import pypdfium2
+    except ImportError:
+        pypdfium2 = None
+    if pypdfium2:
+        with _PDFIUM_LOCK:
+            pdf = pypdfium2.PdfDocument(path)
+            count = len(pdf)
+        try:
+            for index in range(count):
+                def load(index=index):
+                    with _PDFIUM_LOCK:
+                        page = pdf[index]
+                        try:
+                            bitmap = page.render(scale=dpi / 72, grayscale=True)
+                            # A copy, so the PDFium bitmap is freed here rather than by whichever thread collects it
+                            img = bitmap.to_pil().copy()
+                            bitmap.close()
+                        finally:
+                            page.close()
+                    img.info['dpi'] = (dpi, dpi)
+                    return img
+                yield index + 1, load
+        finally:
+            with _PDFIUM_LOCK:
+                pdf.close()
+        return
+    import shutil
+    pdftoppm = shutil.which('pdftoppm')
+    if not pdftoppm:
+        raise Exception("PDF support requires the pypdfium2 package or poppler's pdftoppm/pdfinfo.")
+    for page_no in range(1, _pdf_page_count(path) + 1):
+        def load(page_no=page_no):
+            # Without an output root pdftoppm writes a single PGM to stdout
+            proc = subprocess.run([pdftoppm, '-f', str(page_no), '-l', str(page_no), '-r', str(dpi), '-gray', path],
+                                  capture_output=True, check=True)
+            img = Image.open(BytesIO(proc.stdout))
+            img.info['dpi'] = (dpi, dpi)
+            return img
+        yield page_no, load
+
+def iter_document_pages(path, dpi=PDF_RENDER_DPI):
+    """Yield (page_number, load) for each page of an image, multi-frame TIFF or PDF.
+
+    load() decodes only that page, reduced towards dpi when the source is
+    finer, so callers hold one page at a time and can skip decoding
+    altogether, e.g. on a cache hit.
+    """
+    if str(path).lower().endswith('.pdf'):
+        yield from iter_pdf_pages(path, dpi)
+        return
+    with Image.open(path) as img:
+        frames = getattr(img, 'n_frames', 1)
+        if frames == 1:
+            yield 1, lambda: open_for_ocr(path, dpi)
+            return
+        for index in range(frames):
+            def load(index=index):
+                img.seek(index)
+                return reduce_to_dpi(img.copy(), dpi)
+            yield index + 1, load
+
+# --- OCR Engine ---
+def raw_gray_buffer(img):
+    """Return (bytes, width, height, stride) of img as 8-bit grayscale, without any encoding."""
+    if img.mode != 'L':
+        img = img.convert('L')
+    return img.tobytes(), img.width, img.height, img.width
+
+class PageLayout:
+    """Word and line geometry of one recognised page, stored column by column.
+
+    Each column is a single NumPy array (int32 boxes as left, top, width,
+    height; float32 confidences; int32 indices), so a page costs a few bytes
+    per word rather than a dict per word. Word texts are kept as one
+    newline-joined string. Words are in reading order and word_line maps each
+    word to its line, line_para each line to its paragraph. Coordinates are
+    pixels of an image of width x height: the recognised image as returned by
+    an engine, and the decoded source page in recognize_document results.
+    """
+    def __init__(self, width, height, words, word_boxes, word_conf, word_line, line_boxes, line_para):
+        self.width = width
+        self.height = height
+        self.words = words
+        self.word_boxes = word_boxes
+        self.word_conf = word_conf
+        self.word_line = word_line
+        self.line_boxes = line_boxes
+        self.line_para = line_para
+
+    @classmethod
+    def from_words(cls, width, height, rows):
+        """Build from (text, left, top, width, height, conf, line_key, para_key) rows in reading order.
+
+        A new line starts whenever line_key changes and a new paragraph whenever
+        para_key does. Line boxes are the union of their word boxes.
+        """
+        import numpy as np
+        words, boxes, conf, word_line, line_para = [], [], [], [], []
+        current_line = current_para = None
+        for text, left, top, w, h, c, line_key, para_key in rows:
+            if line_key != current_line or para_key != current_para:
+                if para_key != current_para:
+                    current_para = para_key
+                    para = (line_para[-1] + 1) if line_para else 0
+                else:
+                    para = line_para[-1]
+                line_para.append(para)
+                current_line = line_key
+            words.append(text)
+            boxes.append((left, top, w, h))
+            conf.append(c)
+            word_line.append(len(line_para) - 1)
+        word_boxes = np.array(boxes, dtype=np.int32).reshape(-1, 4)
+        word_line = np.array(word_line, dtype=np.int32)
+        line_boxes = np.zeros((len(line_para), 4), dtype=np.int32)
+        if len(word_line):
+            right = word_boxes[:, 0] + word_boxes[:, 2]
+            bottom = word_boxes[:, 1] + word_boxes[:, 3]
+            starts = np.flatnonzero(np.r_[True, np.diff(word_line) != 0])
+            line_boxes[:, 0] = np.minimum.reduceat(word_boxes[:, 0], starts)
+            line_boxes[:, 1] = np.minimum.reduceat(word_boxes[:, 1], starts)
+            line_boxes[:, 2] = np.maximum.reduceat(right, starts) - line_boxes[:, 0]
+            line_boxes[:, 3] = np.maximum.reduceat(bottom, starts) - line_boxes[:, 1]
+        return cls(width, height, '\n'.join(words), word_boxes, np.array(conf, dtype=np.float32), word_line,
+                   line_boxes, np.array(line_para, dtype=np.int32))
+
+    @classmethod
+    def empty(cls, width=0, height=0):
+        return cls.from_words(width, height, [])
+
+    def __len__(self):
+        return len(self.word_conf)
+
+    def word_texts(self):
+        return self.words.split('\n') if len(self) else []
+
+    def lines(self):
+        """Yield (line_index, para_index, (left, top, width, height), word_start, word_end)."""
+        import numpy as np
+        ends = np.searchsorted(self.word_line, np.arange(len(self.line_boxes)), side='right')
+        start = 0
+        for index, end in enumerate(ends.tolist()):
+            yield index, int(self.line_para[index]), tuple(self.line_boxes[index].tolist()), start, end
+            start = end
+
+    def line_texts(self):
+        words = self.word_texts()
+        return [' '.join(words[start:end]) for _, _, _, start, end in self.lines()]
+
+    def text(self):
+        """Plain text: words joined by spaces, lines by newlines and paragraphs by a blank line."""
+        out = []
+        previous = None
+        for (_, para, _, _, _), line in zip(self.lines(), self.line_texts()):
+            if previous is not None and para != previous:
+                out.append('')
+            out.append(line)
+            previous = para
+        return '\n'.join(out) + '\n' if out else ''
+
+    def transformed(self, dx=0, dy=0, scale=1.0, width=None, height=None):
+        """Copy with every box scaled by scale and then shifted by (dx, dy)."""
+        import numpy as np
+        def move(boxes):
+            moved = np.rint(boxes * scale).astype(np.int32)
+            moved[:, 0] += dx
+            moved[:, 1] += dy
+            return moved
+        return PageLayout(width if width is not None else self.width, height if height is not None else self.height,
+                          self.words, move(self.word_boxes), self.word_conf.copy(), self.word_line.copy(),
+                          move(self.line_boxes), self.line_para.copy())
+
+    def mapped(self, matrix, width, height):
+        """Copy in the coordinates of another width x height image, given the affine
+        matrix (a, b, c, d, e, f) from this layout's pixels to that image's.
+
+        Each box becomes the bounding box of its mapped corners, clipped to the image.
+        """
+        import numpy as np
+        a, b, c, d, e, f = matrix
+        def move(boxes):
+            boxes = boxes.astype(np.float64)
+            xs = np.stack([boxes[:, 0], boxes[:, 0] + boxes[:, 2]] * 2, axis=1)
+            ys = np.repeat(np.stack([boxes[:, 1], boxes[:, 1] + boxes[:, 3]], axis=1), 2, axis=1)
+            mx, my = a * xs + b * ys + c, d * xs + e * ys + f
+            left = np.clip(np.floor(mx.min(axis=1)), 0, width)
+            top = np.clip(np.floor(my.min(axis=1)), 0, height)
+            right = np.clip(np.ceil(mx.max(axis=1) - 1e-6), 0, width)
+            bottom = np.clip(np.ceil(my.max(axis=1) - 1e-6), 0, height)
+            return np.stack([left, top, right - left, bottom - top], axis=1).astype(np.int32).reshape(-1, 4)
+        return PageLayout(width, height, self.words, move(self.word_boxes), self.word_conf.copy(), self.word_line.copy(),
+                          move(self.line_boxes), self.line_para.copy())
+
+    def without_words(self, drop):
+        """Copy without the words where the bool array drop is set; emptied lines go and line boxes shrink to fit."""
+        if not drop.any():
+            return self
+        rows = zip(self.word_texts(), *self.word_boxes.T.tolist(), self.word_conf.tolist(), self.word_line.tolist(),
+                   self.line_para[self.word_line].tolist())
+        return PageLayout.from_words(self.width, self.height, [row for row, dropped in zip(rows, drop.tolist()) if not dropped])
+
+    @classmethod
+    def concat(cls, parts, width, height):
+        """Join layouts that already share one coordinate space, keeping their order."""
+        import numpy as np
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty(width, height)
+        line_offsets = np.cumsum([0] + [len(part.line_boxes) for part in parts[:-1]])
+        para_offsets = np.cumsum([0] + [int(part.line_para.max()) + 1 for part in parts[:-1]])
+        return cls(width, height, '\n'.join(part.words for part in parts),
+                   np.concatenate([part.word_boxes for part in parts]),
+                   np.concatenate([part.word_conf for part in parts]),
+                   np.concatenate([part.word_line + offset for part, offset in zip(parts, line_offsets)]).astype(np.int32),
+                   np.concatenate([part.line_boxes for part in parts]),
+                   np.concatenate([part.line_para + offset for part, offset in zip(parts, para_offsets)]).astype(np.int32))
+
+    # Column name -> little-endian dtype, for to_dict/from_dict
+    COLUMNS = {'word_boxes': '<i4', 'word_conf': '<f4', 'word_line': '<i4', 'line_boxes': '<i4', 'line_para': '<i4'}
+
+    def to_dict(self):
+        """JSON-serialisable form with each column as base64 of its raw little-endian bytes."""
+        import base64
+        data = {'width': self.width, 'height': self.height, 'words': self.words}
+        for name, dtype in self.COLUMNS.items():
+            data[name] = base64.b64encode(getattr(self, name).astype(dtype).tobytes()).decode('ascii')
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        import base64
+        import numpy as np
+        columns = {name: np.frombuffer(base64.b64decode(data[name]), dtype=dtype).astype(dtype[1:])
+                   for name, dtype in cls.COLUMNS.items()}
+        columns['word_boxes'] = columns['word_boxes'].reshape(-1, 4)
+        columns['line_boxes'] = columns['line_boxes'].reshape(-1, 4)
+        return cls(data['width'], data['height'], data['words'], **columns)
+
+def parse_tesseract_tsv(tsv, width=0, height=0):
+    """Build the PageLayout of a page from Tesseract TSV output.
+
+    Its text() matches Tesseract's own text renderer: words joined by spaces
+    within a line, lines by newlines and paragraphs by a blank line.
+    """
+    def rows():
+        for row in tsv.splitlines()[1:]:
+            cols = row.split('\t')
+            if len(cols) < 12 or cols[0] != '5' or not cols[11].strip():
+                continue
+            yield (cols[11], int(cols[6]), int(cols[7]), int(cols[8]), int(cols[9]), float(cols[10]),
+                   (cols[2], cols[3], cols[4]), (cols[2], cols[3]))
+    return PageLayout.from_words(width, height, rows())
+
+def tesserocr_layout(api, width, height):
+    """Collect the PageLayout from a tesserocr API that has already run Recognize()."""
+    from tesserocr import RIL, iterate_level
+    iterator = api.GetIterator()
+    if iterator is None:
+        return PageLayout.empty(width, height)
+
+    def rows():
+        line = para = 0
+        for word in iterate_level(iterator, RIL.WORD):
+            text = word.GetUTF8Text(RIL.WORD)
+            box = word.BoundingBox(RIL.WORD)
+            if word.IsAtBeginningOf(RIL.PARA):
+                para += 1
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            if not text or not text.strip() or box is None:
+                continue
+            left, top, right, bottom = box
+            yield text, left, top, right - left, bottom - top, word.Confidence(RIL.WORD), line, para
+    return PageLayout.from_words(width, height, rows())
+
+class OCREngine:
+    """Recognises PIL images while keeping language models loaded between calls.
+
+    When the optional tesserocr binding is installed, each language gets one
+    long-lived PyTessBaseAPI that loads its .traineddata once and is handed the
+    raw grayscale buffer in-process. Without it, each call starts a tesseract
+    process and pipes it an uncompressed PGM over stdin, so no PNG is encoded
+    or written to disk either way.
+    """
+    def __init__(self, tesseract_cmd=None, tessdata_dir=None, model='fast'):
+        self.tesseract_cmd = tesseract_cmd
+        # 'fast' uses whatever models Tesseract ships with, 'best' the tessdata_best directory
+        self.model = model
+        if tessdata_dir is None:
+            if model == 'best':
+                tessdata_dir = TESSDATA_BEST_DIR
+            elif os.path.isdir(TESSDATA_DIR):
+                tessdata_dir = TESSDATA_DIR
+        self.tessdata_dir = tessdata_dir
+        # PyTessBaseAPI objects are not thread-safe, so every thread gets its own per language
+        self._local = threading.local()
+        self._all_apis = []
+        self._lock = threading.Lock()
+        try:
+            import tesserocr
+            self._tesserocr = tesserocr
+        except ImportError:
+            self._tesserocr = None
+
+    @property
+    def backend(self):
+        return 'tesserocr' if self._tesserocr else 'tesseract-cli'
+
+    @property
+    def command(self):
+        return self.tesseract_cmd or (_TESSERACT_INFO or {}).get('path') or 'tesseract'
+
+    def _get_api(self, lang_code):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        if lang_code not in apis:
+            kwargs = {'lang': lang_code}
+            if self.tessdata_dir:
+                kwargs['path'] = self.tessdata_dir
+            apis[lang_code] = self._tesserocr.PyTessBaseAPI(**kwargs)
+            with self._lock:
+                self._all_apis.append(apis[lang_code])
+        return apis[lang_code]
+
+    def version(self):
+        """Return the Tesseract version string, used to key cached results."""
+        if not hasattr(self, '_version'):
+            if self._tesserocr:
+                self._version = self._tesserocr.tesseract_version().split()[1]
+            elif _TESSERACT_INFO and _TESSERACT_INFO['path'] == self.command:
+                self._version = _TESSERACT_INFO['version']
+            else:
+                self._version = tesseract_version(self.command)
+        return self._version
+
+    def warm(self, lang_code):
+        """Load the model for lang_code on this thread now instead of on the first image."""
+        if self._tesserocr and lang_code != AUTO_LANG:
+            self._get_api(lang_code)
+
+    def detect_script(self, img):
+        """Run Tesseract orientation and script detection (psm 0) on img.
+
+        Returns {'script', 'script_confidence', 'orientation',
+        'orientation_confidence'}, or None when there is too little text to
+        decide. Needs osd.traineddata.
+        """
+        data, width, height, stride = raw_gray_buffer(img)
+        if self._tesserocr:
+            api = self._get_api('osd')
+            api.SetPageSegMode(self._tesserocr.PSM.OSD_ONLY)
+            api.SetImageBytes(data, width, height, 1, stride)
+            osd = api.DetectOrientationScript()
+            if not osd:
+                return None
+            return {'script': osd['script_name'], 'script_confidence': round(osd['script_conf'], 2),
+                    'orientation': osd['orient_deg'], 'orientation_confidence': round(osd['orient_conf'], 2)}
+        try:
+            output = self._run_cli(data, width, height, ['-l', 'osd', '--psm', '0'])
+        except Exception:
+            return None  # Tesseract exits with an error when there are too few characters
+        fields = dict(line.split(':', 1) for line in output.splitlines() if ':' in line)
+        if 'Script' not in fields:
+            return None
+        return {'script': fields['Script'].strip(), 'script_confidence': float(fields.get('Script confidence', 0)),
+                'orientation': int(fields.get('Orientation in degrees', 0)),
+                'orientation_confidence': float(fields.get('Orientation confidence', 0))}
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        """OCR img in a single engine pass, returning {'text', 'confidence', 'words', 'layout'}.
+
+        layout is the PageLayout (word and line boxes with confidences) as a
+        dict, see PageLayout.to_dict. confidence is the mean word confidence
+        (0-100), or None when no words were found. psm overrides Tesseract's
+        page segmentation mode (default 3).
+        """
+        data, width, height, stride = raw_gray_buffer(img)
+        if self._tesserocr:
+            api = self._get_api(lang_code)
+            api.SetPageSegMode(3 if psm is None else psm)
+            api.SetImageBytes(data, width, height, 1, stride)
+            api.Recognize()
+            text = api.GetUTF8Text()
+            layout = tesserocr_layout(api, width, height)
+        else:
+            args = ['-l', lang_code] + (['--psm', str(psm)] if psm is not None else []) + ['tsv']
+            layout = parse_tesseract_tsv(self._run_cli(data, width, height, args), width, height)
+            text = layout.text()
+        return layout_result(text, layout)
+
+    def _run_cli(self, data, width, height, args):
+        cmd = [self.command, 'stdin', 'stdout'] + args
+        if self.tessdata_dir:
+            cmd += ['--tessdata-dir', self.tessdata_dir]
+        header = f"P5\n{width} {height}\n255\n".encode('ascii')
+        kwargs = {}
+        if os.name == 'nt':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        proc = subprocess.run(cmd, input=header + data, capture_output=True, **kwargs)
+        if proc.returncode != 0:
+            raise Exception(f"Tesseract failed ({proc.returncode}): {proc.stderr.decode('utf-8', 'replace').strip()}")
+        return proc.stdout.decode('utf-8')
+
+    def close(self):
+        with self._lock:
+            for api in self._all_apis:
+                api.End()
+            self._all_apis.clear()
+        self._local = threading.local()
+
+def layout_result(text, layout, **extra):
+    """Result dict for a recognised page, with confidence derived from the layout."""
+    confidences = layout.word_conf[layout.word_conf >= 0]
+    confidence = round(float(confidences.mean()), 2) if len(confidences) else None
+    return {'text': text, 'confidence': confidence, 'words': len(confidences), 'layout': layout.to_dict(), **extra}
+
+ESCALATE_BELOW = 70.0
+MODEL_TIERS = ('fast', 'best', 'tiered')
+
+class TieredEngine:
+    """Recognise with the fast model and re-run only low-confidence results with the best one.
+
+    Anything whose mean word confidence is below threshold is recognised
+    again by the best engine and the more confident of the two results is
+    kept. Layout and tiled recognition call recognize() once per region or
+    tile, so escalation happens at that granularity; otherwise per page.
+    Blank results (no words) are never escalated. If the best engine fails
+    the fast result is kept and counted as a fallback; once a language's best
+    model is known to be missing it is not escalated again. stats() reports
+    calls, time and confidence per tier.
+    """
+    def __init__(self, fast, best, threshold=ESCALATE_BELOW):
+        self.fast = fast
+        self.best = best
+        self.threshold = threshold
+        self.model = f"tiered@{threshold:g}"
+        self._lock = threading.Lock()
+        self._stats = {tier: {'calls': 0, 'seconds': 0.0, 'words': 0, 'confidence_sum': 0.0} for tier in ('fast', 'best')}
+        self._escalated = 0
+        self._improved = 0
+        self._fallbacks = 0
+        self._missing = set()
+
+    @property
+    def backend(self):
+        return self.fast.backend
+
+    @property
+    def tesseract_cmd(self):
+        return self.fast.tesseract_cmd
+
+    @tesseract_cmd.setter
+    def tesseract_cmd(self, value):
+        self.fast.tesseract_cmd = self.best.tesseract_cmd = value
+
+    def version(self):
+        return self.fast.version()
+
+    def warm(self, lang_code):
+        self.fast.warm(lang_code)
+        self.best.warm(lang_code)
+
+    def detect_script(self, img):
+        return self.fast.detect_script(img)
+
+    def _run(self, tier, engine, img, lang_code, psm):
+        start = time.perf_counter()
+        result = engine.recognize(img, lang_code, psm=psm)
+        with self._lock:
+            stats = self._stats[tier]
+            stats['calls'] += 1
+            stats['seconds'] += time.perf_counter() - start
+            if result['confidence'] is not None:
+                stats['words'] += result['words']
+                stats['confidence_sum'] += result['confidence'] * result['words']
+        return result
+
+    def _best_missing(self, lang_code):
+        tessdata = getattr(self.best, 'tessdata_dir', None)
+        return bool(tessdata) and any(not os.path.exists(os.path.join(tessdata, f"{lang}.traineddata"))
+                                      for lang in lang_code.split('+'))
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        result = self._run('fast', self.fast, img, lang_code, psm)
+        if result['confidence'] is None or result['confidence'] >= self.threshold or lang_code in self._missing:
+            return result
+        try:
+            retry = self._run('best', self.best, img, lang_code, psm)
+        except Exception:
+            with self._lock:
+                self._escalated += 1
+                self._fallbacks += 1
+                if self._best_missing(lang_code):
+                    self._missing.add(lang_code)
+            return result
+        improved = retry['confidence'] is not None and retry['confidence'] > result['confidence']
+        with self._lock:
+            self._escalated += 1
+            self._improved += improved
+        return retry if improved else result
+
+    def stats(self):
+        with self._lock:
+            tiers = {tier: {'calls': stats['calls'], 'seconds': round(stats['seconds'], 3),
+                            'mean_confidence': round(stats['confidence_sum'] / stats['words'], 2) if stats['words'] else None}
+                     for tier, stats in self._stats.items()}
+            return {'threshold': self.threshold, 'escalated': self._escalated, 'improved': self._improved,
+                    'fallbacks': self._fallbacks, 'missing_best': sorted(self._missing), **tiers}
+
+def format_tier_stats(stats):
+    """One-line summary of TieredEngine.stats()."""
+    fast, best = stats['fast'], stats['best']
+    share = stats['escalated'] / fast['calls'] if fast['calls'] else 0.0
+    return (f"fast: {fast['calls']} call(s), {fast['seconds']:.2f}s, mean conf {fast['mean_confidence']}; "
+            f"best: {best['calls']} call(s), {best['seconds']:.2f}s, mean conf {best['mean_confidence']}; "
+            f"escalated {stats['escalated']} ({share:.0%}) below {stats['threshold']:g}, {stats['improved']} improved"
+            + (f", {stats['fallbacks']} kept fast after best failed" if stats.get('fallbacks') else '')
+            + (f" (no best model for {', '.join(stats['missing_best'])})" if stats.get('missing_best') else ''))
+
+_ENGINES = {}
+
+def get_engine(tesseract_cmd=None, model='fast'):
+    """Return the process-wide engine for model, creating it on first use.
+
+    model is 'fast', 'best' or 'tiered'; 'tiered@60' sets the escalation
+    threshold (default ESCALATE_BELOW). Being a plain string it can be handed
+    to worker processes as is.
+    """
+    engine = _ENGINES.get(model)
+    if engine is None:
+        if model.startswith('tiered'):
+            threshold = float(model.split('@', 1)[1]) if '@' in model else ESCALATE_BELOW
+            engine = TieredEngine(get_engine(tesseract_cmd, 'fast'), get_engine(tesseract_cmd, 'best'), threshold)
+        else:
+            import atexit
+            engine = OCREngine(tesseract_cmd, model=model)
+            atexit.register(engine.close)
+        _ENGINES[model] = engine
+    elif tesseract_cmd:
+        engine.tesseract_cmd = tesseract_cmd
+    return engine
+
+# --- Script Detection ---
+# Tesseract OSD script name -> model. Latin covers many languages; English is the default for it
+SCRIPT_LANGS = {
+    'Latin': 'eng',
+    'Bengali': 'ben',
+    'Devanagari': 'hin',
+    'Arabic': 'ara',
+    'Han': 'chi_sim',
+    'HanS': 'chi_sim',
+    'HanT': 'chi_tra',
+    'Cyrillic': 'rus',
+    'Greek': 'ell',
+    'Hebrew': 'heb',
+    'Thai': 'tha',
+    'Tamil': 'tam',
+    'Hangul': 'kor',
+    'Japanese': 'jpn',
+    'Katakana': 'jpn',
+    'Hiragana': 'jpn',
+}
+OSD_MAX_PIXELS = 2_000_000
+OSD_MIN_CONFIDENCE = 1.0
+
+def detect_language(engine, img, fallback='eng'):
+    """Pick one model for a page from its script, using OSD on a downscaled copy.
+
+    Returns {'lang', 'script', 'confidence'}. Pages whose script cannot be
+    told with at least OSD_MIN_CONFIDENCE, or has no known model, use
+    fallback rather than a slow combined model such as eng+ben+hin.
+    """
+    factor = int((img.width * img.height / OSD_MAX_PIXELS) ** 0.5 + 0.999)
+    small = reducible(img).reduce(factor) if factor > 1 else img
+    osd = engine.detect_script(small)
+    if not osd or osd['script_confidence'] < OSD_MIN_CONFIDENCE or osd['script'] not in SCRIPT_LANGS:
+        return {'lang': fallback, 'script': osd['script'] if osd else None, 'confidence': osd['script_confidence'] if osd else None}
+    return {'lang': SCRIPT_LANGS[osd['script']], 'script': osd['script'], 'confidence': osd['script_confidence']}
+
+# --- Layout Analysis ---
+LAYOUT_WORKERS = min(4, os.cpu_count() or 1)
+PSM_SINGLE_BLOCK = 6
+PSM_SINGLE_LINE = 7
+
+def _ink_runs(profile, min_gap):
+    """(start, end) runs of non-zero entries in profile, merging gaps shorter than min_gap."""
+    import numpy as np
+    filled = np.flatnonzero(profile)
+    if not filled.size:
+        return []
+    breaks = np.flatnonzero(np.diff(filled) > min_gap)
+    starts = np.concatenate(([filled[0]], filled[breaks + 1]))
+    ends = np.concatenate((filled[breaks], [filled[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def find_text_regions(img, min_gap=None, max_depth=6):
+    """Find text blocks in a binarized image by recursive XY-cut on projection profiles.
+
+    Returns a list of {'box': (left, top, right, bottom), 'lines': n} in
+    reading order (top to bottom, then left to right within a band). Blank
+    areas produce no regions at all.
+    """
+    import numpy as np
+    ink = np.asarray(img.convert('L')) < 128
+    line_height = estimate_line_height(ink) or 20
+    if min_gap is None:
+        min_gap = max(4, int(line_height * 1.5))
+    regions = []
+
+    def cut(top, bottom, left, right, depth, horizontal):
+        block = ink[top:bottom, left:right]
+        profile = block.sum(axis=1 if horizontal else 0)
+        runs = _ink_runs(profile, min_gap)
+        if not runs:
+            return
+        if (len(runs) == 1 and depth > 0) or depth >= max_depth:
+            other = _ink_runs(block.sum(axis=0 if horizontal else 1), min_gap)
+            if len(other) <= 1 or depth >= max_depth:
+                rows = _ink_runs(block.sum(axis=1), 1)
+                cols = _ink_runs(block.sum(axis=0), 1)
+                if rows and cols:
+                    box = (left + cols[0][0], top + rows[0][0], left + cols[-1][1], top + rows[-1][1])
+                    # Descender and punctuation slivers between lines are not lines
+                    band = estimate_line_height(block) or line_height
+                    lines = len([run for run in rows if run[1] - run[0] >= band / 2]) or 1
+                    regions.append({'box': box, 'lines': lines})
+                return
+        for start, end in runs:
+            if horizontal:
+                cut(top + start, top + end, left, right, depth + 1, False)
+            else:
+                cut(top, bottom, left + start, left + end, depth + 1, True)
+
+    cut(0, ink.shape[0], 0, ink.shape[1], 0, True)
+    return regions
+
+_POOLS = {}
+
+def _thread_pool(name):
+    # Long-lived so tesserocr worker threads keep their models loaded between pages.
+    # Tiles and regions get separate pools because a tile job waits on region jobs.
+    if name not in _POOLS:
+        from concurrent.futures import ThreadPoolExecutor
+        _POOLS[name] = ThreadPoolExecutor(max_workers=LAYOUT_WORKERS, thread_name_prefix=f'ocr-{name}')
+    return _POOLS[name]
+
+def recognize_layout(engine, img, lang_code='eng', padding=8):
+    """OCR only the text blocks of a binarized page, concurrently, merged in reading order.
+
+    Single-line blocks use --psm 7 and larger ones --psm 6, which also skips
+    Tesseract's own page layout analysis. Returns the same dict as
+    OCREngine.recognize plus 'regions'.
+    """
+    from PIL import ImageOps
+    regions = find_text_regions(img)
+    if not regions:
+        return layout_result('', PageLayout.empty(img.width, img.height), regions=0)
+
+    def run(region):
+        left, top, right, bottom = region['box']
+        crop = ImageOps.expand(img.crop((left, top, right, bottom)), border=padding, fill=255)
+        psm = PSM_SINGLE_LINE if region['lines'] == 1 else PSM_SINGLE_BLOCK
+        return engine.recognize(crop, lang_code, psm=psm)
+
+    results = list(_thread_pool('region').map(carry_profile(run), regions))
+    texts = [result['text'].strip() for result in results if result['text'].strip()]
+    # Region boxes map back to page coordinates by the crop origin less the padding
+    layout = PageLayout.concat([PageLayout.from_dict(result['layout']).transformed(region['box'][0] - padding, region['box'][1] - padding)
+                                for region, result in zip(regions, results)], img.width, img.height)
+    return layout_result('\n\n'.join(texts) + '\n' if texts else '', layout, regions=len(regions))
+
+# --- Large Image Tiling ---
+def _ink_profiles(gray, threshold, strip=1024):
+    """Row and column ink counts of a grayscale image, computed strip by strip to bound memory."""
+    import numpy as np
+    rows = np.zeros(gray.height, dtype=np.int64)
+    cols = np.zeros(gray.width, dtype=np.int64)
+    for top in range(0, gray.height, strip):
+        ink = np.asarray(gray.crop((0, top, gray.width, min(top + strip, gray.height)))) < threshold
+        rows[top:top + ink.shape[0]] = ink.sum(axis=1)
+        cols += ink.sum(axis=0)
+    return rows, cols
+
+def _tile_cuts(profile, tile_size):
+    """Cut positions along one axis roughly every tile_size px, each placed on the
+    emptiest row/column within a quarter tile of the nominal position.
+
+    Returns (cuts, clean) where clean[i] says whether seam i+1 crosses no ink.
+    """
+    import numpy as np
+    length = len(profile)
+    cuts = [0]
+    window = tile_size // 4
+    while length - cuts[-1] > tile_size:
+        target = cuts[-1] + tile_size
+        lo, hi = target - window, min(length - 1, target + window)
+        cuts.append(lo + int(np.argmin(profile[lo:hi])))
+    cuts.append(length)
+    clean = [profile[cut] == 0 for cut in cuts[1:-1]]
+    return cuts, clean
+
+def _drop_seam_duplicates(first, second, band):
+    """Remove words read twice where two tiles overlap.
+
+    band is the (left, top, right, bottom) overlap of the tiles, in the
+    coordinates of both layouts. A word of first and a word of second that
+    both reach into band and cover at least half of the smaller one's box
+    are the same word; the copy with the smaller box, i.e. the one a tile
+    edge cut through, is dropped, or second's copy on a tie. Works the same
+    for row and column seams. Returns the two filtered layouts.
+    """
+    import numpy as np
+    def in_band(layout):
+        boxes = layout.word_boxes
+        return np.flatnonzero((boxes[:, 0] < band[2]) & (boxes[:, 0] + boxes[:, 2] > band[0])
+                              & (boxes[:, 1] < band[3]) & (boxes[:, 1] + boxes[:, 3] > band[1]))
+    ours, theirs = in_band(first), in_band(second)
+    if not len(ours) or not len(theirs):
+        return first, second
+    a, b = first.word_boxes[ours][:, None, :], second.word_boxes[theirs][None, :, :]
+    width = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    height = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    overlap = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area_a, area_b = a[..., 2] * a[..., 3], b[..., 2] * b[..., 3]
+    same = overlap * 2 >= np.maximum(np.minimum(area_a, area_b), 1)
+    second_larger = area_b > area_a * 1.1
+    drop_first = np.zeros(len(first), dtype=bool)
+    drop_second = np.zeros(len(second), dtype=bool)
+    drop_first[ours[(same & second_larger).any(axis=1)]] = True
+    drop_second[theirs[(same & ~second_larger).any(axis=0)]] = True
+    return first.without_words(drop_first), second.without_words(drop_second)
+
+def recognize_tiled(engine, img, lang_code='eng', params=None):
+    """OCR a very large page as a grid of tiles processed in parallel.
+
+    Seams are placed in blank rows/columns where possible so no text is cut;
+    where a seam has to cross ink, the neighbouring tiles overlap by
+    tile_overlap px and words read by both tiles are kept once when
+    stitching. The whole decoded page stays in memory (plus a grayscale copy
+    unless it is already grayscale); preprocessing and recognition work on
+    one tile at a time per thread, so only their working memory follows the
+    tile size. Deskew is skipped for tiles. The text is rebuilt from the
+    stitched word boxes, tile by tile.
+    """
+    params = {**PREPROCESS_PARAMS, **(params or {})}
+    gray = img if img.mode == 'L' else img.convert('L')
+    if params['max_pixels'] and gray.width * gray.height > params['max_pixels']:
+        factor = (gray.width * gray.height / params['max_pixels']) ** 0.5
+        gray = gray.resize((int(gray.width / factor), int(gray.height / factor)), Image.BOX)
+    # img is the page as decoded; for a bilevel scan this cuts between its two levels
+    threshold = otsu_threshold_from_histogram(gray.histogram())
+    rows, cols = _ink_profiles(gray, threshold)
+    row_cuts, row_clean = _tile_cuts(rows, params['tile_size'])
+    col_cuts, col_clean = _tile_cuts(cols, params['tile_size'])
+    overlap = params['tile_overlap']
+    tile_params = {**params, 'deskew': False}
+
+    def span(cuts, clean, i, limit):
+        start = cuts[i] - (0 if i == 0 or clean[i - 1] else overlap)
+        end = cuts[i + 1] + (0 if i + 1 == len(cuts) - 1 or clean[i] else overlap)
+        return max(0, start), min(limit, end)
+
+    tiles = []
+    for r in range(len(row_cuts) - 1):
+        for c in range(len(col_cuts) - 1):
+            top, bottom = span(row_cuts, row_clean, r, gray.height)
+            left, right = span(col_cuts, col_clean, c, gray.width)
+            tiles.append((r, c, (left, top, right, bottom)))
+
+    def run(tile):
+        r, c, box = tile
+        # A blank tile costs nothing beyond its profile lookup
+        if not rows[box[1]:box[3]].any() or not cols[box[0]:box[2]].any():
+            return {'layout': PageLayout.empty()}
+        geometry = {}
+        prepared = preprocess_image(gray.crop(box), tile_params, geometry=geometry)
+        result = recognize_layout(engine, prepared, lang_code) if params['layout'] else engine.recognize(prepared, lang_code)
+        # Preprocessing may rescale the tile; boxes go back to page coordinates
+        to_page = _compose((scale_x, 0.0, box[0] * scale_x, 0.0, scale_y, box[1] * scale_y), geometry['to_source'])
+        result['layout'] = PageLayout.from_dict(result['layout']).mapped(to_page, img.width, img.height)
+        return result
+
+    scale_x, scale_y = img.width / gray.width, img.height / gray.height
+    layouts = [result['layout'] for result in _thread_pool('tile').map(carry_profile(run), tiles)]
+    # Tiles are in row-major order; each is stitched against the earlier ones it overlaps
+    for i, (_, _, box) in enumerate(tiles):
+        for j in range(i):
+            other = tiles[j][2]
+            band = (max(box[0], other[0]) * scale_x, max(box[1], other[1]) * scale_y,
+                    min(box[2], other[2]) * scale_x, min(box[3], other[3]) * scale_y)
+            if band[0] < band[2] and band[1] < band[3]:
+                layouts[j], layouts[i] = _drop_seam_duplicates(layouts[j], layouts[i], band)
+    texts = [text.strip('\n') for text in (layout.text() for layout in layouts) if text.strip()]
+    return layout_result('\n\n'.join(texts) + '\n' if texts else '', PageLayout.concat(layouts, img.width, img.height),
+                         tiles=len(tiles))
+
+# --- Near-Duplicate Pages ---
+DEDUP_THUMB_WIDTH = 512
+DEDUP_BLOCK = 6
+# At body-text sizes a re-encoded copy (JPEG re-save, format or bit-depth
+# conversion, brightness change) scores below this and a single changed
+# character above it. Rescans and very small print do not separate that
+# cleanly, which is why near-duplicate reuse is opt-in.
+DEDUP_MAX_DIFFERENCE = 0.06
+DEDUP_HASH_RADIUS = 6
+# Grey levels a thumbnail must span to carry a usable fingerprint
+DEDUP_MIN_CONTRAST = 32
+DEDUP_MAX_CANDIDATES = 8
+DEDUP_DEGENERATE_HASH = (1 << 64) - 1
+_DCT_MATRIX = None
+
+def _dct_matrix(n):
+    import numpy as np
+    k = np.arange(n)
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+def page_fingerprint(img):
+    """Return (phash, thumb) for a decoded page image, before preprocessing, or None for a blank page.
+
+    phash is a 64-bit DCT perceptual hash, cheap to compare, used to find
+    candidates; thumb is a contrast-normalised greyscale thumbnail
+    DEDUP_THUMB_WIDTH pixels wide that decides whether a candidate matches.
+    Uniform pages get no fingerprint, since every one of them would match.
+    """
+    import numpy as np
+    global _DCT_MATRIX
+    if _DCT_MATRIX is None:
+        _DCT_MATRIX = _dct_matrix(32)
+    gray = img.convert('L')
+    height = max(DEDUP_BLOCK, round(gray.height * DEDUP_THUMB_WIDTH / gray.width))
+    thumb = np.asarray(gray.resize((DEDUP_THUMB_WIDTH, height), Image.BOX, reducing_gap=2.0), dtype=np.float32)
+    low, high = np.percentile(thumb, (1, 99))
+    if high - low < DEDUP_MIN_CONTRAST:
+        # Under 1% ink (forms, receipts) both percentiles are paper white
+        low, high = float(thumb.min()), float(thumb.max())
+        if high - low < DEDUP_MIN_CONTRAST:
+            return None
+    thumb = np.clip((thumb - low) * (255.0 / (high - low)), 0, 255).astype(np.uint8)
+    small = np.asarray(Image.fromarray(thumb).resize((32, 32), Image.BOX), dtype=np.float32)
+    coeffs = (_DCT_MATRIX @ small @ _DCT_MATRIX.T)[:8, :8].ravel()
+    # The DC term only tracks overall brightness, so it does not set the median
+    bits = coeffs > np.median(coeffs[1:])
+    phash = int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    if phash in (0, DEDUP_DEGENERATE_HASH):
+        return None
+    return phash, thumb
+
+def thumb_difference(a, b, shift=1):
+    """Worst DEDUP_BLOCK-sized block's mean absolute difference (0-1) between two thumbnails.
+
+    The best of all offsets up to shift pixels is taken, so resampling jitter
+    does not count. Taking the worst block rather than the page mean keeps a
+    changed word from being averaged away.
+    """
+    import numpy as np
+    if abs(a.shape[0] - b.shape[0]) > 2 * shift:
+        return 1.0
+    height = min(a.shape[0], b.shape[0])
+    a = a[:height].astype(np.float32) / 255.0
+    b = b[:height].astype(np.float32) / 255.0
+    core = b[shift:height - shift, shift:DEDUP_THUMB_WIDTH - shift]
+    rows = core.shape[0] // DEDUP_BLOCK * DEDUP_BLOCK
+    cols = core.shape[1] // DEDUP_BLOCK * DEDUP_BLOCK
+    best = 1.0
+    for dy in range(-shift, shift + 1):
+        for dx in range(-shift, shift + 1):
+            diff = np.abs(a[shift + dy:height - shift + dy, shift + dx:DEDUP_THUMB_WIDTH - shift + dx] - core)
+            blocks = diff[:rows, :cols].reshape(rows // DEDUP_BLOCK, DEDUP_BLOCK, cols // DEDUP_BLOCK, DEDUP_BLOCK)
+            best = min(best, float(blocks.mean(axis=(1, 3)).max()))
+    return best
+
+class BKTree:
+    """Burkhard-Keller tree of integer hashes under Hamming distance.
+
+    Nodes are (hash, values, children) with children keyed by their distance
+    to the parent. By the triangle inequality a radius query only descends
+    into children whose edge lies within radius of the query's own distance,
+    so lookups touch a small part of a large tree.
+    """
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, item, value):
+        self.size += 1
+        if self.root is None:
+            self.root = (item, [value], {})
+            return
+        node = self.root
+        while True:
+            distance = bin(item ^ node[0]).count('1')
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (item, [value], {})
+                return
+            node = child
+
+    def search(self, item, radius):
+        """Sorted (distance, value) pairs for every stored hash within radius bits of item."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = bin(item ^ node[0]).count('1')
+            if distance <= radius:
+                found.extend((distance, value) for value in node[1])
+            stack.extend(child for edge, child in node[2].items() if distance - radius <= edge <= distance + radius)
+        return sorted(found)
+
+class NearDuplicateIndex:
+    """Finds pages that were already OCR'd under the same settings and look the same as a new one.
+
+    Fingerprints are stored in the OCRCache database next to the results they
+    point at, grouped by a context key (language, parameters and engine).
+    Each process keeps a BKTree per context and pulls in rows added by other
+    processes on every lookup. Up to DEDUP_MAX_CANDIDATES pages within
+    DEDUP_HASH_RADIUS hash bits are checked with thumb_difference and the
+    first one within max_difference is a match.
+    """
+    def __init__(self, cache, max_difference=DEDUP_MAX_DIFFERENCE):
+        self.cache = cache
+        self.max_difference = max_difference
+        self._trees = {}
+        self._loaded = 0
+        self._lock = threading.Lock()
+
+    def find(self, context, fingerprint):
+        """Return the cache key of a matching page's result, or None."""
+        import zlib
+        import numpy as np
+        phash, thumb = fingerprint
+        if phash in (0, DEDUP_DEGENERATE_HASH):
+            return None
+        with self._lock:
+            for row_id, row_context, row_hash in self.cache.page_hashes_since(self._loaded):
+                self._trees.setdefault(row_context, BKTree()).add(int(row_hash, 16), row_id)
+                self._loaded = row_id
+            tree = self._trees.get(context)
+            candidates = tree.search(phash, DEDUP_HASH_RADIUS) if tree else []
+        for _, row_id in candidates[:DEDUP_MAX_CANDIDATES]:
+            row = self.cache.page_hash(row_id)
+            if row is None:
+                continue
+            stored = np.frombuffer(zlib.decompress(row[1]), dtype=np.uint8).reshape(-1, DEDUP_THUMB_WIDTH)
+            if thumb_difference(thumb, stored) <= self.max_difference:
+                return row[0]
+        return None
+
+    def add(self, context, fingerprint, key):
+        import zlib
+        phash, thumb = fingerprint
+        if phash in (0, DEDUP_DEGENERATE_HASH):
+            return
+        self.cache.put_page_hash(context, f"{phash:016x}", zlib.compress(thumb.tobytes(), 6), key)
+
+_DEDUP = None
+
+def get_dedup_index(cache, max_difference=DEDUP_MAX_DIFFERENCE):
+    """Return the process-wide NearDuplicateIndex over cache, creating it on first use."""
+    global _DEDUP
+    if _DEDUP is None:
+        _DEDUP = NearDuplicateIndex(cache, max_difference)
+    return _DEDUP
+
+# --- OCR Result Cache ---
+OCR_CACHE_FILE = Path(".ocr_cache.db")
+PROFILE_FILE = "ocr_profile.prof"
+OCR_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Bump when the shape of cached result dicts changes, so old entries miss
+RESULT_FORMAT = 3
+
+def hash_file(path, chunk_size=1024 * 1024):
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class OCRCache:
+    """Content-addressed, size-bounded LRU store of OCR results backed by SQLite.
+
+    Keys combine the image bytes hash, language, preprocessing parameters and
+    Tesseract version, so a change to any of them naturally misses. Values are
+    JSON-serialisable result dicts. Once the stored results exceed max_bytes the
+    least recently used entries are evicted.
+    """
+    def __init__(self, path=OCR_CACHE_FILE, max_bytes=OCR_CACHE_MAX_BYTES):
+        import sqlite3
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS ocr_results (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ocr_results_lru ON ocr_results (last_access)")
+        # Page fingerprints for NearDuplicateIndex, each pointing at an ocr_results key
+        self._db.execute("CREATE TABLE IF NOT EXISTS page_hashes (id INTEGER PRIMARY KEY, context TEXT NOT NULL, phash TEXT NOT NULL, thumb BLOB NOT NULL, key TEXT NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS page_hashes_key ON page_hashes (key)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(image_hash, lang_code, params, engine_version):
+        import hashlib
+        material = json.dumps([RESULT_FORMAT, image_hash, lang_code, params, engine_version], sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE ocr_results SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ocr_results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                             (key, data, len(data), time.time()))
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM ocr_results ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM ocr_results WHERE key = ?", stale)
+        self._db.executemany("DELETE FROM page_hashes WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    def put_page_hash(self, context, phash, thumb, key):
+        with self._lock:
+            self._db.execute("INSERT INTO page_hashes (context, phash, thumb, key) VALUES (?, ?, ?, ?)", (context, phash, thumb, key))
+            # Charged to the result it points at, so fingerprints count towards max_bytes and go with it
+            self._db.execute("UPDATE ocr_results SET size = size + ? WHERE key = ?", (len(thumb), key))
+            self._evict()
+            self._db.commit()
+
+    def page_hashes_since(self, row_id):
+        """(id, context, phash) of fingerprints stored after row_id, by this or any other process."""
+        with self._lock:
+            return self._db.execute("SELECT id, context, phash FROM page_hashes WHERE id > ? ORDER BY id", (row_id,)).fetchall()
+
+    def page_hash(self, row_id):
+        """(key, thumb) of one stored fingerprint, or None once its result has been evicted."""
+        with self._lock:
+            return self._db.execute("SELECT key, thumb FROM page_hashes WHERE id = ?", (row_id,)).fetchone()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_results").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_CACHE = None
+
+def get_cache(path=OCR_CACHE_FILE):
+    """Return the process-wide OCRCache, creating it on first use."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = OCRCache(path)
+    return _CACHE
+
+def recognize_document(path, lang_code='eng', engine=None, cache=None, params=None, timings=None, prefetch=2,
+                       with_images=False, dedup=None):
+    """Yield a result dict per page of path, in order.
+
+    Each dict has 'page', 'lang', 'text', 'confidence', 'words', 'layout' and
+    'cached'. With lang_code=AUTO_LANG each page's model is chosen by
+    detect_language (its decision is added as 'script'); decisions are
+    cached per document, so a repeat run goes straight to the result cache.
+    Layout coordinates are pixels of the page as decoded (reduced towards
+    target_dpi), whatever preprocessing or tiling did to it. With with_images
+    that decoded page is added as 'image'; cached pages are then decoded too,
+    but neither preprocessed nor OCR'd.
+
+    dedup, a NearDuplicateIndex over cache, is consulted for pages the cache
+    misses: a page matching one OCR'd before reuses its result without being
+    preprocessed or OCR'd, and is marked 'duplicate' (and 'cached').
+
+    A background thread decodes and preprocesses up to prefetch pages ahead of
+    the engine, so decoding overlaps recognition while memory stays bounded to
+    a few pages regardless of document length. Cached pages are never decoded.
+    """
+    import queue
+    engine = engine or get_engine()
+    params = {**PREPROCESS_PARAMS, **(params or {})}
+    auto = lang_code == AUTO_LANG
+    decisions = {}
+    if cache is None:
+        dedup = None
+    else:
+        file_hash = hash_file(path)
+        # Results from different model sets must not share cache entries
+        version = f"{engine.version()} {engine.model}"
+        if auto:
+            decisions_key = OCRCache.make_key(f"{file_hash}#osd", AUTO_LANG, params, version)
+            decisions = (cache.get(decisions_key) or {}).get('pages', {})
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decode(load):
+        with _StageTimer(timings, 'decode'):
+            return load()
+
+    def prepare(img):
+        """Return (image, to_source, size). Tiling is decided here, on the decoded
+        size: oversized pages are left as decoded, to be preprocessed tile by tile,
+        and get no to_source since tiled results are already in page coordinates."""
+        if img.width * img.height > params['tile_pixels']:
+            return img, None, img.size
+        geometry = {}
+        return preprocess_image(img, params, timings, geometry), geometry['to_source'], img.size
+
+    def producer():
+        detected = False
+        try:
+            for page_no, load in iter_document_pages(path, params['target_dpi']):
+                key = result = raw = prepared = source = decision = fingerprint = None
+                page_lang = lang_code
+                if auto:
+                    decision = decisions.get(str(page_no))
+                    if decision is None:
+                        raw = decode(load)
+                        prepared = prepare(raw)
+                        with _StageTimer(timings, 'detect'):
+                            decision = decisions[str(page_no)] = detect_language(engine, prepared[0])
+                        detected = True
+                    page_lang = decision['lang']
+                if cache is not None:
+                    key = OCRCache.make_key(f"{file_hash}#{page_no}", page_lang, params, version)
+                    result = cache.get(key)
+                duplicate = False
+                if result is None and dedup is not None:
+                    if raw is None:
+                        raw = decode(load)
+                    with _StageTimer(timings, 'dedup'):
+                        fingerprint = page_fingerprint(raw)
+                        match = None
+                        if fingerprint is not None:
+                            match = dedup.find(OCRCache.make_key('#near-duplicate', page_lang, params, version), fingerprint)
+                    if match is not None:
+                        result = cache.get(match)
+                        duplicate = result is not None
+                if result is None and prepared is None:
+                    raw = raw if raw is not None else decode(load)
+                    prepared = prepare(raw)
+                if with_images:
+                    source = raw if raw is not None else decode(load)
+                raw = None
+                if not put((page_no, page_lang, decision, key, result, prepared, source, fingerprint, duplicate)):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            if detected and cache is not None:
+                cache.put(decisions_key, {'pages': decisions})
+
+    def start_producer(run=carry_profile(producer)):
+        try:
+            run()
+        except Exception as e:
+            # Failing before producer's own handler must still wake the consumer
+            put(e)
+
+    threading.Thread(target=start_producer, daemon=True).start()
+    seen_langs = set()
+    try:
+        while True:
+            item = pages.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            page_no, page_lang, decision, key, result, prepared, source, fingerprint, duplicate = item
+            if result is None and fingerprint is not None:
+                # The match may be a page that was still being OCR'd when this one was prefetched
+                with _StageTimer(timings, 'dedup'):
+                    match = dedup.find(OCRCache.make_key('#near-duplicate', page_lang, params, version), fingerprint)
+                result = cache.get(match) if match is not None else None
+                duplicate = result is not None
+            cache_hit = result is not None
+            if not cache_hit:
+                if auto and page_lang not in seen_langs:
+                    ensure_model_langdata(page_lang, engine.model)
+                    seen_langs.add(page_lang)
+                img, to_source, size = prepared
+                with _StageTimer(timings, 'ocr'):
+                    if to_source is None:
+                        result = recognize_tiled(engine, img, page_lang, params)
+                    elif params['layout']:
+                        result = recognize_layout(engine, img, page_lang)
+                    else:
+                        result = engine.recognize(img, page_lang)
+                if to_source is not None:
+                    result['layout'] = PageLayout.from_dict(result['layout']).mapped(to_source, *size).to_dict()
+                img = prepared = None
+            if cache is not None and (not cache_hit or duplicate):
+                cache.put(key, result)
+            if fingerprint is not None and not duplicate:
+                dedup.add(OCRCache.make_key('#near-duplicate', page_lang, params, version), fingerprint, key)
+            page = {'page': page_no, 'lang': page_lang, **result, 'cached': cache_hit}
+            if duplicate:
+                page['duplicate'] = True
+            if decision is not None:
+                page['script'] = decision
+            if with_images:
+                page['image'] = source
+            yield page
+    finally:
+        stop.set()
+
+def mean_confidence(pages):
+    """Mean of the per-page confidences that are known, or None."""
+    known = [page['confidence'] for page in pages if page.get('confidence') is not None]
+    return round(sum(known) / len(known), 2) if known else None
+
+# --- Export Formats ---
+EXPORT_FORMATS = {'hocr': '.hocr', 'alto': '.xml', 'pdf': '.pdf'}
+
+def _box_corners(box):
+    left, top, width, height = box
+    return left, top, left + width, top + height
+
+class HOCRWriter:
+    """Streams recognised pages to an hOCR 1.2 document on a text file object."""
+    def __init__(self, out, title=''):
+        from html import escape
+        self.out = out
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+                  '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\n<head>\n'
+                  f'<title>{escape(title)}</title>\n<meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>\n'
+                  '<meta name="ocr-system" content="ANSNEW TECH Image2Text"/>\n'
+                  '<meta name="ocr-capabilities" content="ocr_page ocr_par ocr_line ocrx_word ocrp_wconf"/>\n'
+                  '</head>\n<body>\n')
+
+    def add_page(self, page):
+        from html import escape
+        layout = PageLayout.from_dict(page['layout'])
+        n = page['page']
+        words = layout.word_texts()
+        self.out.write(f"<div class='ocr_page' id='page_{n}' title='bbox 0 0 {layout.width} {layout.height}; ppageno {n - 1}'>\n")
+        open_para = None
+        for line, para, box, start, end in layout.lines():
+            if para != open_para:
+                if open_para is not None:
+                    self.out.write("</p>\n")
+                para_boxes = layout.line_boxes[layout.line_para == para]
+                bbox = (int(para_boxes[:, 0].min()), int(para_boxes[:, 1].min()),
+                        int((para_boxes[:, 0] + para_boxes[:, 2]).max()), int((para_boxes[:, 1] + para_boxes[:, 3]).max()))
+                self.out.write(f"<p class='ocr_par' id='par_{n}_{para + 1}' title='bbox {' '.join(map(str, bbox))}'>\n")
+                open_para = para
+            self.out.write(f"<span class='ocr_line' id='line_{n}_{line + 1}' title='bbox {' '.join(map(str, _box_corners(box)))}'>")
+            for index in range(start, end):
+                corners = ' '.join(map(str, _box_corners(layout.word_boxes[index].tolist())))
+                self.out.write(f"<span class='ocrx_word' id='word_{n}_{index + 1}' title='bbox {corners}; "
+                               f"x_wconf {int(round(float(layout.word_conf[index])))}'>{escape(words[index])}</span> ")
+            self.out.write("</span>\n")
+        if open_para is not None:
+            self.out.write("</p>\n")
+        self.out.write("</div>\n")
+
+    def close(self):
+        self.out.write("</body>\n</html>\n")
+
+class ALTOWriter:
+    """Streams recognised pages to an ALTO v4 XML document on a text file object."""
+    def __init__(self, out, title=''):
+        from xml.sax.saxutils import quoteattr
+        self.out = out
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                  '<alto xmlns="http://www.loc.gov/standards/alto/ns-v4#" '
+                  'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                  'xsi:schemaLocation="http://www.loc.gov/standards/alto/ns-v4# http://www.loc.gov/alto/v4/alto-4-2.xsd">\n'
+                  '<Description>\n<MeasurementUnit>pixel</MeasurementUnit>\n'
+                  f'<sourceImageInformation><fileName>{quoteattr(title)[1:-1]}</fileName></sourceImageInformation>\n'
+                  '</Description>\n<Layout>\n')
+
+    def add_page(self, page):
+        from xml.sax.saxutils import quoteattr
+        layout = PageLayout.from_dict(page['layout'])
+        n = page['page']
+        words = layout.word_texts()
+        position = lambda box: 'HPOS="{}" VPOS="{}" WIDTH="{}" HEIGHT="{}"'.format(*box)
+        self.out.write(f'<Page ID="page_{n}" PHYSICAL_IMG_NR="{n}" WIDTH="{layout.width}" HEIGHT="{layout.height}">\n'
+                       f'<PrintSpace {position((0, 0, layout.width, layout.height))}>\n')
+        open_para = None
+        for line, para, box, start, end in layout.lines():
+            if para != open_para:
+                if open_para is not None:
+                    self.out.write('</TextBlock>\n')
+                para_boxes = layout.line_boxes[layout.line_para == para]
+                left, top = int(para_boxes[:, 0].min()), int(para_boxes[:, 1].min())
+                block = (left, top, int((para_boxes[:, 0] + para_boxes[:, 2]).max()) - left,
+                         int((para_boxes[:, 1] + para_boxes[:, 3]).max()) - top)
+                self.out.write(f'<TextBlock ID="block_{n}_{para + 1}" {position(block)}>\n')
+                open_para = para
+            self.out.write(f'<TextLine ID="line_{n}_{line + 1}" {position(box)}>\n')
+            for index in range(start, end):
+                if index > start:
+                    self.out.write('<SP/>\n')
+                self.out.write(f'<String ID="word_{n}_{index + 1}" CONTENT={quoteattr(words[index])} '
+                               f'{position(layout.word_boxes[index].tolist())} WC="{float(layout.word_conf[index]) / 100:.2f}"/>\n')
+            self.out.write('</TextLine>\n')
+        if open_para is not None:
+            self.out.write('</TextBlock>\n')
+        self.out.write('</PrintSpace>\n</Page>\n')
+
+    def close(self):
+        self.out.write('</Layout>\n</alto>\n')
+
+class SearchablePDFWriter:
+    """Streams pages to a PDF of the page images with an invisible, selectable text layer.
+
+    Objects are written as pages arrive, so only one page is held in memory.
+    Each page is the image as decoded (not the binarized one OCR saw), sized
+    by its own DPI, or dpi when it records none. Text uses a glyph-less
+    Identity-H font with a ToUnicode map, which works for any script in the
+    Basic Multilingual Plane; each word is stretched to its box.
+    """
+    def __init__(self, out, title='', dpi=PREPROCESS_PARAMS['target_dpi']):
+        self.out = out
+        self.dpi = dpi
+        self.offsets = {}
+        self.pages = []
+        self.position = 0
+        self._next = 7
+        self._write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+        self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        self._object(3, b'<< /Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont /Encoding /Identity-H '
+                        b'/DescendantFonts [4 0 R] /ToUnicode 6 0 R >>')
+        self._object(4, b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont '
+                        b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+                        b'/FontDescriptor 5 0 R /DW 500 /CIDToGIDMap /Identity >>')
+        self._object(5, b'<< /Type /FontDescriptor /FontName /GlyphLessFont /Flags 5 /FontBBox [0 0 500 1000] '
+                        b'/ItalicAngle 0 /Ascent 1000 /Descent 0 /CapHeight 1000 /StemV 80 >>')
+        # Character codes are UTF-16 code units, so ToUnicode is the identity
+        ranges = ''.join(f'<{high:02X}00> <{high:02X}FF> <{high:02X}00>\n' for high in range(256))
+        cmap = ('/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+                '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+                '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+                '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+                f'256 beginbfrange\n{ranges}endbfrange\nendcmap\n'
+                'CMapName currentdict /CMap defineresource pop\nend\nend\n').encode('ascii')
+        self._stream(6, b'', cmap)
+
+    def _write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def _allocate(self):
+        self._next += 1
+        return self._next - 1
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        self._write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def _stream(self, number, entries, data, compress=True):
+        import zlib
+        if compress:
+            data = zlib.compress(data)
+            entries += b' /Filter /FlateDecode'
+        self._object(number, b'<< %s /Length %d >>\nstream\n' % (entries, len(data)) + data + b'\nendstream')
+
+    def _image(self, img):
+        if img.mode not in ('1', 'L', 'LA', 'I', 'I;16', 'F'):
+            img, space = img.convert('RGB'), b'/DeviceRGB'
+            data, bits = img.tobytes(), 8
+        else:
+            img, space = img if img.mode == '1' else img.convert('L'), b'/DeviceGray'
+            # Bilevel pages are stored at one bit per pixel
+            if img.mode == '1' or sum(img.histogram()[1:255]) == 0:
+                data, bits = img.convert('1', dither=Image.NONE).tobytes(), 1
+            else:
+                data, bits = img.tobytes(), 8
+        number = self._allocate()
+        self._stream(number, b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent %d'
+                     % (img.width, img.height, space, bits), data)
+        return number
+
+    def add_page(self, page):
+        layout = PageLayout.from_dict(page['layout'])
+        img = page['image']
+        dpi = image_dpi(img) or self.dpi
+        scale = 72.0 / dpi * img.width / layout.width if layout.width else 72.0 / dpi
+        width, height = img.width * 72.0 / dpi, img.height * 72.0 / dpi
+        content = [b'q %.3f 0 0 %.3f 0 0 cm /Im1 Do Q' % (width, height), b'BT 3 Tr']
+        for word, box in zip(layout.word_texts(), layout.word_boxes.tolist()):
+            text = ''.join(ch if ord(ch) <= 0xFFFF else '\ufffd' for ch in word)
+            if not text or box[2] <= 0 or box[3] <= 0:
+                continue
+            size = box[3] * scale
+            stretch = 100.0 * box[2] * scale / (len(text) * size * 0.5)
+            x, y = box[0] * scale, height - (box[1] + box[3]) * scale
+            content.append(b'/F1 %.2f Tf %.2f Tz 1 0 0 1 %.2f %.2f Tm <%s> Tj' % (size, stretch, x, y, text.encode('utf-16-be').hex().encode('ascii')))
+        content.append(b'ET')
+        image = self._image(img)
+        contents = self._allocate()
+        self._stream(contents, b'', b'\n'.join(content))
+        number = self._allocate()
+        self._object(number, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.3f %.3f] /Contents %d 0 R '
+                     b'/Resources << /Font << /F1 3 0 R >> /XObject << /Im1 %d 0 R >> >> >>' % (width, height, contents, image))
+        self.pages.append(number)
+
+    def close(self):
+        kids = b' '.join(b'%d 0 R' % number for number in self.pages)
+        self._object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        xref = self.position
+        count = max(self.offsets) + 1
+        entries = [b'0000000000 65535 f \n'] + [b'%010d 00000 n \n' % self.offsets[n] if n in self.offsets else b'0000000000 65535 f \n'
+                                                 for n in range(1, count)]
+        self._write(b'xref\n0 %d\n' % count + b''.join(entries) +
+                    b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (count, xref))
+
+EXPORT_WRITERS = {'hocr': HOCRWriter, 'alto': ALTOWriter, 'pdf': SearchablePDFWriter}
+
+def export_document(path, out, fmt, lang_code='eng', engine=None, cache=None, params=None, timings=None, page_callback=None,
+                    dedup=None):
+    """OCR path and write it to the open file object out as hOCR, ALTO or a searchable PDF.
+
+    out must be binary for 'pdf' and text otherwise. Uses one engine pass per
+    page, or none for cached pages. Returns the number of pages written.
+    """
+    writer = EXPORT_WRITERS[fmt](out, os.path.basename(path))
+    pages = 0
+    for page in recognize_document(path, lang_code, engine=engine, cache=cache, params=params, timings=timings,
+                                   with_images=fmt == 'pdf', dedup=dedup):
+        writer.add_page(page)
+        pages += 1
+        if page_callback:
+            page_callback(page)
+    writer.close()
+    return pages
+
+# --- Search Index ---
+SEARCH_INDEX_FILE = Path(".ocr_index.db")
+SEARCH_BATCH_SIZE = 50
+SEARCH_SNIPPET_TOKENS = 12
+
+def fts_literal(query):
+    """Quote every word of query so FTS5 matches them literally, ignoring its operators."""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+class SearchIndex:
+    """Full-text index of OCR output in SQLite FTS5.
+
+    The pages table holds one row per page (path, page number, language) and
+    the FTS5 table page_text its text under the same rowid; documents records
+    each path's file hash, text hash, mtime, size and when it was indexed.
+    add_document only queues a document, and queued documents are written in
+    one transaction once batch_size are waiting or on flush(), so a large
+    batch costs a handful of commits. A document whose file and text are
+    unchanged is skipped; a changed one has its pages replaced.
+    """
+    def __init__(self, path=SEARCH_INDEX_FILE, batch_size=SEARCH_BATCH_SIZE):
+        import sqlite3
+        self.path = str(path)
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        try:
+            # Combining marks count as letters, so Bengali or Devanagari vowel signs do not split words
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(text, "
+                             "tokenize=\"unicode61 remove_diacritics 2 categories 'L* N* Co M*'\")")
+        except sqlite3.OperationalError:
+            try:
+                # SQLite before 3.37 has no categories option
+                self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(text, tokenize='unicode61 remove_diacritics 2')")
+            except sqlite3.OperationalError as e:
+                self._db.close()
+                raise Exception(f"The search index needs SQLite with FTS5: {e}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS pages (id INTEGER PRIMARY KEY, path TEXT NOT NULL, page INTEGER NOT NULL, lang TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS pages_path ON pages (path)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, hash TEXT NOT NULL, text_hash TEXT NOT NULL, "
+                         "mtime REAL, size INTEGER, pages INTEGER NOT NULL, indexed REAL NOT NULL)")
+        self._db.commit()
+        self._versions = {row[0]: row[1:] for row in self._db.execute("SELECT path, hash, text_hash FROM documents")}
+
+    def add_document(self, path, pages, file_hash=None):
+        """Queue path's pages, (page, lang, text) tuples, for indexing.
+
+        Returns False when the document is already indexed with the same file
+        and text.
+        """
+        import hashlib
+        path = os.path.abspath(path)
+        pages = list(pages)
+        try:
+            st = os.stat(path)
+            mtime, size = st.st_mtime, st.st_size
+        except OSError:
+            mtime = size = None
+        file_hash = file_hash or hash_file(path)
+        text_hash = hashlib.sha256('\f'.join(text for _, _, text in pages).encode('utf-8')).hexdigest()
+        with self._lock:
+            if path not in self._pending and self._versions.get(path) == (file_hash, text_hash):
+                return False
+            self._pending[path] = (file_hash, text_hash, mtime, size, pages)
+            if len(self._pending) >= self.batch_size:
+                self._write()
+        return True
+
+    def _write(self):
+        now = time.time()
+        with self._db:
+            for path, (file_hash, text_hash, mtime, size, pages) in self._pending.items():
+                stale = self._db.execute("SELECT id FROM pages WHERE path = ?", (path,)).fetchall()
+                self._db.executemany("DELETE FROM page_text WHERE rowid = ?", stale)
+                self._db.execute("DELETE FROM pages WHERE path = ?", (path,))
+                for page, lang, text in pages:
+                    row_id = self._db.execute("INSERT INTO pages (path, page, lang) VALUES (?, ?, ?)", (path, page, lang)).lastrowid
+                    self._db.execute("INSERT INTO page_text (rowid, text) VALUES (?, ?)", (row_id, text))
+                self._db.execute("INSERT OR REPLACE INTO documents (path, hash, text_hash, mtime, size, pages, indexed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (path, file_hash, text_hash, mtime, size, len(pages), now))
+                self._versions[path] = (file_hash, text_hash)
+        self._pending.clear()
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._write()
+
+    def search(self, query, limit=20, markers=('[', ']')):
+        """Best matches for query, most relevant first.
+
+        query uses FTS5 syntax ("exact phrase", OR, NOT, prefix*); if it does
+        not parse its words are searched for literally. Each match is a dict
+        with 'path', 'page', 'lang', 'indexed', 'score' and a 'snippet' with
+        the matched terms wrapped in markers.
+        """
+        import sqlite3
+        if not query.strip():
+            return []
+        self.flush()
+        sql = ("SELECT pages.path, pages.page, pages.lang, documents.indexed, snippet(page_text, 0, ?, ?, ' ... ', ?), bm25(page_text) "
+               "FROM page_text JOIN pages ON pages.id = page_text.rowid LEFT JOIN documents ON documents.path = pages.path "
+               "WHERE page_text MATCH ? ORDER BY bm25(page_text) LIMIT ?")
+        with self._lock:
+            try:
+                rows = self._db.execute(sql, (*markers, SEARCH_SNIPPET_TOKENS, query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                rows = self._db.execute(sql, (*markers, SEARCH_SNIPPET_TOKENS, fts_literal(query), limit)).fetchall()
+        return [{'path': path, 'page': page, 'lang': lang, 'indexed': indexed, 'snippet': ' '.join(snippet.split()),
+                 'score': round(-score, 3)} for path, page, lang, indexed, snippet, score in rows]
+
+    def stats(self):
+        self.flush()
+        with self._lock:
+            documents, pages = self._db.execute("SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM documents").fetchone()
+        return {'documents': documents, 'pages': pages}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+_SEARCH_INDEX = None
+
+def get_search_index(path=SEARCH_INDEX_FILE):
+    """Return the process-wide SearchIndex, creating it on first use."""
+    global _SEARCH_INDEX
+    if _SEARCH_INDEX is None:
+        _SEARCH_INDEX = SearchIndex(path)
+    return _SEARCH_INDEX
+
+def index_result(index, result):
+    """Queue a successful ocr_image_file record in index; returns whether it was new or changed."""
+    texts = result['text'].split('\f')
+    langs = result.get('page_langs') or [result['lang']] * len(texts)
+    return index.add_document(result['path'], zip(range(1, len(texts) + 1), langs, texts), result.get('hash'))
+
+# --- Headless Batch OCR ---
+INPUT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.pdf')
+
+def iter_image_paths(target):
+    """Yield image and PDF files from a directory (recursively), a glob pattern or a single file."""
+    if os.path.isdir(target):
+        for root, dirs, files in os.walk(target):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(INPUT_EXTENSIONS):
+                    yield os.path.join(root, name)
+    elif os.path.isfile(target):
+        yield target
+    else:
+        import glob
+        for path in sorted(glob.iglob(target, recursive=True)):
+            if os.path.isfile(path) and path.lower().endswith(INPUT_EXTENSIONS):
+                yield path
+
+def _init_batch_worker(tesseract_cmd, lang_code, cache_path, model='fast', dedup=None):
+    allow_large_images()
+    # Spawned workers do not inherit discovery results; the info file makes this cheap
+    if tesseract_cmd and _TESSERACT_INFO is None:
+        try:
+            use_tesseract_info(load_tesseract_info(tesseract_cmd))
+        except Exception:
+            pass
+    # Each worker process keeps its own engine, so models are loaded once per worker
+    get_engine(tesseract_cmd, model).warm(lang_code)
+    if cache_path:
+        get_cache(cache_path)
+        if dedup is not None:
+            get_dedup_index(_CACHE, dedup)
+
+def ocr_image_file(image_path, lang_code='eng', params=None, profile_dir=None, model='fast'):
+    """OCR a single image or document and return a JSON-serialisable result record.
+
+    Pages of multi-page documents are separated by form feeds in 'text',
+    'layouts' holds each page's PageLayout dict (word/line boxes and
+    confidences) and 'page_langs' the model used for each page. When profile_dir is set a cProfile dump of the job is
+    written there. With a tiered model, 'tiers' holds this job's share of the
+    TieredEngine statistics. 'duplicates' counts pages whose result was reused
+    from a near-identical page, when the worker has a NearDuplicateIndex.
+    """
+    engine = get_engine(model=model)
+    before = engine.stats() if isinstance(engine, TieredEngine) else None
+    metrics = JobMetrics(image_path, profile=bool(profile_dir))
+    result = {'path': image_path, 'lang': lang_code, 'text': '', 'pages': 0, 'error': None, 'cached': False, 'duplicates': 0}
+    try:
+        pages = list(recognize_document(image_path, lang_code, engine=engine, cache=_CACHE, params=params, timings=metrics.timings,
+                                        dedup=_DEDUP))
+        result['text'] = '\f'.join(page['text'] for page in pages)
+        result['layouts'] = [page['layout'] for page in pages]
+        result['page_langs'] = [page['lang'] for page in pages]
+        result['pages'] = len(pages)
+        result['confidence'] = mean_confidence(pages)
+        result['cached'] = bool(pages) and all(page['cached'] for page in pages)
+        result['duplicates'] = sum(1 for page in pages if page.get('duplicate'))
+    except Exception as e:
+        result['error'] = str(e)
+    profile_path = None
+    if profile_dir:
+        import hashlib
+        name = os.path.basename(image_path) + '-' + hashlib.sha1(image_path.encode('utf-8')).hexdigest()[:8]
+        profile_path = os.path.join(profile_dir, name + '.prof')
+    metrics.finish(profile_path)
+    result['seconds'] = round(metrics.seconds, 3)
+    result['timings'] = metrics.to_dict()['timings']
+    result['peak_rss_kb'] = metrics.peak_rss_kb
+    if before is not None:
+        # A worker process runs one job at a time, so the difference is this job's
+        after = engine.stats()
+        result['tiers'] = {key: after[key] - before[key] for key in ('escalated', 'improved', 'fallbacks')}
+        for tier in ('fast', 'best'):
+            result['tiers'][tier] = {'calls': after[tier]['calls'] - before[tier]['calls'],
+                                     'seconds': round(after[tier]['seconds'] - before[tier]['seconds'], 3)}
+    return result
+
+class BatchRun:
+    """One process pool with its metrics sink, search index and running totals, fed any number of input lists.
+
+    run() OCRs one list of inputs into one output file and can be called
+    repeatedly, so workers (and their loaded models and caches) are started
+    once however the inputs are split; close() shuts the pool, writes the
+    metrics and logs the totals. The arguments are those of run_batch.
+    """
+    def __init__(self, workers=None, lang_code='eng', tesseract_cmd=None, cache_path=OCR_CACHE_FILE, params=None,
+                 metrics_path=None, profile_dir=None, log_callback=None, model='fast', dedup=None, index_path=None):
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers = workers or os.cpu_count() or 1
+        self.lang_code = lang_code
+        self.cache_path = cache_path
+        self.params = params
+        self.profile_dir = profile_dir
+        self.log_callback = log_callback
+        self.model = model
+        self.dedup = dedup
+        self.index_path = index_path
+        self.processed = self.failed = self.cached = self.duplicates = self.indexed = 0
+        self.tiers = {'escalated': 0, 'improved': 0, 'fallbacks': 0, 'fast': {'calls': 0, 'seconds': 0.0},
+                      'best': {'calls': 0, 'seconds': 0.0}}
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        self.sink = MetricsSink(metrics_path) if metrics_path else None
+        self.index = SearchIndex(index_path) if index_path else None
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_batch_worker,
+                                        initargs=(tesseract_cmd, lang_code, cache_path, model, dedup))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def run(self, target, out_path):
+        """OCR target (see iter_image_paths) or a list of paths into out_path; returns (processed, failed, cached) for it."""
+        from concurrent.futures import wait, FIRST_COMPLETED
+        max_in_flight = self.workers * 4
+        paths = iter_image_paths(target) if isinstance(target, str) else iter(target)
+        counts = (self.processed, self.failed, self.cached)
+        out = sys.stdout if out_path == '-' else open(out_path, 'w', encoding='utf-8')
+        try:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_in_flight:
+                    path = next(paths, None)
+                    if path is None:
+                        exhausted = True
+                        break
+                    pending.add(self.pool.submit(ocr_image_file, path, self.lang_code, self.params, self.profile_dir, self.model))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    out.flush()
+                    self._count(result)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return self.processed - counts[0], self.failed - counts[1], self.cached - counts[2]
+
+    def _count(self, result):
+        self.processed += 1
+        if self.sink:
+            self.sink.record({'job': result['path'], 'seconds': result['seconds'], 'timings': result['timings'],
+                              'peak_rss_kb': result['peak_rss_kb'], 'pages': result['pages'],
+                              'cached': result['cached'], 'error': result['error']})
+        if result['error']:
+            self.failed += 1
+        elif self.index:
+            self.indexed += index_result(self.index, result)
+        if result['cached']:
+            self.cached += 1
+        self.duplicates += result['duplicates']
+        if 'tiers' in result:
+            for key in ('escalated', 'improved', 'fallbacks'):
+                self.tiers[key] += result['tiers'][key]
+            for tier in ('fast', 'best'):
+                self.tiers[tier]['calls'] += result['tiers'][tier]['calls']
+                self.tiers[tier]['seconds'] += result['tiers'][tier]['seconds']
+        if self.log_callback:
+            status = f"FAILED: {result['error']}" if result['error'] else f"{result['seconds']}s{', cached' if result['cached'] else ''}"
+            if result['duplicates']:
+                status += f", {result['duplicates']} duplicate page(s)"
+            self.log_callback(f"[{self.processed}] {result['path']} ({status})")
+
+    def close(self):
+        if self.pool is None:
+            return
+        try:
+            self.pool.shutdown()
+        finally:
+            self.pool = None
+            if self.sink:
+                self.sink.close()
+            if self.index:
+                self.index.close()
+        log_callback, tiers = self.log_callback, self.tiers
+        if self.index and log_callback:
+            log_callback(f"Search index: {self.indexed} new or changed document(s) written to {self.index_path}")
+        if self.model.startswith('tiered') and log_callback:
+            log_callback(f"Tiers: fast {tiers['fast']['calls']} call(s) in {tiers['fast']['seconds']:.1f}s, "
+                         f"best {tiers['best']['calls']} call(s) in {tiers['best']['seconds']:.1f}s; "
+                         f"{tiers['escalated']} escalated, {tiers['improved']} improved"
+                         + (f", {tiers['fallbacks']} kept fast after best failed" if tiers['fallbacks'] else ''))
+        if self.dedup is not None and self.cache_path and log_callback:
+            log_callback(f"Near-duplicate pages: {self.duplicates} engine call(s) saved")
+
+def run_batch(target, out_path, workers=None, lang_code='eng', tesseract_cmd=None, cache_path=OCR_CACHE_FILE, params=None,
+              metrics_path=None, profile_dir=None, log_callback=None, model='fast', dedup=None, index_path=None):
+    """OCR every image matched by target (see iter_image_paths), or in a list of paths, across a process pool.
+
+    One JSON line is written to out_path ('-' for stdout) per image as soon as it
+    finishes, so partial results survive an interrupted run. Only a bounded number
+    of images are in flight at once to keep memory flat on very large batches.
+    Pass cache_path=None to bypass the result cache. Per-image metrics go to
+    metrics_path (see MetricsSink) and cProfile dumps to profile_dir when given.
+    model picks the engine (see get_engine); for 'tiered' the per-tier totals
+    are logged at the end. With dedup (a thumb_difference threshold) pages
+    matching one already in the cache reuse its result, and the number of
+    engine calls saved is logged. Successful results are added to the
+    SearchIndex at index_path when given. Returns (processed, failed, cached).
+    """
+    with BatchRun(workers, lang_code, tesseract_cmd, cache_path, params, metrics_path, profile_dir, log_callback, model,
+                  dedup, index_path) as batch:
+        return batch.run(target, out_path)
+
+# --- Watch Folder ---
+WATCH_MANIFEST_FILE = '.ocr_manifest.db'
+WATCH_POLL_SECONDS = 2.0
+WATCH_RESCAN_SECONDS = 300.0
+WATCH_SETTLE_SECONDS = 2.0
+WATCH_MAX_ATTEMPTS = 3
+
+class WatchManifest:
+    """Persistent record of every file the watcher has seen, backed by SQLite.
+
+    One row per input path with its mtime, size, content hash and status
+    ('done' or 'failed'). Rows are mirrored in memory so scanning thousands of
+    files costs one stat each and no queries. A file is (re)processed when it
+    is new, its mtime or size changed, or it failed fewer than max_attempts
+    times and retry_failed is set.
+    """
+    def __init__(self, path, max_attempts=WATCH_MAX_ATTEMPTS):
+        import sqlite3
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(str(path), timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL, "
+                         "hash TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL, error TEXT, updated REAL NOT NULL)")
+        self._db.commit()
+        self.entries = {row[0]: row[1:] for row in self._db.execute("SELECT path, mtime, size, status, attempts FROM files")}
+
+    def needs_processing(self, path, mtime, size, retry_failed=False):
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != mtime or entry[1] != size:
+            return True
+        return retry_failed and entry[2] == 'failed' and entry[3] < self.max_attempts
+
+    def mark(self, path, mtime, size, file_hash, status, error=None):
+        entry = self.entries.get(path)
+        # A changed file starts with a fresh attempt budget
+        attempts = entry[3] if entry and entry[0] == mtime and entry[1] == size else 0
+        attempts = attempts + 1 if status == 'failed' else 0
+        self.entries[path] = (mtime, size, status, attempts)
+        self._db.execute("INSERT OR REPLACE INTO files (path, mtime, size, hash, status, attempts, error, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (path, mtime, size, file_hash, status, attempts, error, time.time()))
+        self._db.commit()
+
+    def counts(self):
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry[2]] = counts.get(entry[2], 0) + 1
+        return counts
+
+    def close(self):
+        self._db.close()
+
+def write_atomic(path, data):
+    """Write text to path via a temporary file and rename, so readers never see a partial file."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def watch_output_base(inbox, out_dir, path):
+    """Output path without extension: the input's place in inbox mirrored under out_dir."""
+    relative = os.path.relpath(path, inbox)
+    return os.path.join(out_dir, os.path.splitext(relative)[0])
+
+def _init_watch_worker(tesseract_cmd, lang_code, cache_path, model='fast', dedup=None):
+    # Ctrl+C is handled by the watcher, which lets running jobs finish
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_batch_worker(tesseract_cmd, lang_code, cache_path, model, dedup)
+
+def _watch_job(path, out_base, lang_code, params, model='fast'):
+    result = ocr_image_file(path, lang_code, params, model=model)
+    result['hash'] = hash_file(path)
+    if not result['error']:
+        write_atomic(out_base + '.txt', result['text'])
+        write_atomic(out_base + '.json', json.dumps(result, ensure_ascii=False, indent=2))
+    return result
+
+def _start_watchdog(inbox, changed, wake):
+    """Feed filesystem events into changed/wake using watchdog, or return None if it is not installed."""
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            for path in (event.src_path, getattr(event, 'dest_path', None)):
+                if path and path.lower().endswith(INPUT_EXTENSIONS):
+                    changed.add(os.path.abspath(path))
+            wake.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), inbox, recursive=True)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+class DirectoryPoller:
+    """Finds inputs added or renamed under root without walking the whole tree on every poll.
+
+    Adding, removing or renaming an entry changes its directory's mtime, so a
+    poll stats each known directory and lists only those that changed. A file
+    rewritten in place leaves its directory alone; the periodic rescan in
+    run_watch catches those. Directories touched within WATCH_SETTLE_SECONDS
+    are listed again next time, in case the mtime did not tick.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.mtimes = {}
+
+    def rescan(self):
+        """Every input under root, as a fresh walk would find them."""
+        self.mtimes.clear()
+        return self.poll()
+
+    def poll(self):
+        """Inputs in directories changed since the last poll (all of them on the first)."""
+        found = []
+        for directory in list(self.mtimes) or [self.root]:
+            self._check(directory, found)
+        return sorted(found)
+
+    def _check(self, directory, found):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            self.mtimes.pop(directory, None)
+            return
+        if directory in self.mtimes and self.mtimes[directory] == mtime:
+            return
+        self.mtimes[directory] = mtime if time.time() - mtime / 1e9 > WATCH_SETTLE_SECONDS else None
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.path not in self.mtimes:
+                    self._check(entry.path, found)
+            elif entry.name.lower().endswith(INPUT_EXTENSIONS):
+                found.append(entry.path)
+
+def run_watch(inbox, out_dir=None, workers=None, lang_code='eng', tesseract_cmd=None, cache_path=OCR_CACHE_FILE, params=None,
+              manifest_path=None, poll=WATCH_POLL_SECONDS, once=False, stop_event=None, log_callback=None, model='fast',
+              dedup=None, index_path=None):
+    """Keep OCRing files that land in inbox until stop_event is set (or, with once, until the backlog is done).
+
+    Outputs go to <name>.txt/<name>.json under out_dir (default: next to each
+    input). Files are picked up from watchdog events when that package is
+    installed, otherwise by polling directory mtimes every poll seconds (see
+    DirectoryPoller); a full rescan also runs at start-up and every
+    WATCH_RESCAN_SECONDS to catch missed events and in-place rewrites. A file
+    is only submitted once its mtime is WATCH_SETTLE_SECONDS old, so copies in
+    progress are not read. dedup and index_path are as for run_batch; the
+    index is written once per round of finished jobs. Returns (processed, failed).
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    inbox = os.path.abspath(inbox)
+    out_dir = os.path.abspath(out_dir or inbox)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = WatchManifest(manifest_path or os.path.join(out_dir, WATCH_MANIFEST_FILE))
+    index = SearchIndex(index_path) if index_path else None
+    stop_event = stop_event or threading.Event()
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    log = log_callback or (lambda message: None)
+    wake = threading.Event()
+    changed = set()
+    observer = None if once else _start_watchdog(inbox, changed, wake)
+    poller = None if observer else DirectoryPoller(inbox)
+    log(f"Watching {inbox} ({'watchdog events' if observer else f'polling every {poll}s'}), "
+        f"manifest: {manifest.counts() or 'empty'}")
+    backlog = deque()
+    queued = set()
+    waiting = set()  # seen but still being written
+    in_flight = {}
+    running = set()
+    processed = failed = 0
+    next_rescan = 0.0
+    first_scan = True
+
+    def consider(path, retry_failed=False):
+        if path in queued or path in running:
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            waiting.discard(path)
+            return
+        if not manifest.needs_processing(path, st.st_mtime, st.st_size, retry_failed):
+            waiting.discard(path)
+            return
+        if time.time() - st.st_mtime < WATCH_SETTLE_SECONDS:
+            waiting.add(path)
+            return
+        waiting.discard(path)
+        queued.add(path)
+        backlog.append((path, st.st_mtime, st.st_size))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_watch_worker,
+                                 initargs=(tesseract_cmd, lang_code, cache_path, model, dedup)) as pool:
+            while not stop_event.is_set():
+                if time.monotonic() >= next_rescan:
+                    for path in poller.rescan() if poller else iter_image_paths(inbox):
+                        consider(os.path.abspath(path), retry_failed=first_scan)
+                    first_scan = False
+                    next_rescan = time.monotonic() + WATCH_RESCAN_SECONDS
+                elif poller:
+                    for path in poller.poll():
+                        consider(path)
+                else:
+                    events = list(changed)
+                    changed.difference_update(events)
+                    for path in events:
+                        consider(path)
+                for path in list(waiting):
+                    consider(path)
+                while backlog and len(in_flight) < max_in_flight:
+                    path, mtime, size = backlog.popleft()
+                    queued.discard(path)
+                    future = pool.submit(_watch_job, path, watch_output_base(inbox, out_dir, path), lang_code, params, model)
+                    in_flight[future] = (path, mtime, size)
+                    running.add(path)
+                if once and not in_flight and not backlog and not waiting:
+                    break
+                if in_flight:
+                    done, _ = wait(list(in_flight), timeout=poll, return_when=FIRST_COMPLETED)
+                else:
+                    wake.wait(poll)
+                    wake.clear()
+                    done = ()
+                for future in done:
+                    path, mtime, size = in_flight.pop(future)
+                    running.discard(path)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'error': str(e), 'hash': None, 'seconds': 0}
+                    processed += 1
+                    if result['error']:
+                        failed += 1
+                        manifest.mark(path, mtime, size, result['hash'], 'failed', result['error'])
+                        log(f"[{processed}] {path} FAILED: {result['error']}")
+                    else:
+                        manifest.mark(path, mtime, size, result['hash'], 'done')
+                        if index:
+                            index_result(index, result)
+                        duplicates = f", {result['duplicates']} duplicate page(s)" if result['duplicates'] else ''
+                        log(f"[{processed}] {path} ({result['seconds']}s{', cached' if result['cached'] else ''}{duplicates})")
+                if index and done:
+                    index.flush()
+    finally:
+        if observer:
+            observer.stop()
+            observer.join(timeout=5)
+        manifest.close()
+        if index:
+            index.close()
+    return processed, failed
+
+# --- Distributed Batch ---
+SHARD_CHUNK_SIZE = 25
+SHARD_LEASE_SECONDS = 120.0
+SHARD_POLL_SECONDS = 5.0
+
+def shard_node_name():
+    import socket
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def create_exclusive(path, data):
+    """Create path holding data unless it already exists; returns whether this call created it.
+
+    Written to a unique temporary file and hard-linked into place, which is
+    atomic on local filesystems and NFS alike (O_EXCL is not on older NFS).
+    As open(2) advises, a lost link() reply is detected by the temporary
+    file's link count.
+    """
+    tmp_path = f"{path}.{shard_node_name()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        if os.stat(tmp_path).st_nlink == 2:
+            return True
+        # No hard links on this share (FAT, some SMB servers): fall back to O_EXCL
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        return True
+    finally:
+        os.remove(tmp_path)
+
+def lease_owner(lease_path):
+    try:
+        with open(lease_path, encoding='utf-8') as f:
+            return json.load(f).get('node')
+    except (OSError, ValueError):
+        return None
+
+def claim_lease(lease_path, node, lease_seconds=SHARD_LEASE_SECONDS):
+    """Take the lease at lease_path for node; returns whether node now holds it.
+
+    A lease whose file has not been touched for lease_seconds belongs to a
+    node that died or stalled and is taken over. Contenders for one stale
+    lease race to create a takeover marker named after its contents, so only
+    one can win. The winner checks the lease is still that same stale one,
+    then overwrites it atomically. A lease is never moved away, so nobody can
+    slip in a claim of their own meanwhile. Expiry is judged by file mtimes,
+    so node clocks must roughly agree.
+    """
+    import hashlib
+    data = json.dumps({'node': node, 'claimed': time.time()})
+    if create_exclusive(lease_path, data):
+        return True
+
+    def read_stale():
+        # Read before stat: a lease replaced in between then shows up as fresh
+        try:
+            with open(lease_path, encoding='utf-8') as f:
+                held = f.read()
+            return held if time.time() - os.stat(lease_path).st_mtime > lease_seconds else None
+        except OSError:
+            return None
+
+    held = read_stale()
+    if held is None:
+        return False
+    marker = f"{lease_path}.takeover.{hashlib.sha1(held.encode('utf-8')).hexdigest()[:16]}"
+    try:
+        if time.time() - os.stat(marker).st_mtime > lease_seconds:
+            # Left by a node that died mid-takeover
+            os.remove(marker)
+    except OSError:
+        pass
+    if not create_exclusive(marker, node):
+        return False
+    try:
+        if read_stale() != held:
+            # Renewed, released or already taken over since we looked
+            return False
+        tmp_path = f"{lease_path}.{node}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, lease_path)
+        return True
+    finally:
+        os.remove(marker)
+
+def release_lease(lease_path, node):
+    if lease_owner(lease_path) == node:
+        try:
+            os.remove(lease_path)
+        except FileNotFoundError:
+            pass
+
+def _renew_lease(lease_path, node, lease_seconds, stop, log):
+    while not stop.wait(lease_seconds / 4):
+        if lease_owner(lease_path) != node:
+            log(f"Lost the lease {os.path.basename(lease_path)}; another node may redo this chunk")
+            return
+        try:
+            os.utime(lease_path)
+        except OSError as e:
+            log(f"Could not renew {os.path.basename(lease_path)}: {e}")
+
+def load_shard_plan(shared_dir, target, node, chunk_size=SHARD_CHUNK_SIZE):
+    """Return the shared plan {'target', 'chunks'}, creating it from target if this node is first.
+
+    Paths are stored absolute, so inputs must be mounted at the same path on
+    every node. Raises if shared_dir already holds a plan for another target.
+    """
+    plan_path = os.path.join(shared_dir, 'plan.json')
+    if not os.path.exists(plan_path):
+        paths = [os.path.abspath(path) for path in iter_image_paths(target)]
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        create_exclusive(plan_path, json.dumps({'target': target, 'node': node, 'created': time.time(), 'chunks': chunks}))
+    with open(plan_path, encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan['target'] != target:
+        # Its results belong to that run; merging them into this one's output would be wrong
+        raise Exception(f"{shared_dir} already holds a run for {plan['target']!r}, not {target!r}. "
+                        "Use a fresh shared directory for each batch.")
+    return plan
+
+def merge_shard_results(shared_dir, chunks, out_path):
+    """Concatenate the per-chunk JSON lines in plan order into out_path, atomically."""
+    import shutil
+    directory = os.path.dirname(out_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(out_path)}.{shard_node_name()}.tmp")
+    with open(tmp_path, 'wb') as out:
+        for i in range(chunks):
+            with open(os.path.join(shared_dir, 'results', f"chunk-{i:05d}.jsonl"), 'rb') as f:
+                shutil.copyfileobj(f, out)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, out_path)
+
+def run_shared_batch(target, shared_dir, out_path=None, node=None, chunk_size=SHARD_CHUNK_SIZE,
+                     lease_seconds=SHARD_LEASE_SECONDS, poll=SHARD_POLL_SECONDS, stop_event=None, log_callback=None, **batch_options):
+    """Work through target together with any other nodes pointed at the same shared_dir.
+
+    The first node to arrive splits the inputs into chunks of chunk_size and
+    writes plan.json. Every node then claims chunks through lease files in
+    leases/, OCRs each on one BatchRun kept for the whole run (batch_options
+    are passed on, and metrics accumulate across chunks) while a heartbeat
+    keeps the lease fresh, and publishes results/chunk-N.jsonl
+    atomically. A crashed node's lease expires after lease_seconds and its
+    chunk is redone elsewhere. Nodes keep waiting until every chunk is done;
+    the results are then merged in input order into out_path (default
+    shared_dir/results.jsonl). Any number of processes on one machine can act
+    as nodes. Returns this node's (processed, failed, cached).
+    """
+    node = node or shard_node_name()
+    log = log_callback or (lambda message: None)
+    stop_event = stop_event or threading.Event()
+    out_path = out_path or os.path.join(shared_dir, 'results.jsonl')
+    for name in ('leases', 'results'):
+        os.makedirs(os.path.join(shared_dir, name), exist_ok=True)
+    plan = load_shard_plan(shared_dir, target, node, chunk_size)
+    chunks = plan['chunks']
+    result_path = lambda i: os.path.join(shared_dir, 'results', f"chunk-{i:05d}.jsonl")
+    lease_path = lambda i: os.path.join(shared_dir, 'leases', f"chunk-{i:05d}.lease")
+    log(f"Node {node}: {sum(len(chunk) for chunk in chunks)} file(s) in {len(chunks)} chunk(s)")
+    batch = BatchRun(log_callback=log_callback, **batch_options)
+    try:
+        _run_shard_chunks(batch, chunks, node, result_path, lease_path, lease_seconds, poll, stop_event, log)
+    finally:
+        batch.close()
+    if not stop_event.is_set():
+        merge_shard_results(shared_dir, len(chunks), out_path)
+        log(f"All {len(chunks)} chunk(s) done; results merged into {out_path}")
+    return batch.processed, batch.failed, batch.cached
+
+def _run_shard_chunks(batch, chunks, node, result_path, lease_path, lease_seconds, poll, stop_event, log):
+    import random
+    while not stop_event.is_set():
+        pending = [i for i in range(len(chunks)) if not os.path.exists(result_path(i))]
+        if not pending:
+            break
+        # Start at a random chunk so nodes do not all contend for the same leases
+        start = random.randrange(len(pending))
+        claimed = None
+        for i in pending[start:] + pending[:start]:
+            if claim_lease(lease_path(i), node, lease_seconds):
+                if not os.path.exists(result_path(i)):
+                    claimed = i
+                    break
+                release_lease(lease_path(i), node)
+        if claimed is None:
+            # Everything left is leased to other nodes; wait for them to finish or expire
+            stop_event.wait(poll)
+            continue
+        log(f"Claimed chunk {claimed + 1}/{len(chunks)} ({len(chunks[claimed])} file(s))")
+        stop_renewing = threading.Event()
+        threading.Thread(target=_renew_lease, args=(lease_path(claimed), node, lease_seconds, stop_renewing, log), daemon=True).start()
+        tmp_path = f"{result_path(claimed)}.{node}.tmp"
+        try:
+            batch.run(chunks[claimed], tmp_path)
+            os.replace(tmp_path, result_path(claimed))
+        finally:
+            stop_renewing.set()
+            release_lease(lease_path(claimed), node)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        log(f"Chunk {claimed + 1}/{len(chunks)} done")
+
+# --- HTTP OCR Service ---
+SERVICE_MAX_UPLOAD = 50 * 1024 * 1024
+# Per page, as decoded; a small compressed upload can still claim a huge bitmap
+SERVICE_MAX_PIXELS = 100_000_000
+
+class OCRService:
+    """Bounded OCR work queue behind the HTTP service.
+
+    At most workers jobs run at once and at most queue_size more wait; further
+    submissions are refused immediately so callers can back off. A slot is only
+    freed when its job really finishes, even if the request already timed out,
+    so the bound reflects actual engine load. Uploads with a page larger than
+    max_pixels are refused before anything is decoded.
+    """
+    def __init__(self, engine, workers=2, queue_size=8, timeout=60.0, cache=None, lang_code='eng',
+                 max_pixels=SERVICE_MAX_PIXELS):
+        from concurrent.futures import ThreadPoolExecutor
+        self.engine = engine
+        self.max_pixels = max_pixels
+        self.cache = cache
+        self.timeout = timeout
+        self.lang_code = lang_code
+        self.workers = workers
+        self.queue_size = queue_size
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        # Each worker thread loads its own model once and keeps it warm
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-worker',
+                                            initializer=engine.warm, initargs=(lang_code,))
+
+    def oversized(self, data):
+        """Error message if a page of the upload would decode to more than max_pixels, else None.
+
+        Only image headers (or PDF page sizes) are read. Uploads that cannot be
+        parsed here are left for the OCR job to report.
+        """
+        sizes = []
+        if data[:5] == b'%PDF-':
+            try:
+                import pypdfium2
+            except ImportError:
+                return None
+            scale = PREPROCESS_PARAMS['target_dpi'] / 72
+            with _PDFIUM_LOCK:
+                try:
+                    pdf = pypdfium2.PdfDocument(data)
+                except Exception:
+                    return None
+                try:
+                    sizes = [(width * scale, height * scale) for width, height in map(pdf.get_page_size, range(len(pdf)))]
+                finally:
+                    pdf.close()
+        else:
+            try:
+                with Image.open(BytesIO(data)) as img:
+                    for index in range(getattr(img, 'n_frames', 1)):
+                        img.seek(index)
+                        sizes.append(img.size)
+            except Image.DecompressionBombError:
+                return f'image larger than {self.max_pixels} pixels'
+            except Exception:
+                return None
+        for page, (width, height) in enumerate(sizes, 1):
+            if width * height > self.max_pixels:
+                return f'page {page} is {int(width)}x{int(height)}, larger than {self.max_pixels} pixels'
+        return None
+
+    def submit(self, data, lang_code=None):
+        """Queue an uploaded image or PDF; returns a Future, or None when saturated."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+        try:
+            future = self._executor.submit(self._run, data, lang_code or self.lang_code)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future):
+        self._slots.release()
+        with self._lock:
+            self.completed += 1
+
+    def _run(self, data, lang_code):
+        import tempfile
+        start = time.perf_counter()
+        timings = {}
+        # PDF pages are rendered from a file, so uploads are spooled to a temp file
+        fd, path = tempfile.mkstemp(suffix='.pdf' if data[:5] == b'%PDF-' else '.img')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            pages = list(recognize_document(path, lang_code, engine=self.engine, cache=self.cache, timings=timings))
+        finally:
+            os.remove(path)
+        return {
+            'lang': lang_code,
+            'text': '\f'.join(page['text'] for page in pages),
+            'confidence': mean_confidence(pages),
+            'pages': pages,
+            'timings': {stage: round(seconds, 4) for stage, seconds in timings.items()},
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = {'workers': self.workers, 'queue_size': self.queue_size, 'completed': self.completed,
+                     'rejected': self.rejected, 'timed_out': self.timed_out, 'backend': self.engine.backend,
+                     'model': self.engine.model}
+        if isinstance(self.engine, TieredEngine):
+            stats['tiers'] = self.engine.stats()
+        return stats
+
+    def note_timeout(self):
+        with self._lock:
+            self.timed_out += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def extract_upload(content_type, body):
+    """Return the uploaded file bytes from a multipart/form-data or raw request body."""
+    if not content_type.startswith('multipart/form-data'):
+        return body
+    from email.parser import BytesParser
+    from email.policy import HTTP
+    message = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    fallback = None
+    for part in message.iter_parts():
+        if part.get_param('name', header='content-disposition') == 'image':
+            return part.get_payload(decode=True)
+        if fallback is None and part.get_filename():
+            fallback = part.get_payload(decode=True)
+    return fallback
+
+def make_service_handler(service):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+    from concurrent.futures import TimeoutError as FutureTimeout
+    import re
+
+    class OCRRequestHandler(BaseHTTPRequestHandler):
+        server_version = "ANSNEW-Image2Text/" + CURRENT_VERSION
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/health':
+                return self.send_json(200, {'status': 'ok', **service.stats()})
+            self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/ocr':
+                return self.send_json(404, {'error': 'not found'})
+            length = int(self.headers.get('Content-Length') or 0)
+            if length <= 0:
+                return self.send_json(411, {'error': 'Content-Length required'})
+            if length > SERVICE_MAX_UPLOAD:
+                return self.send_json(413, {'error': f'upload larger than {SERVICE_MAX_UPLOAD} bytes'})
+            data = extract_upload(self.headers.get('Content-Type', ''), self.rfile.read(length))
+            if not data:
+                return self.send_json(400, {'error': "no 'image' file in request"})
+            too_large = service.oversized(data)
+            if too_large:
+                return self.send_json(413, {'error': too_large})
+            lang_code = parse_qs(url.query).get('lang', [service.lang_code])[0]
+            if not re.fullmatch(r'[A-Za-z_]+(\+[A-Za-z_]+)*', lang_code):
+                return self.send_json(400, {'error': f'invalid language code: {lang_code}'})
+            future = service.submit(data, lang_code)
+            if future is None:
+                return self.send_json(429, {'error': 'OCR queue is full, retry later'}, {'Retry-After': '1'})
+            try:
+                result = future.result(timeout=service.timeout)
+            except FutureTimeout:
+                service.note_timeout()
+                return self.send_json(504, {'error': f'OCR did not finish within {service.timeout:g}s'})
+            except Exception as e:
+                return self.send_json(500, {'error': str(e)})
+            self.send_json(200, result)
+
+        def log_message(self, format, *args):
+            cli_log(f"{self.address_string()} - {format % args}")
+
+    return OCRRequestHandler
+
+def run_service(host='127.0.0.1', port=8080, workers=2, queue_size=8, timeout=60.0, lang_code='eng',
+                tesseract_cmd=None, cache_path=OCR_CACHE_FILE, log_callback=None, model='fast'):
+    """Serve POST /ocr (multipart 'image' field or raw body) and GET /health until interrupted."""
+    from http.server import ThreadingHTTPServer
+    engine = get_engine(tesseract_cmd, model)
+    cache = get_cache(cache_path) if cache_path else None
+    service = OCRService(engine, workers=workers, queue_size=queue_size, timeout=timeout, cache=cache, lang_code=lang_code)
+    server = ThreadingHTTPServer((host, port), make_service_handler(service))
+    server.daemon_threads = True
+    if log_callback:
+        log_callback(f"OCR service listening on http://{host}:{server.server_address[1]}/ocr "
+                     f"(backend={engine.backend}, workers={workers}, queue={queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+# --- OCR Job Queue ---
+MAX_CONCURRENT_JOBS = 2
+
+def count_document_pages(path):
+    """Number of pages in an image, TIFF or PDF, or None if it cannot be determined cheaply."""
+    try:
+        if str(path).lower().endswith('.pdf'):
+            try:
+                import pypdfium2
+            except ImportError:
+                return _pdf_page_count(path)
+            with _PDFIUM_LOCK:
+                pdf = pypdfium2.PdfDocument(path)
+                try:
+                    return len(pdf)
+                finally:
+                    pdf.close()
+        with Image.open(path) as img:
+            return getattr(img, 'n_frames', 1)
+    except Exception:
+        return None
+
+class OCRJobQueue:
+    """Runs OCR jobs on a bounded pool of worker threads.
+
+    Workers never touch Tk. They post (kind, job_id, payload) events to the
+    thread-safe events queue, which the GUI drains from the main loop. kind is
+    one of 'started', 'log', 'page', 'done', 'failed' or 'cancelled'; 'page'
+    carries (page_result, total_pages, metrics), so the GUI can time its own
+    update into the job's 'ui_update' stage, and 'done' the finished
+    JobMetrics. Cancellation takes effect between
+    pages, since a running engine call cannot be interrupted. Finished
+    documents are added to index (a SearchIndex) when one is given.
+    """
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, index=None):
+        import queue
+        from concurrent.futures import ThreadPoolExecutor
+        self.events = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='ocr-job')
+        self.index = index
+        self._cancel = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def submit(self, path, lang_code='eng', model='fast', tesseract_cmd=None, profile=False):
+        with self._lock:
+            self._next_id += 1
+            job_id = self._next_id
+            self._cancel[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id, path, lang_code, model, tesseract_cmd, profile)
+        return job_id
+
+    def cancel(self, job_id):
+        event = self._cancel.get(job_id)
+        if event:
+            event.set()
+
+    def _emit(self, kind, job_id, payload=None):
+        self.events.put((kind, job_id, payload))
+
+    def _run(self, job_id, path, lang_code, model, tesseract_cmd, profile):
+        cancel = self._cancel[job_id]
+        metrics = None
+        try:
+            if cancel.is_set():
+                self._emit('cancelled', job_id)
+                return
+            self._emit('started', job_id)
+            log = lambda message: self._emit('log', job_id, message)
+            # May download the model, which is why it runs here rather than on the Tk thread
+            ensure_model_langdata(lang_code, model, log)
+            engine = get_engine(tesseract_cmd, model)
+            log(f"Running OCR (lang={lang_code}, backend={engine.backend}, model={engine.model})...")
+            total = count_document_pages(path)
+            metrics = JobMetrics(path, profile=profile)
+            pages = recognize_document(path, lang_code, engine=engine, cache=get_cache(), timings=metrics.timings)
+            texts = []
+            try:
+                for page in pages:
+                    texts.append((page['page'], page['lang'], page['text']))
+                    self._emit('page', job_id, (page, total, metrics))
+                    if cancel.is_set():
+                        self._emit('cancelled', job_id)
+                        return
+            finally:
+                pages.close()
+            if isinstance(engine, TieredEngine):
+                # Totals since start-up; concurrent jobs share the engine
+                log(f"Tiers: {format_tier_stats(engine.stats())}")
+            if self.index is not None:
+                try:
+                    if self.index.add_document(path, texts):
+                        self.index.flush()
+                        log("Added to the search index.")
+                except Exception as e:
+                    log(f"Could not update the search index: {e}")
+            self._emit('done', job_id, metrics.finish(PROFILE_FILE if profile else None, pages=len(texts)))
+        except Exception as e:
+            self._emit('failed', job_id, str(e))
+        finally:
+            if metrics is not None and metrics.seconds is None:
+                metrics.finish()  # stops the profiler of a cancelled or failed job
+            self._cancel.pop(job_id, None)
+
+    def shutdown(self):
+        for event in list(self._cancel.values()):
+            event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
 # --- GUI ---
+UI_POLL_MS = 100
+LOG_HISTORY_LINES = 2000
+
+def import_tkinter():
+    """Import tkinter into this module's globals; only the GUI needs it."""
+    global tk, ttk, filedialog, messagebox, scrolledtext
+    import tkinter
+    from tkinter import ttk as tkinter_ttk, filedialog as tkinter_filedialog, messagebox as tkinter_messagebox, \
+        scrolledtext as tkinter_scrolledtext
+    tk, ttk, filedialog, messagebox, scrolledtext = (tkinter, tkinter_ttk, tkinter_filedialog, tkinter_messagebox,
+                                                     tkinter_scrolledtext)
+
 class LogPopup:
-    def __init__(self, parent, title="Log Output"):
+    def __init__(self, parent, title="Log Output", modal=True):
         self.top = tk.Toplevel(parent)
         self.top.title(title)
         self.top.geometry("540x340")
         self.top.transient(parent)
-        self.top.grab_set()
+        if modal:
+            self.top.grab_set()
         self.text = scrolledtext.ScrolledText(self.top, wrap=tk.WORD, width=64, height=16, state='disabled', font=('Consolas', 10))
         self.text.pack(padx=8, pady=8, fill='both', expand=True)
         self.close_btn = ttk.Button(self.top, text="Close", command=self.top.destroy)
@@ -254,11 +3635,31 @@ class LogPopup:
         self.top.protocol("WM_DELETE_WINDOW", self.top.destroy)
         self.top.focus_set()
         self.top.lift()
+        # log() may be called from worker threads, so messages are queued and written by the Tk loop
+        import queue
+        self.messages = queue.Queue()
+        self.top.after(UI_POLL_MS, self._drain)
     def log(self, message):
-        self.text.config(state='normal')
-        self.text.insert(tk.END, message + '\n')
-        self.text.see(tk.END)
-        self.text.config(state='disabled')
+        self.messages.put(message)
+    def exists(self):
+        try:
+            return bool(self.top.winfo_exists())
+        except tk.TclError:
+            return False
+    def _drain(self):
+        if not self.top.winfo_exists():
+            return
+        import queue
+        try:
+            while True:
+                message = self.messages.get_nowait()
+                self.text.config(state='normal')
+                self.text.insert(tk.END, message + '\n')
+                self.text.see(tk.END)
+                self.text.config(state='disabled')
+        except queue.Empty:
+            pass
+        self.top.after(UI_POLL_MS, self._drain)
 
 # Add resource_path for PyInstaller compatibility
 def resource_path(relative_path):
@@ -272,7 +3673,7 @@ class OCRApp:
     def __init__(self, root):
         self.root = root
         self.root.title("ANSNEW TECH Image2Text V1.00")
-        self.root.geometry("700x600")
+        self.root.geometry("700x780")
         self.root.configure(bg="#f4f6fb")
         style = ttk.Style()
         style.theme_use('clam')
@@ -283,9 +3684,23 @@ class OCRApp:
         style.configure('Section.TLabelframe.Label', font=('Segoe UI', 11, 'bold'), background="#e9eef6", foreground="#2d3a4b")
 
         self.tesseract_path = tk.StringVar()
-        self.image_path = None
+        self.image_paths = []
         self.selected_lang = tk.StringVar(value='English')
+        self.lang_choices = {'Auto-detect': AUTO_LANG, **LANGS}
+        # Escalate low-confidence pages/regions from the fast to the best model
         self.use_best_model = tk.BooleanVar(value=True)
+        self.profile_jobs = tk.BooleanVar(value=False)
+        self.last_metrics = None
+        import queue
+        self.ui_calls = queue.Queue()
+        self.search_query = tk.StringVar()
+        try:
+            index = get_search_index()
+        except Exception:
+            index = None
+        self.jobs = OCRJobQueue(index=index)
+        self.job_info = {}
+        self.displayed_job = None
 
         # --- Title ---
         ttk.Label(root, text="ANSNEW TECH Image2Text V1.00", style='Header.TLabel').pack(pady=(8, 0))
@@ -297,19 +3712,51 @@ class OCRApp:
         ttk.Button(file_frame, text="Choose Image", command=self.choose_file, width=16).pack(side=tk.LEFT, padx=6, pady=6)
         self.file_label = ttk.Label(file_frame, text="No file selected.", style='TLabel')
         self.file_label.pack(side=tk.LEFT, padx=6, pady=6)
+        ttk.Checkbutton(file_frame, text="Best model on low confidence", variable=self.use_best_model).pack(side=tk.RIGHT, padx=6, pady=6)
+        ttk.Combobox(file_frame, textvariable=self.selected_lang, values=list(self.lang_choices), state='readonly',
+                     width=18).pack(side=tk.RIGHT, padx=6, pady=6)
 
         # --- Extract Button ---
         self.extract_btn = ttk.Button(root, text="Extract Text", command=self.extract_text, width=16, style='TButton')
         self.extract_btn.pack(pady=8)
 
+        # --- Job Queue Section ---
+        jobs_frame = ttk.Labelframe(root, text="Jobs", style='Section.TLabelframe')
+        jobs_frame.pack(fill='x', padx=18, pady=6)
+        self.job_tree = ttk.Treeview(jobs_frame, columns=('file', 'status', 'progress'), show='headings', height=4, selectmode='browse')
+        self.job_tree.heading('file', text="File")
+        self.job_tree.heading('status', text="Status")
+        self.job_tree.heading('progress', text="Progress")
+        self.job_tree.column('file', width=300)
+        self.job_tree.column('status', width=110)
+        self.job_tree.column('progress', width=110)
+        self.job_tree.pack(side=tk.LEFT, fill='x', expand=True, padx=6, pady=6)
+        self.job_tree.bind('<<TreeviewSelect>>', lambda event: self.show_job(self.selected_job()))
+        self.cancel_btn = ttk.Button(jobs_frame, text="Cancel", command=self.cancel_selected_job, width=10)
+        self.cancel_btn.pack(side=tk.LEFT, padx=6, pady=6)
+        ttk.Button(jobs_frame, text="Log", command=self.show_job_log, width=6).pack(side=tk.LEFT, padx=(0, 6), pady=6)
+
+        # --- Search Section ---
+        search_frame = ttk.Labelframe(root, text="Search Extracted Text", style='Section.TLabelframe')
+        search_frame.pack(fill='x', padx=18, pady=6)
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_query, font=('Segoe UI', 11))
+        search_entry.pack(side=tk.LEFT, fill='x', expand=True, padx=6, pady=6)
+        search_entry.bind('<Return>', lambda event: self.search_text())
+        ttk.Button(search_frame, text="Search", command=self.search_text, width=10).pack(side=tk.LEFT, padx=6, pady=6)
+
         # --- Text Output Section ---
         output_frame = ttk.Labelframe(root, text="Extracted Text", style='Section.TLabelframe')
         output_frame.pack(fill='both', expand=True, padx=18, pady=6)
         self.text_area = scrolledtext.ScrolledText(output_frame, wrap=tk.WORD, width=70, height=14, font=("Nirmala UI", 11), bg="#fafdff", fg="#222")
         self.text_area.pack(padx=6, pady=6, fill='both', expand=True)
+        self.text_area.tag_configure('search_source', font=("Segoe UI", 10, 'bold'), foreground="#2d3a4b")
+        self.text_area.tag_configure('search_hit', background="#fff2a8")
 
         # --- Log Area ---
-        self.log_area = None  # No log area in main window
+        self.log_area = None  # No log area in main window; the Jobs "Log" button opens the job log
+        from collections import deque
+        self.log_history = deque(maxlen=LOG_HISTORY_LINES)
+        self.log_popup = None
 
         # Modal for Tesseract setup
         self.setup_modal = None
@@ -337,6 +3784,21 @@ class OCRApp:
         # File menu
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Open Image", command=self.choose_file)
+        file_menu.add_command(label="Export Results...", command=self.export_job)
+        def run_prefetch_langdata():
+            popup = LogPopup(self.root, title="Download Language Models")
+            def log_fn(msg):
+                popup.log(msg)
+            def task():
+                try:
+                    prefetch_langdata(log_callback=log_fn)
+                    if self.use_best_model.get():
+                        prefetch_langdata(use_best=True, log_callback=log_fn)
+                    log_fn("Done.")
+                except Exception as e:
+                    log_fn(f"Download failed: {e}")
+            threading.Thread(target=task, daemon=True).start()
+        file_menu.add_command(label="Download Language Models", command=run_prefetch_langdata)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=root.quit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -376,11 +3838,46 @@ class OCRApp:
                 popup.log(msg)
             threading.Thread(target=lambda: check_for_update(log=log_fn, show_popup=True, parent=self.root), daemon=True).start()
         help_menu.add_command(label="Check for Updates", command=run_check_for_update)
+        # Add OCR cache statistics menu item
+        def show_cache_stats():
+            popup = LogPopup(self.root, title="OCR Cache Statistics")
+            try:
+                stats = get_cache().stats()
+                popup.log(f"Cache file: {get_cache().path}")
+                popup.log(f"Entries: {stats['entries']}")
+                popup.log(f"Size: {stats['bytes'] // 1024} KB of {stats['max_bytes'] // (1024 * 1024)} MB")
+                popup.log(f"Hits: {stats['hits']}")
+                popup.log(f"Misses: {stats['misses']}")
+                popup.log(f"Hit rate: {stats['hit_rate']:.1%}")
+                popup.log(f"Evictions: {stats['evictions']}")
+            except Exception as e:
+                popup.log(f"Cache error: {e}")
+        help_menu.add_command(label="Cache Statistics", command=show_cache_stats)
+        # Add performance report for the last extraction
+        def show_performance_report():
+            popup = LogPopup(self.root, title="Performance Report")
+            metrics = self.last_metrics
+            if metrics is None:
+                popup.log("No extraction has run yet.")
+                return
+            record = metrics.to_dict()
+            popup.log(f"Job: {record['job']}")
+            popup.log(f"Total: {record['seconds'] * 1000:.1f} ms, peak RSS: {record['peak_rss_kb']} KB")
+            for stage, seconds in record['timings'].items():
+                popup.log(f"  {stage}: {seconds * 1000:.1f} ms")
+            popup.log("\n" + metrics_to_prometheus([record]))
+            if metrics.profiler:
+                popup.log(f"cProfile dump saved to {PROFILE_FILE}")
+                popup.log(metrics.profile_summary())
+        help_menu.add_command(label="Performance Report", command=show_performance_report)
+        help_menu.add_checkbutton(label="Profile Extractions (cProfile)", variable=self.profile_jobs)
         menubar.add_cascade(label="Help", menu=help_menu)
         root.config(menu=menubar)
 
         # Auto-detect or download Tesseract on startup
         self.root.after(100, self.auto_setup_tesseract)
+        # Worker threads report back through queues drained here
+        self.root.after(UI_POLL_MS, self.poll_events)
 
         # Place an icon file named 'needyamin.ico' in the same directory as this script for the application icon.
         try:
@@ -413,10 +3910,55 @@ class OCRApp:
             self.extract_btn.config(state='normal')
             self.root.attributes('-disabled', False)
 
+    def call_in_ui(self, fn, *args):
+        """Run fn(*args) on the Tk thread; safe to call from any thread."""
+        self.ui_calls.put((fn, args))
+
+    def poll_events(self):
+        import queue
+        import traceback
+        # One failing callback or event must not stop every later update
+        try:
+            while True:
+                try:
+                    fn, args = self.ui_calls.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    fn(*args)
+                except Exception as e:
+                    self.log(f"UI update failed: {e}")
+                    traceback.print_exc()
+            while True:
+                try:
+                    event = self.jobs.events.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self.handle_job_event(*event)
+                except Exception as e:
+                    self.log(f"Handling {event[0]} event of job {event[1]} failed: {e}")
+                    traceback.print_exc()
+        finally:
+            self.root.after(UI_POLL_MS, self.poll_events)
+
+    def show_job_log(self):
+        """Open (or raise) a non-modal window with the job log so far, updated as jobs run."""
+        if self.log_popup is not None and self.log_popup.exists():
+            self.log_popup.top.lift()
+            return
+        self.log_popup = LogPopup(self.root, title="Job Log", modal=False)
+        for message in self.log_history:
+            self.log_popup.log(message)
+
     def log(self, message):
-        # Only log to modal if open and not destroyed
-        pass
-        # Also log to modal if open and not destroyed
+        if threading.current_thread() is not threading.main_thread():
+            self.call_in_ui(self.log, message)
+            return
+        self.log_history.append(message)
+        if self.log_popup is not None and self.log_popup.exists():
+            self.log_popup.log(message)
+        # Log to modal if open and not destroyed
         try:
             if self.setup_modal_log and self.setup_modal_log.winfo_exists():
                 self.setup_modal_log.config(state='normal')
@@ -431,66 +3973,172 @@ class OCRApp:
     def auto_setup_tesseract(self):
         def task():
             try:
+                if not load_tesseract_info():
+                    if os.name != 'nt':
+                        # Only the Windows build can be installed automatically; say how, and don't block the window
+                        self.log(TESSERACT_INSTALL_HINT)
+                        self.call_in_ui(messagebox.showwarning, "Tesseract Not Found",
+                                        TESSERACT_INSTALL_HINT + "\n\nRestart the app once it is installed.")
+                        return
+                    # The setup modal only appears when Tesseract has to be installed
+                    self.call_in_ui(self.show_setup_modal)
                 exe_path = ensure_tesseract_exists(self.log)
-                self.tesseract_path.set(exe_path)
+                self.call_in_ui(self.tesseract_path.set, exe_path)
                 self.log("Tesseract is ready.")
-                self.hide_setup_modal()
+                self.call_in_ui(self.hide_setup_modal)
             except Exception as e:
                 self.log(f"Tesseract setup failed: {e}")
                 # Retry after a short delay
-                self.root.after(3000, self.auto_setup_tesseract)
-        # Show the setup modal immediately before starting the thread
-        self.show_setup_modal()
+                self.call_in_ui(self.root.after, 3000, self.auto_setup_tesseract)
         threading.Thread(target=task, daemon=True).start()
 
     def choose_file(self):
-        filetypes = [("Image files", "*.png *.jpg *.jpeg *.bmp *.tiff"), ("All files", "*.*")]
-        path = filedialog.askopenfilename(title="Select Image File", filetypes=filetypes)
-        if path:
-            self.image_path = path
-            self.file_label.config(text=os.path.basename(path))
-            self.log(f"Selected image: {path}")
+        filetypes = [("Image files", "*.png *.jpg *.jpeg *.bmp *.tif *.tiff"), ("PDF documents", "*.pdf"), ("All files", "*.*")]
+        paths = filedialog.askopenfilenames(title="Select Image Files", filetypes=filetypes)
+        if paths:
+            self.image_paths = list(paths)
+            label = os.path.basename(paths[0]) if len(paths) == 1 else f"{len(paths)} files selected"
+            self.file_label.config(text=label)
+            self.log(f"Selected: {', '.join(paths)}")
         else:
+            self.image_paths = []
             self.file_label.config(text="No file selected.")
 
     def extract_text(self):
-        if not self.image_path:
+        if not self.image_paths:
             messagebox.showwarning("No File", "Please select an image file first.")
             return
-        # Show loader/feedback
-        self.extract_btn.config(state='disabled', text='Extracting...')
-        self.root.update_idletasks()
-        tesseract_cmd = self.tesseract_path.get().strip()
-        if tesseract_cmd:
-            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
-        # Always use English for OCR (or change to another default if needed)
-        lang_code = 'eng'
-        use_best = False
-        ensure_langdata(lang_code, self.log, use_best=use_best)
-        traineddata_path = os.path.join(TESSDATA_DIR, f"{lang_code}.traineddata")
-        if os.path.isfile(traineddata_path):
-            self.log(f"Using language data: {traineddata_path} ({os.path.getsize(traineddata_path)//1024} KB)")
-        def ocr_task():
+        tesseract_cmd = self.tesseract_path.get().strip() or None
+        lang_code = self.lang_choices.get(self.selected_lang.get(), 'eng')
+        model = f"tiered@{ESCALATE_BELOW:g}" if self.use_best_model.get() else 'fast'
+        first_job = None
+        for path in self.image_paths:
+            job_id = self.jobs.submit(path, lang_code, model=model, tesseract_cmd=tesseract_cmd,
+                                      profile=self.profile_jobs.get())
+            self.job_info[job_id] = {'path': path, 'lang': lang_code, 'model': model, 'pages': [], 'metrics': None}
+            self.job_tree.insert('', tk.END, iid=str(job_id), values=(os.path.basename(path), "Queued", ""))
+            first_job = first_job or job_id
+        self.job_tree.selection_set(str(first_job))
+        self.show_job(first_job)
+
+    def export_job(self):
+        """Save the selected job as hOCR, ALTO or a searchable PDF; finished pages come from the cache."""
+        job_id = self.selected_job()
+        if job_id is None:
+            messagebox.showwarning("No Job", "Please extract text from a file and select it in the Jobs list first.")
+            return
+        info = self.job_info[job_id]
+        filetypes = [("Searchable PDF", "*.pdf"), ("hOCR", "*.hocr"), ("ALTO XML", "*.xml")]
+        out_path = filedialog.asksaveasfilename(title="Export Results", filetypes=filetypes, defaultextension=".pdf",
+                                                initialfile=os.path.splitext(os.path.basename(info['path']))[0])
+        if not out_path:
+            return
+        extension = os.path.splitext(out_path)[1].lower()
+        fmt = next((name for name, ext in EXPORT_FORMATS.items() if ext == extension), 'pdf')
+        tesseract_cmd = self.tesseract_path.get().strip() or None
+        def task():
             try:
-                img = preprocess_image(self.image_path)
-                self.log(f"Running OCR (lang={lang_code})...")
-                text = pytesseract.image_to_string(img, lang=lang_code)
-                self.text_area.delete(1.0, tk.END)
-                self.text_area.insert(tk.END, text)
-                self.log("OCR extraction complete.")
-                # If no text detected, show popup
-                if not text.strip():
-                    self.root.after(0, lambda: messagebox.showinfo("No Text Detected", "No text was found in the selected image."))
+                with open(out_path, 'wb') if fmt == 'pdf' else open(out_path, 'w', encoding='utf-8') as out:
+                    pages = export_document(info['path'], out, fmt, info['lang'], engine=get_engine(tesseract_cmd, info['model']),
+                                            cache=get_cache())
+                self.log(f"Exported {pages} page(s) to {out_path}")
             except Exception as e:
-                self.log(f"Failed to extract text: {e}")
-                messagebox.showerror("Error", f"Failed to extract text:\n{e}")
-            finally:
-                self.extract_btn.config(state='normal', text='Extract Text')
-        threading.Thread(target=ocr_task, daemon=True).start()
+                self.log(f"Export failed: {e}")
+                self.call_in_ui(messagebox.showerror, "Export Failed", str(e))
+        threading.Thread(target=task, daemon=True).start()
+
+    def search_text(self):
+        """Show ranked matches for the search box from the search index in the output area."""
+        query = self.search_query.get().strip()
+        if not query:
+            return
+        try:
+            matches = get_search_index().search(query, markers=('\x02', '\x03'))
+        except Exception as e:
+            messagebox.showerror("Search Failed", str(e))
+            return
+        self.displayed_job = None
+        self.job_tree.selection_remove(*self.job_tree.selection())
+        self.text_area.delete(1.0, tk.END)
+        if not matches:
+            self.text_area.insert(tk.END, f"No matches for {query}.")
+            return
+        for match in matches:
+            self.text_area.insert(tk.END, f"{match['path']} (page {match['page']})\n", 'search_source')
+            # Matched terms come back wrapped in \x02...\x03
+            for i, part in enumerate(match['snippet'].replace('\x03', '\x02').split('\x02')):
+                self.text_area.insert(tk.END, part, 'search_hit' if i % 2 else ())
+            self.text_area.insert(tk.END, '\n\n')
+
+    def selected_job(self):
+        selection = self.job_tree.selection()
+        return int(selection[0]) if selection else None
+
+    def cancel_selected_job(self):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.jobs.cancel(job_id)
+            self.set_job_status(job_id, "Cancelling...")
+
+    def set_job_status(self, job_id, status=None, progress=None):
+        if not self.job_tree.exists(str(job_id)):
+            return
+        if status is not None:
+            self.job_tree.set(str(job_id), 'status', status)
+        if progress is not None:
+            self.job_tree.set(str(job_id), 'progress', progress)
+
+    def show_job(self, job_id):
+        """Show the text recognised so far for job_id in the output area."""
+        if job_id is None or job_id not in self.job_info:
+            return
+        self.displayed_job = job_id
+        self.text_area.delete(1.0, tk.END)
+        self.text_area.insert(tk.END, '\n'.join(page['text'] for page in self.job_info[job_id]['pages']))
+
+    def handle_job_event(self, kind, job_id, payload):
+        info = self.job_info.get(job_id)
+        if info is None:
+            return
+        name = os.path.basename(info['path'])
+        if kind == 'started':
+            self.set_job_status(job_id, "Running", "0%")
+        elif kind == 'log':
+            self.log(f"[{name}] {payload}")
+        elif kind == 'page':
+            page, total, metrics = payload
+            with metrics.stage('ui_update'):
+                info['pages'].append(page)
+                if 'script' in page:
+                    self.log(f"[{name}] Page {page['page']}: script {page['script']['script'] or 'unknown'}, using '{page['lang']}'")
+                self.set_job_status(job_id, progress=f"{page['page']}/{total}" if total else f"{page['page']} page(s)")
+                if job_id == self.displayed_job:
+                    chunk = page['text'] if len(info['pages']) == 1 else '\n' + page['text']
+                    self.text_area.insert(tk.END, chunk)
+        elif kind == 'done':
+            metrics = payload
+            info['metrics'] = self.last_metrics = metrics
+            self.set_job_status(job_id, "Done")
+            stats = get_cache().stats()
+            self.log(f"[{name}] OCR cache hits={stats['hits']}, misses={stats['misses']}")
+            self.log(f"[{name}] {len(info['pages'])} page(s) in {metrics.seconds * 1000:.1f} ms, peak RSS {metrics.peak_rss_kb} KB")
+            for stage, seconds in metrics.timings.items():
+                self.log(f"  {stage}: {seconds * 1000:.1f} ms")
+            self.log(f"[{name}] OCR extraction complete.")
+            # If no text detected, show popup
+            if not any(page['text'].strip() for page in info['pages']):
+                messagebox.showinfo("No Text Detected", f"No text was found in {name}.")
+        elif kind == 'failed':
+            self.set_job_status(job_id, "Failed")
+            self.log(f"[{name}] Failed to extract text: {payload}")
+            messagebox.showerror("Error", f"Failed to extract text from {name}:\n{payload}")
+        elif kind == 'cancelled':
+            self.set_job_status(job_id, "Cancelled")
 
 def check_for_update(log=None, show_popup=True, parent=None):
     """Check for updates and show popup if available."""
     try:
+        import requests
         headers = {
             'Accept': 'application/vnd.github.v3+json',
             'User-Agent': 'ANSNEW-Tech-Text2Image'
@@ -528,10 +4176,279 @@ def check_for_update(log=None, show_popup=True, parent=None):
             log(f"Update check error: {str(e)}")
         return False
 
-def main():
+# --- Command Line Interface ---
+def add_model_arguments(parser):
+    parser.add_argument('--model', choices=MODEL_TIERS, default='fast',
+                        help="fast models, best models, or tiered: fast first and best only where confidence is low (default: fast)")
+    parser.add_argument('--escalate-below', type=float, default=ESCALATE_BELOW,
+                        help=f"With --model tiered, mean word confidence below which the best model is tried (default: {ESCALATE_BELOW:g})")
+
+def model_from_args(args):
+    return f"tiered@{args.escalate_below:g}" if args.model == 'tiered' else args.model
+
+def add_dedup_arguments(parser):
+    parser.add_argument('--dedup', action='store_true',
+                        help="Reuse the cached result of a near-identical page instead of OCRing it again (needs the cache)")
+    parser.add_argument('--dedup-threshold', type=float, default=DEDUP_MAX_DIFFERENCE,
+                        help=f"With --dedup, largest block difference (0-1) still treated as the same page (default: {DEDUP_MAX_DIFFERENCE:g})")
+
+def dedup_from_args(args):
+    return args.dedup_threshold if args.dedup and not args.no_cache else None
+
+def add_index_arguments(parser):
+    parser.add_argument('--index', default=str(SEARCH_INDEX_FILE), help=f"Full-text search index to add results to (default: {SEARCH_INDEX_FILE})")
+    parser.add_argument('--no-index', action='store_true', help="Do not add results to the search index")
+
+def index_from_args(args):
+    return None if args.no_index else args.index
+
+def build_arg_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog='ocr_gui.py', description="ANSNEW TECH Image2Text. Run without arguments to start the GUI.")
+    subparsers = parser.add_subparsers(dest='command')
+    batch = subparsers.add_parser('batch', help="OCR a directory or glob of images in parallel")
+    batch.add_argument('target', help="Directory, glob pattern or single image file")
+    batch.add_argument('--out', default='-', help="JSON lines output file (default: stdout)")
+    batch.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    batch.add_argument('--lang', default='eng', help=f"Tesseract language code, or '{AUTO_LANG}' to detect the script of each page (default: eng)")
+    batch.add_argument('--tesseract', default=None, help="Path to the tesseract executable")
+    add_model_arguments(batch)
+    batch.add_argument('--cache', default=str(OCR_CACHE_FILE), help=f"OCR result cache file (default: {OCR_CACHE_FILE})")
+    batch.add_argument('--no-cache', action='store_true', help="Do not read or write the OCR result cache")
+    add_dedup_arguments(batch)
+    add_index_arguments(batch)
+    batch.add_argument('--binarize', choices=['sauvola', 'otsu', 'fixed', 'none'], default=PREPROCESS_PARAMS['binarize'],
+                       help=f"Binarization method (default: {PREPROCESS_PARAMS['binarize']})")
+    batch.add_argument('--no-deskew', action='store_true', help="Skip skew correction")
+    batch.add_argument('--layout', action='store_true', help="OCR only detected text blocks, skipping blank areas")
+    batch.add_argument('--metrics', default=None, help="Write per-image timings to this JSON lines file, or a Prometheus dump if it ends in .prom")
+    batch.add_argument('--profile', default=None, metavar='DIR', help="Write a cProfile dump per image into DIR")
+    batch.add_argument('--shared', default=None, metavar='DIR',
+                       help="Share the work with other nodes running the same command against DIR (e.g. on NFS); "
+                            "results are merged into --out, or DIR/results.jsonl")
+    batch.add_argument('--node', default=None, help="Name of this node in lease files (default: <hostname>-<pid>)")
+    batch.add_argument('--chunk-size', type=int, default=SHARD_CHUNK_SIZE, help=f"With --shared, files per claimed chunk (default: {SHARD_CHUNK_SIZE})")
+    batch.add_argument('--lease', type=float, default=SHARD_LEASE_SECONDS,
+                       help=f"With --shared, seconds without a heartbeat before a chunk is reclaimed (default: {SHARD_LEASE_SECONDS:g})")
+    serve = subparsers.add_parser('serve', help="Run a local HTTP OCR service")
+    serve.add_argument('--host', default='127.0.0.1', help="Address to bind (default: 127.0.0.1)")
+    serve.add_argument('--port', type=int, default=8080, help="Port to listen on (default: 8080)")
+    serve.add_argument('--workers', type=int, default=2, help="Concurrent OCR jobs (default: 2)")
+    serve.add_argument('--queue', type=int, default=8, help="Jobs allowed to wait before answering 429 (default: 8)")
+    serve.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout in seconds (default: 60)")
+    serve.add_argument('--lang', default='eng', help=f"Default Tesseract language code, or '{AUTO_LANG}' (default: eng)")
+    serve.add_argument('--tesseract', default=None, help="Path to the tesseract executable")
+    add_model_arguments(serve)
+    serve.add_argument('--no-cache', action='store_true', help="Do not read or write the OCR result cache")
+    watch = subparsers.add_parser('watch', help="Keep OCRing images as they arrive in an inbox folder")
+    watch.add_argument('inbox', help="Folder to watch (recursively)")
+    watch.add_argument('--out', default=None, help="Folder for .txt/.json results, mirroring the inbox layout (default: next to each input)")
+    watch.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    watch.add_argument('--lang', default='eng', help=f"Tesseract language code, or '{AUTO_LANG}' to detect the script of each page (default: eng)")
+    watch.add_argument('--tesseract', default=None, help="Path to the tesseract executable")
+    add_model_arguments(watch)
+    watch.add_argument('--no-cache', action='store_true', help="Do not read or write the OCR result cache")
+    add_dedup_arguments(watch)
+    add_index_arguments(watch)
+    watch.add_argument('--layout', action='store_true', help="OCR only detected text blocks, skipping blank areas")
+    watch.add_argument('--manifest', default=None, help=f"Manifest database (default: <out>/{WATCH_MANIFEST_FILE})")
+    watch.add_argument('--poll', type=float, default=WATCH_POLL_SECONDS, help=f"Polling interval in seconds (default: {WATCH_POLL_SECONDS})")
+    watch.add_argument('--once', action='store_true', help="Process the current backlog and exit instead of watching")
+    prefetch = subparsers.add_parser('prefetch', help="Download language models ahead of time")
+    prefetch.add_argument('--langs', nargs='+', default=None, help="Language codes to fetch (default: all built-in languages)")
+    prefetch.add_argument('--best', action='store_true', help="Fetch the slower, more accurate tessdata_best models")
+    prefetch.add_argument('--parallel', type=int, default=LANGDATA_PARALLEL_DOWNLOADS,
+                          help=f"Concurrent downloads (default: {LANGDATA_PARALLEL_DOWNLOADS})")
+    prefetch.add_argument('--tessdata-dir', default=None,
+                          help="Directory holding .traineddata files (default: the tessdata directory of the Tesseract found, "
+                               "or tessdata_best next to it with --best)")
+    prefetch.add_argument('--tesseract', default=None, help="Path to the tesseract executable")
+    extract = subparsers.add_parser('extract', help="OCR one image, multi-page TIFF or PDF, streaming text page by page")
+    extract.add_argument('path', help="Image, TIFF or PDF file")
+    extract.add_argument('--out', default='-', help="Output file (default: stdout)")
+    extract.add_argument('--format', choices=['text'] + list(EXPORT_FORMATS), default='text',
+                         help="text, hOCR, ALTO XML, or a PDF with an invisible text layer (default: text)")
+    extract.add_argument('--lang', default='eng', help=f"Tesseract language code, or '{AUTO_LANG}' to detect the script of each page (default: eng)")
+    extract.add_argument('--tesseract', default=None, help="Path to the tesseract executable")
+    add_model_arguments(extract)
+    extract.add_argument('--no-cache', action='store_true', help="Do not read or write the OCR result cache")
+    add_dedup_arguments(extract)
+    add_index_arguments(extract)
+    extract.add_argument('--layout', action='store_true', help="OCR only detected text blocks, skipping blank areas")
+    extract.add_argument('--metrics', default=None, help="Write job timings to this JSON lines file, or a Prometheus dump if it ends in .prom")
+    extract.add_argument('--profile', default=None, metavar='FILE', help="Write a cProfile dump of the job to FILE")
+    search = subparsers.add_parser('search', help="Search the text of everything OCR'd so far")
+    search.add_argument('query', help='Words to find; FTS5 syntax such as "exact phrase", OR, NOT and prefix* also works')
+    search.add_argument('--index', default=str(SEARCH_INDEX_FILE), help=f"Search index file (default: {SEARCH_INDEX_FILE})")
+    search.add_argument('--limit', type=int, default=20, help="Maximum number of matches (default: 20)")
+    search.add_argument('--json', action='store_true', help="Print one JSON object per match")
+    return parser
+
+def cli_log(message):
+    print(message, file=sys.stderr, flush=True)
+
+def resolve_tesseract_cmd(explicit=None, log_callback=None):
+    """Pick the tesseract executable for headless commands.
+
+    Uses the same cached discovery as the GUI; None means rely on tesseract
+    being on PATH. Only Windows installs Tesseract when it is missing.
+    """
+    try:
+        info = load_tesseract_info(explicit)
+    except Exception as e:
+        if log_callback:
+            log_callback(f"Could not query Tesseract: {e}")
+        info = None
+    if info:
+        use_tesseract_info(info)
+        return info['path']
+    if explicit:
+        return explicit
+    if os.name == 'nt':
+        return ensure_tesseract_exists(log_callback)
+    if log_callback:
+        log_callback("Tesseract not found on PATH or in the usual locations; install it with your package manager.")
+    return None
+
+def run_cli(argv):
+    args = build_arg_parser().parse_args(argv)
+    if args.command != 'serve':
+        allow_large_images()
+    if args.command == 'batch':
+        tesseract_cmd = resolve_tesseract_cmd(args.tesseract, cli_log)
+        model = model_from_args(args)
+        ensure_model_langdata(args.lang, model, cli_log)
+        cli_log(f"OCR engine backend: {get_engine(tesseract_cmd).backend}, model: {model}")
+        start = time.perf_counter()
+        options = dict(workers=args.workers, lang_code=args.lang, tesseract_cmd=tesseract_cmd, cache_path=None if args.no_cache else args.cache,
+                       params={'binarize': args.binarize, 'deskew': not args.no_deskew, 'layout': args.layout},
+                       metrics_path=args.metrics, profile_dir=args.profile, log_callback=cli_log, model=model,
+                       dedup=dedup_from_args(args), index_path=index_from_args(args))
+        if args.shared:
+            try:
+                processed, failed, cached = run_shared_batch(args.target, args.shared, out_path=None if args.out == '-' else args.out,
+                                                             node=args.node, chunk_size=args.chunk_size, lease_seconds=args.lease,
+                                                             **options)
+            except Exception as e:
+                cli_log(f"Shared batch failed: {e}")
+                return 1
+        else:
+            processed, failed, cached = run_batch(args.target, args.out, **options)
+        elapsed = time.perf_counter() - start
+        rate = processed / elapsed if elapsed else 0.0
+        cli_log(f"Processed {processed} image(s), {failed} failed, {cached} from cache, in {elapsed:.1f}s ({rate:.2f} images/s)")
+        return 1 if failed else 0
+    if args.command == 'extract':
+        model = model_from_args(args)
+        engine = get_engine(resolve_tesseract_cmd(args.tesseract, cli_log), model)
+        ensure_model_langdata(args.lang, model, cli_log)
+        cache = None if args.no_cache else get_cache()
+        dedup = get_dedup_index(cache, args.dedup_threshold) if dedup_from_args(args) is not None else None
+        metrics = JobMetrics(args.path, profile=bool(args.profile))
+        pages = duplicates = 0
+        texts = []
+
+        def log_page(page):
+            nonlocal duplicates
+            duplicates += bool(page.get('duplicate'))
+            texts.append((page['page'], page['lang'], page['text']))
+            status = ' (near-duplicate)' if page.get('duplicate') else ' (cached)' if page['cached'] else ''
+            cli_log(f"Page {page['page']} done{status}")
+
+        binary = args.format == 'pdf'
+        if args.out == '-':
+            out = sys.stdout.buffer if binary else sys.stdout
+        else:
+            out = open(args.out, 'wb') if binary else open(args.out, 'w', encoding='utf-8')
+        try:
+            if args.format != 'text':
+                pages = export_document(args.path, out, args.format, args.lang, engine=engine, cache=cache,
+                                        params={'layout': args.layout}, timings=metrics.timings, page_callback=log_page,
+                                        dedup=dedup)
+            else:
+                for page in recognize_document(args.path, args.lang, engine=engine, cache=cache, params={'layout': args.layout},
+                                               timings=metrics.timings, dedup=dedup):
+                    with metrics.stage('output'):
+                        # Form feeds separate pages, as in pdftotext output
+                        out.write(page['text'] if page['page'] == 1 else '\f' + page['text'])
+                        out.flush()
+                    pages += 1
+                    log_page(page)
+        finally:
+            if args.out != '-':
+                out.close()
+        if index_from_args(args):
+            with metrics.stage('index'):
+                index = SearchIndex(args.index)
+                index.add_document(args.path, texts)
+                index.close()
+        metrics.finish(args.profile, pages=pages)
+        if args.metrics:
+            sink = MetricsSink(args.metrics)
+            sink.record(metrics.to_dict())
+            sink.close()
+        cli_log(f"{pages} page(s) in {metrics.seconds:.2f}s, peak RSS {metrics.peak_rss_kb} KB")
+        if isinstance(engine, TieredEngine):
+            cli_log(f"Tiers: {format_tier_stats(engine.stats())}")
+        if dedup is not None:
+            cli_log(f"Near-duplicate pages: {duplicates} engine call(s) saved")
+        return 0
+    if args.command == 'watch':
+        tesseract_cmd = resolve_tesseract_cmd(args.tesseract, cli_log)
+        model = model_from_args(args)
+        ensure_model_langdata(args.lang, model, cli_log)
+        try:
+            processed, failed = run_watch(args.inbox, args.out, workers=args.workers, lang_code=args.lang, tesseract_cmd=tesseract_cmd,
+                                          cache_path=None if args.no_cache else OCR_CACHE_FILE, params={'layout': args.layout},
+                                          manifest_path=args.manifest, poll=args.poll, once=args.once, log_callback=cli_log,
+                                          model=model, dedup=dedup_from_args(args), index_path=index_from_args(args))
+        except KeyboardInterrupt:
+            cli_log("Stopped.")
+            return 0
+        cli_log(f"Processed {processed} file(s), {failed} failed")
+        return 1 if failed else 0
+    if args.command == 'search':
+        index = SearchIndex(args.index)
+        try:
+            matches = index.search(args.query, limit=args.limit)
+            stats = index.stats()
+        finally:
+            index.close()
+        for match in matches:
+            print(json.dumps(match, ensure_ascii=False) if args.json else f"{match['path']}:{match['page']} [{match['lang']}] {match['snippet']}")
+        cli_log(f"{len(matches)} match(es) in {stats['documents']} document(s), {stats['pages']} page(s)")
+        return 0 if matches else 1
+    if args.command == 'prefetch':
+        # Models go next to the discovered Tesseract unless --tessdata-dir says otherwise
+        resolve_tesseract_cmd(args.tesseract, cli_log)
+        try:
+            results = prefetch_langdata(args.langs, use_best=args.best, workers=args.parallel,
+                                        tessdata_dir=args.tessdata_dir, log_callback=cli_log)
+        except Exception as e:
+            cli_log(f"Cannot prefetch language models: {e}. Install Tesseract or pass --tessdata-dir.")
+            return 1
+        return 1 if any(status.startswith('failed') for status in results.values()) else 0
+    if args.command == 'serve':
+        tesseract_cmd = resolve_tesseract_cmd(args.tesseract, cli_log)
+        model = model_from_args(args)
+        ensure_model_langdata(args.lang, model, cli_log)
+        run_service(args.host, args.port, workers=args.workers, queue_size=args.queue, timeout=args.timeout,
+                    lang_code=args.lang, tesseract_cmd=tesseract_cmd, cache_path=None if args.no_cache else OCR_CACHE_FILE,
+                    log_callback=cli_log, model=model)
+        return 0
+    build_arg_parser().print_help()
+    return 2
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_cli(argv)
+    allow_large_images()
+    import_tkinter()
     root = tk.Tk()
     app = OCRApp(root)
     root.mainloop()
+    return 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
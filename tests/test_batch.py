@@ -0,0 +1,71 @@
+import concurrent.futures
+import json
+import re
+
+from PIL import Image, ImageDraw
+
+import ocr_gui
+from test_tiling import InkEngine
+
+
+class WarmInkEngine(InkEngine):
+    def warm(self, lang_code):
+        pass
+
+
+def test_shared_run_keeps_one_pool_and_one_metrics_dump(tmp_path, monkeypatch):
+    inputs = tmp_path / 'inputs'
+    inputs.mkdir()
+    paths = []
+    for i in range(3):
+        img = Image.new('L', (400, 300), 255)
+        ImageDraw.Draw(img).rectangle((50, 50 + 20 * i, 350, 70 + 20 * i), fill=0)
+        paths.append(str(inputs / f'page{i}.png'))
+        img.save(paths[-1])
+    pools = []
+
+    class CountingPool(concurrent.futures.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', CountingPool)
+    # Workers are forked, so they pick up the stand-in engine
+    monkeypatch.setattr(ocr_gui, 'get_engine', lambda *args, **kwargs: WarmInkEngine())
+    monkeypatch.setattr(ocr_gui, 'ensure_model_langdata', lambda *args: None)
+    metrics = tmp_path / 'node.prom'
+    out = tmp_path / 'results.jsonl'
+    counts = ocr_gui.run_shared_batch(str(inputs), str(tmp_path / 'shared'), out_path=str(out), chunk_size=1, workers=1,
+                                      cache_path=None, metrics_path=str(metrics))
+    assert counts == (3, 0, 0)
+    assert len(pools) == 1
+    assert sorted(json.loads(line)['path'] for line in out.read_text().splitlines()) == paths
+    assert re.search(r'^ocr_jobs_total 3$', metrics.read_text(), re.M)
+
+
+def test_batch_command_writes_one_line_per_image(tmp_path, monkeypatch, capsys):
+    inputs = tmp_path / 'inputs'
+    (inputs / 'sub').mkdir(parents=True)
+    for name in ('a.png', 'sub/b.png', 'c.jpg'):
+        img = Image.new('RGB', (300, 200), 'white')
+        ImageDraw.Draw(img).rectangle((40, 80, 260, 100), fill='black')
+        img.save(inputs / name)
+    (inputs / 'broken.png').write_bytes(b'not an image')
+    (inputs / 'notes.txt').write_text('skipped')
+    monkeypatch.setattr(ocr_gui, 'get_engine', lambda *args, **kwargs: WarmInkEngine())
+    monkeypatch.setattr(ocr_gui, 'ensure_model_langdata', lambda *args: None)
+    monkeypatch.setattr(ocr_gui, 'resolve_tesseract_cmd', lambda *args: None)
+    # run_cli raises PIL's limit for the rest of the process
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
+    out = tmp_path / 'results.jsonl'
+    code = ocr_gui.run_cli(['batch', str(inputs), '--out', str(out), '--workers', '2', '--no-cache', '--no-index'])
+    results = {json.loads(line)['path']: json.loads(line) for line in out.read_text().splitlines()}
+    # One failed image fails the run, but every other image is still written
+    assert code == 1
+    assert sorted(results) == sorted(str(inputs / name) for name in ('a.png', 'sub/b.png', 'c.jpg', 'broken.png'))
+    assert results[str(inputs / 'broken.png')]['error']
+    for name in ('a.png', 'sub/b.png', 'c.jpg'):
+        assert results[str(inputs / name)]['error'] is None
+        assert results[str(inputs / name)]['text'].strip() == 'ink'
+        assert results[str(inputs / name)]['pages'] == 1
+    assert 'Processed 4 image(s), 1 failed, 0 from cache' in capsys.readouterr().err
@@ -0,0 +1,33 @@
+import bench
+
+
+def report(images_per_sec=10.0, cer=0.02, peak_rss_kb=100_000):
+    return {'runs': [{'workers': 1, 'images_per_sec': images_per_sec, 'cer': cer, 'peak_rss_kb': peak_rss_kb}],
+            'preprocess': {'p50_ms': 20.0}}
+
+
+def test_memory_growth_past_tolerance_is_a_regression():
+    baseline = report()
+    assert bench.compare(report(peak_rss_kb=120_000), baseline, 0.15, 0.01) == []
+    problems = bench.compare(report(peak_rss_kb=130_000), baseline, 0.15, 0.01)
+    assert len(problems) == 1 and 'peak RSS' in problems[0]
+    assert bench.compare(report(peak_rss_kb=130_000), baseline, 0.15, 0.01, rss_tolerance=0.5) == []
+
+
+class Stop(Exception):
+    pass
+
+
+def test_tesseract_is_discovered_before_models_are_fetched(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(bench.ocr_gui, 'resolve_tesseract_cmd', lambda explicit=None, log=None: calls.append('resolve'))
+
+    def ensure_langdata(lang, log=None):
+        calls.append('langdata')
+        raise Stop()
+    monkeypatch.setattr(bench.ocr_gui, 'ensure_langdata', ensure_langdata)
+    try:
+        bench.main(['--corpus', str(tmp_path / 'corpus'), '--count', '1'])
+    except Stop:
+        pass
+    assert calls == ['resolve', 'langdata']
@@ -0,0 +1,56 @@
+import itertools
+
+from PIL import Image, ImageDraw
+
+import ocr_gui
+from test_tiling import InkEngine
+
+
+def test_key_changes_with_every_input():
+    key = ocr_gui.OCRCache.make_key('abc', 'eng', {'deskew': True}, '5.3.0 fast')
+    assert key == ocr_gui.OCRCache.make_key('abc', 'eng', {'deskew': True}, '5.3.0 fast')
+    for other in (('abd', 'eng', {'deskew': True}, '5.3.0 fast'), ('abc', 'deu', {'deskew': True}, '5.3.0 fast'),
+                  ('abc', 'eng', {'deskew': False}, '5.3.0 fast'), ('abc', 'eng', {'deskew': True}, '5.3.1 fast'),
+                  ('abc', 'eng', {'deskew': True}, '5.3.0 best')):
+        assert ocr_gui.OCRCache.make_key(*other) != key
+
+
+def test_least_recently_used_results_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(ocr_gui.time, 'time', lambda: next(clock))
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db', max_bytes=350)
+    value = {'text': 'x' * 90}
+    for key in 'abc':
+        cache.put(key, value)
+    assert cache.get('a') == value  # 'b' is now the least recently used
+    assert cache.get('missing') is None
+    cache.put('d', value)
+    assert cache.get('b') is None
+    assert all(cache.get(key) == value for key in 'acd')
+    stats = cache.stats()
+    assert (stats['entries'], stats['evictions'], stats['hits'], stats['misses']) == (3, 1, 4, 2)
+    assert stats['bytes'] <= 350
+    cache.close()
+    # Entries survive a restart; counters are per process
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db', max_bytes=350)
+    assert cache.get('d') == value and cache.stats()['hits'] == 1
+    cache.close()
+
+
+def test_repeat_document_comes_from_the_cache(tmp_path):
+    img = Image.new('L', (600, 400), 255)
+    ImageDraw.Draw(img).rectangle((100, 150, 500, 180), fill=0)
+    path = tmp_path / 'invoice.png'
+    img.save(path)
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db')
+    engine = InkEngine()
+    first = list(ocr_gui.recognize_document(str(path), engine=engine, cache=cache))
+    calls = len(engine.images)
+    second = list(ocr_gui.recognize_document(str(path), engine=engine, cache=cache))
+    assert len(engine.images) == calls
+    assert [page['cached'] for page in first + second] == [False, True]
+    assert second[0]['text'] == first[0]['text']
+    # Different preprocessing is a different result
+    list(ocr_gui.recognize_document(str(path), engine=engine, cache=cache, params={'deskew': False}))
+    assert len(engine.images) > calls
+    cache.close()
@@ -0,0 +1,28 @@
+import pytest
+from PIL import Image
+
+import ocr_gui
+
+
+@pytest.fixture(autouse=True)
+def restore_pixel_limit(monkeypatch):
+    # run_cli raises PIL's limit for the rest of the process
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
+
+
+def test_prefetch_uses_the_discovered_tessdata(tmp_path, monkeypatch):
+    tessdata = tmp_path / 'tessdata'
+    tessdata.mkdir()
+    (tessdata / 'eng.traineddata').write_bytes(b'model')
+    for name in ('TESSDATA_DIR', 'TESSDATA_BEST_DIR', '_TESSERACT_INFO'):
+        monkeypatch.setattr(ocr_gui, name, getattr(ocr_gui, name))
+    info = {'path': '/usr/bin/tesseract', 'version': '5.3.0', 'tessdata_dir': str(tessdata), 'langs': ['eng']}
+    monkeypatch.setattr(ocr_gui, 'load_tesseract_info', lambda path=None: info)
+    assert ocr_gui.run_cli(['prefetch', '--langs', 'eng']) == 0
+    assert ocr_gui.TESSDATA_DIR == str(tessdata)
+
+
+def test_prefetch_without_tessdata_fails_cleanly(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(ocr_gui, 'load_tesseract_info', lambda path=None: None)
+    assert ocr_gui.run_cli(['prefetch', '--langs', 'eng', '--tessdata-dir', str(tmp_path / 'missing')]) == 1
+    assert 'Tessdata directory not found' in capsys.readouterr().err
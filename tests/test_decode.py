@@ -0,0 +1,142 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw, ImageFile
+
+import ocr_gui
+from test_tiling import InkEngine
+
+
+def fax_page(width=4960, height=7016):
+    """An A4 page scanned bilevel at 600 DPI."""
+    img = Image.new('1', (width, height), 1)
+    draw = ImageDraw.Draw(img)
+    for top in range(600, height - 600, 120):
+        draw.rectangle((600, top, width - 600, top + 40), fill=0)
+    return img
+
+
+class ScriptEngine:
+    def warm(self, lang_code):
+        pass
+
+    def detect_script(self, img):
+        self.size = img.size
+        return {'script': 'Latin', 'script_confidence': 9.0, 'orientation': 0, 'orientation_confidence': 9.0}
+
+
+def test_group4_tiff_at_600_dpi_is_reduced(tmp_path):
+    path = tmp_path / 'fax.tif'
+    fax_page().save(path, compression='group4', dpi=(600, 600))
+    pages = list(ocr_gui.iter_document_pages(str(path), 300))
+    img = pages[0][1]()
+    assert img.size == (2480, 3508)
+    assert ocr_gui.image_dpi(img) == 300
+
+
+def test_multi_page_group4_tiff_is_reduced(tmp_path):
+    path = tmp_path / 'fax.tif'
+    fax_page().save(path, compression='group4', dpi=(600, 600), save_all=True, append_images=[fax_page()])
+    sizes = [load().size for _, load in ocr_gui.iter_document_pages(str(path), 300)]
+    assert sizes == [(2480, 3508), (2480, 3508)]
+
+
+def test_detect_language_accepts_bilevel_and_palette_pages():
+    engine = ScriptEngine()
+    for img in (fax_page(), fax_page().convert('P')):
+        assert ocr_gui.detect_language(engine, img)['lang'] == 'eng'
+        assert engine.size[0] < img.width
+
+
+def test_import_keeps_pils_decompression_bomb_limit():
+    assert Image.MAX_IMAGE_PIXELS != ocr_gui.MAX_DECODE_PIXELS
+
+
+def test_service_refuses_oversized_pages_before_decoding():
+    service = ocr_gui.OCRService(ScriptEngine(), workers=1, max_pixels=20_000_000)
+    buffer = BytesIO()
+    fax_page().save(buffer, format='TIFF', compression='group4', dpi=(600, 600))
+    assert '4960x7016' in service.oversized(buffer.getvalue())
+    buffer = BytesIO()
+    Image.new('L', (2480, 3508), 255).save(buffer, format='PNG')
+    assert service.oversized(buffer.getvalue()) is None
+    service.shutdown()
+
+
+def test_pdf_pages_are_rendered_one_at_a_time_across_threads(tmp_path, monkeypatch):
+    import threading
+    import time
+    pypdfium2 = pytest.importorskip('pypdfium2')
+    paths = []
+    for i in range(4):
+        paths.append(str(tmp_path / f'doc{i}.pdf'))
+        fax_page(850, 1100).convert('L').save(paths[-1], resolution=100, save_all=True, append_images=[fax_page(850, 1100)])
+    render = pypdfium2.PdfPage.render
+    active, overlaps = [0], []
+
+    def watched_render(self, *args, **kwargs):
+        active[0] += 1
+        overlaps.append(active[0])
+        time.sleep(0.01)
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            active[0] -= 1
+    monkeypatch.setattr(pypdfium2.PdfPage, 'render', watched_render)
+    sizes = []
+
+    def job(path):
+        assert ocr_gui.count_document_pages(path) == 2
+        sizes.extend(load().size for _, load in ocr_gui.iter_document_pages(path, 150))
+    threads = [threading.Thread(target=job, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(sizes) == 8 and max(overlaps) == 1
+
+
+def test_long_documents_are_decoded_a_few_pages_ahead(tmp_path, monkeypatch):
+    import time
+    page = Image.new('L', (600, 400), 255)
+    ImageDraw.Draw(page).rectangle((100, 150, 500, 170), fill=0)
+    path = tmp_path / 'long.tif'
+    page.save(path, save_all=True, append_images=[page] * 11)
+    iter_pages = ocr_gui.iter_document_pages
+    decoded = []
+
+    def counted(path, target_dpi):
+        for page_no, load in iter_pages(path, target_dpi):
+            yield page_no, lambda load=load, page_no=page_no: (decoded.append(page_no), load())[1]
+    monkeypatch.setattr(ocr_gui, 'iter_document_pages', counted)
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db')
+    pages = ocr_gui.recognize_document(str(path), engine=InkEngine(), cache=cache, prefetch=2)
+    assert next(pages)['page'] == 1
+    time.sleep(0.2)
+    # The page being handed over, the queue and the one waiting to be queued
+    assert len(decoded) <= 4
+    assert [page['page'] for page in pages] == list(range(2, 13))
+    assert decoded == list(range(1, 13))
+    # Cached pages are not decoded at all
+    assert all(page['cached'] for page in ocr_gui.recognize_document(str(path), engine=InkEngine(), cache=cache))
+    assert len(decoded) == 12
+    cache.close()
+
+
+def test_high_dpi_jpeg_is_decoded_at_reduced_scale(tmp_path, monkeypatch):
+    path = tmp_path / 'scan.jpg'
+    fax_page(2480, 3508).convert('L').save(path, dpi=(600, 600), quality=80)
+    loads = []
+    load = ImageFile.ImageFile.load
+
+    def watched_load(self):
+        loads.append(self.size)
+        return load(self)
+    monkeypatch.setattr(ImageFile.ImageFile, 'load', watched_load)
+    img = ocr_gui.open_for_ocr(str(path), 300)
+    # Draft mode decodes the JPEG straight at half size; the full image is never materialised
+    assert img.size == (1240, 1754) and loads == [(1240, 1754)]
+    assert ocr_gui.image_dpi(img) == 300
+    # At the target DPI already, nothing is reduced
+    fax_page(1240, 1754).convert('L').save(path, dpi=(300, 300))
+    assert ocr_gui.open_for_ocr(str(path), 300).size == (1240, 1754)
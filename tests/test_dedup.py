@@ -0,0 +1,68 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import ocr_gui
+from test_tiling import InkEngine
+
+
+def sparse_page(lines):
+    """A receipt-like page: a few short lines on an otherwise blank A4 sheet (well under 1% ink)."""
+    img = Image.new('L', (2480, 3508), 255)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=36)
+    for i, line in enumerate(lines):
+        draw.text((300, 400 + 60 * i), line, fill=0, font=font)
+    return img
+
+
+def ink_fraction(img):
+    return float((np.asarray(img) < 128).mean())
+
+
+def test_sparse_pages_get_distinct_fingerprints():
+    invoice = sparse_page(["INVOICE 2291", "Total 118.40"])
+    receipt = sparse_page(["Corner Shop", "2x milk 3.10", "Paid card"])
+    assert ink_fraction(invoice) < 0.01 and ink_fraction(receipt) < 0.01
+    a, b = ocr_gui.page_fingerprint(invoice), ocr_gui.page_fingerprint(receipt)
+    assert a is not None and b is not None
+    assert a[0] not in (0, ocr_gui.DEDUP_DEGENERATE_HASH)
+    assert a[0] != b[0] or ocr_gui.thumb_difference(a[1], b[1]) > ocr_gui.DEDUP_MAX_DIFFERENCE
+
+
+def test_different_sparse_pages_do_not_match(tmp_path):
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db')
+    index = ocr_gui.NearDuplicateIndex(cache)
+    invoice = sparse_page(["INVOICE 2291", "Total 118.40"])
+    cache.put('invoice', {'text': 'INVOICE 2291'})
+    index.add('ctx', ocr_gui.page_fingerprint(invoice), 'invoice')
+    receipt = sparse_page(["Corner Shop", "2x milk 3.10", "Paid card"])
+    assert index.find('ctx', ocr_gui.page_fingerprint(receipt)) is None
+    # A re-encoded copy of the same sparse page still matches
+    copy = invoice.point(lambda v: v * 0.9 + 20)
+    assert index.find('ctx', ocr_gui.page_fingerprint(copy)) == 'invoice'
+    cache.close()
+
+
+def test_blank_page_has_no_fingerprint():
+    assert ocr_gui.page_fingerprint(Image.new('L', (1700, 2200), 255)) is None
+    assert ocr_gui.page_fingerprint(Image.new('1', (1700, 2200), 1)) is None
+
+
+def test_recopied_page_reuses_the_stored_result(tmp_path):
+    original = sparse_page(["INVOICE 2291", "Total 118.40", "Due 2024-05-01", "Acme Supplies Ltd"])
+    original.save(tmp_path / 'scan.png')
+    # The same page again as a re-encoded, slightly lighter JPEG, and a genuinely different page
+    original.point(lambda v: v * 0.95 + 10).save(tmp_path / 'copy.jpg', quality=85)
+    sparse_page(["INVOICE 2292", "Total 97.15", "Due 2024-06-01", "Acme Supplies Ltd"]).save(tmp_path / 'other.png')
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db')
+    index = ocr_gui.NearDuplicateIndex(cache)
+    engine = InkEngine()
+    results = {}
+    for name in ('scan.png', 'copy.jpg', 'other.png'):
+        calls = len(engine.images)
+        page, = ocr_gui.recognize_document(str(tmp_path / name), engine=engine, cache=cache, dedup=index)
+        results[name] = (page.get('duplicate', False), len(engine.images) > calls, page['text'])
+    assert results['scan.png'][:2] == (False, True)
+    assert results['copy.jpg'] == (True, False, results['scan.png'][2])
+    assert results['other.png'][:2] == (False, True)
+    cache.close()
@@ -0,0 +1,60 @@
+import os
+import stat
+import subprocess
+import sys
+
+import ocr_gui
+
+
+def fake_tesseract(tmp_path, version='5.3.4'):
+    """A tesseract stand-in answering --version and --list-langs, counting how often it is run."""
+    tessdata = tmp_path / 'tessdata'
+    tessdata.mkdir(exist_ok=True)
+    (tessdata / 'eng.traineddata').write_bytes(b'model')
+    runs = tmp_path / 'runs'
+    script = tmp_path / 'tesseract'
+    script.write_text(f'''#!{sys.executable}
+import os, sys
+with open({str(runs)!r}, 'a') as f:
+    f.write(sys.argv[1] + '\\n')
+if sys.argv[1] == '--version':
+    print('tesseract {version}')
+    print(' leptonica-1.82.0')
+else:
+    print('List of available languages in "{tessdata}/" (%d):' % len(os.listdir({str(tessdata)!r})))
+    for name in sorted(os.listdir({str(tessdata)!r})):
+        print(name.split('.')[0])
+''')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script), tessdata, runs
+
+
+def test_discovery_is_reused_until_tesseract_or_its_models_change(tmp_path):
+    command, tessdata, runs = fake_tesseract(tmp_path)
+    info_file = tmp_path / 'info.json'
+    info = ocr_gui.load_tesseract_info(command, info_file)
+    assert (info['version'], info['tessdata_dir'], info['langs']) == ('5.3.4', str(tessdata), ['eng'])
+    probes = runs.read_text()
+    assert ocr_gui.load_tesseract_info(command, info_file) == info
+    assert runs.read_text() == probes
+    # A new model changes the tessdata directory's mtime
+    (tessdata / 'ben.traineddata').write_bytes(b'model')
+    os.utime(tessdata, (1, 1))
+    assert ocr_gui.load_tesseract_info(command, info_file)['langs'] == ['ben', 'eng']
+    assert len(runs.read_text().splitlines()) == 4
+    # So does upgrading the executable
+    fake_tesseract(tmp_path, version='5.4.0')
+    assert ocr_gui.load_tesseract_info(command, info_file)['version'] == '5.4.0'
+
+
+def test_unwritable_info_file_still_discovers(tmp_path):
+    command, _, _ = fake_tesseract(tmp_path)
+    (tmp_path / 'home').write_text('not a directory')
+    assert ocr_gui.load_tesseract_info(command, tmp_path / 'home' / 'info.json')['path'] == command
+
+
+def test_import_does_not_load_tk_or_requests():
+    code = "import sys, ocr_gui; print(sorted({'tkinter', 'requests'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(ocr_gui.__file__))).stdout
+    assert output.strip() == '[]'
@@ -0,0 +1,198 @@
+import gzip
+import hashlib
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import ocr_gui
+
+PAYLOAD = random.Random(0).randbytes(300_000)
+
+
+class ModelServer:
+    """Serves PAYLOAD on localhost, cutting the first transfer off part way and optionally ignoring Range,
+    leaving Content-Range off 416 responses, or gzipping whatever the client accepts."""
+
+    def __init__(self, cut_at=100_000, ranges=True, range_size=True, compress=False):
+        self.cut_at = cut_at
+        self.ranges = ranges
+        self.range_size = range_size
+        self.compress = compress
+        self.requests = []
+        self.encodings = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requested = self.headers.get('Range')
+                server.requests.append(requested)
+                server.encodings.append(self.headers.get('Accept-Encoding'))
+                start = int(requested[len('bytes='):].rstrip('-')) if requested and server.ranges else 0
+                if start >= len(PAYLOAD):
+                    self.send_response(416)
+                    if server.range_size:
+                        self.send_header('Content-Range', f'bytes */{len(PAYLOAD)}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = PAYLOAD[start:]
+                self.send_response(206 if start else 200)
+                if start:
+                    self.send_header('Content-Range', f'bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}')
+                if server.compress:
+                    body = gzip.compress(body)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if len(server.requests) == 1 and server.cut_at:
+                    # Drop the connection mid-transfer, as a killed server or flaky link would
+                    self.wfile.write(body[:server.cut_at])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/eng.traineddata'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ocr_gui.time, 'sleep', lambda seconds: None)
+
+
+def test_killed_transfer_resumes_from_the_partial_file(tmp_path, no_backoff):
+    server = ModelServer()
+    dest = str(tmp_path / 'eng.traineddata')
+    try:
+        with pytest.raises(Exception):
+            ocr_gui.download_file(server.url, dest, retries=0)
+        # Only whole chunks read before the cut reach the partial file
+        kept = (tmp_path / 'eng.traineddata.part').stat().st_size
+        assert 0 < kept <= 100_000
+        ocr_gui.download_file(server.url, dest, sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    finally:
+        server.close()
+    assert server.requests == [None, f'bytes={kept}-']
+    assert (tmp_path / 'eng.traineddata').read_bytes() == PAYLOAD
+    assert not (tmp_path / 'eng.traineddata.part').exists()
+
+
+def test_server_ignoring_range_restarts_from_zero(tmp_path, no_backoff):
+    server = ModelServer(ranges=False)
+    dest = str(tmp_path / 'eng.traineddata')
+    try:
+        ocr_gui.download_file(server.url, dest, sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    finally:
+        server.close()
+    # The retry asked for the rest, got a 200 with the whole file and must not append it
+    assert server.requests[0] is None and server.requests[1].startswith('bytes=')
+    assert len(server.requests) == 2
+    assert (tmp_path / 'eng.traineddata').read_bytes() == PAYLOAD
+
+
+def test_checksum_mismatch_leaves_nothing_behind(tmp_path, no_backoff):
+    server = ModelServer(cut_at=0)
+    dest = str(tmp_path / 'eng.traineddata')
+    try:
+        with pytest.raises(Exception, match='SHA-256 mismatch'):
+            ocr_gui.download_file(server.url, dest, sha256=hashlib.sha256(b'other').hexdigest())
+    finally:
+        server.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('range_size', [True, False])
+def test_complete_partial_file_is_accepted_on_416_only_when_confirmed(tmp_path, no_backoff, range_size):
+    server = ModelServer(cut_at=0, range_size=range_size)
+    dest = str(tmp_path / 'eng.traineddata')
+    (tmp_path / 'eng.traineddata.part').write_bytes(PAYLOAD)
+    try:
+        # Confirmed by Content-Range's full size, or else by the checksum
+        ocr_gui.download_file(server.url, dest, sha256=None if range_size else hashlib.sha256(PAYLOAD).hexdigest())
+    finally:
+        server.close()
+    assert server.requests == [f'bytes={len(PAYLOAD)}-']
+    assert (tmp_path / 'eng.traineddata').read_bytes() == PAYLOAD
+
+
+@pytest.mark.parametrize('range_size', [True, False])
+def test_stale_oversized_partial_file_is_discarded_on_416(tmp_path, no_backoff, range_size):
+    server = ModelServer(cut_at=0, range_size=range_size)
+    dest = str(tmp_path / 'eng.traineddata')
+    (tmp_path / 'eng.traineddata.part').write_bytes(b'an older, larger model' + PAYLOAD)
+    try:
+        ocr_gui.download_file(server.url, dest)
+    finally:
+        server.close()
+    assert server.requests == [f'bytes={len(PAYLOAD) + 22}-', None]
+    assert (tmp_path / 'eng.traineddata').read_bytes() == PAYLOAD
+
+
+def test_compressed_transfer_is_restarted_rather_than_resumed(tmp_path, no_backoff):
+    server = ModelServer(cut_at=50_000, compress=True)
+    dest = str(tmp_path / 'eng.traineddata')
+    try:
+        ocr_gui.download_file(server.url, dest, sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    finally:
+        server.close()
+    # Decoded bytes cannot be resumed with a byte Range of the compressed stream
+    assert server.requests == [None, None]
+    assert set(server.encodings) == {'identity'}
+    assert (tmp_path / 'eng.traineddata').read_bytes() == PAYLOAD
+
+
+def test_missing_models_are_fetched_in_parallel(tmp_path, monkeypatch, no_backoff):
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            lang_code = self.path.strip('/').split('.')[0]
+            if lang_code == 'xyz':
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            with lock:
+                active.append(lang_code)
+                peak[0] = max(peak[0], len(active))
+            body = lang_code.encode() * 50_000
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            threading.Event().wait(0.3)
+            self.wfile.write(body)
+            with lock:
+                active.remove(lang_code)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(ocr_gui, 'TESSDATA_URL', f'http://127.0.0.1:{httpd.server_address[1]}/{{lang_code}}.traineddata')
+    (tmp_path / 'eng.traineddata').write_bytes(b'already here')
+    messages = []
+    try:
+        results = ocr_gui.prefetch_langdata(['eng', 'ben', 'hin', 'ara', 'xyz', 'ben'], workers=3, tessdata_dir=str(tmp_path),
+                                            log_callback=messages.append)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert {lang: status.split(':')[0] for lang, status in results.items()} == {
+        'eng': 'present', 'ben': 'installed', 'hin': 'installed', 'ara': 'installed', 'xyz': 'failed'}
+    assert peak[0] == 3
+    assert (tmp_path / 'hin.traineddata').read_bytes() == b'hin' * 50_000
+    assert (tmp_path / 'eng.traineddata').read_bytes() == b'already here'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['ara.traineddata', 'ben.traineddata', 'eng.traineddata', 'hin.traineddata']
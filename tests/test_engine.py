@@ -0,0 +1,140 @@
+import json
+import stat
+import sys
+import tempfile
+import types
+
+import pytest
+from PIL import Image
+
+import ocr_gui
+
+TSV = '\n'.join([
+    'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext',
+    '1\t1\t0\t0\t0\t0\t0\t0\t200\t100\t-1\t',
+    '5\t1\t1\t1\t1\t1\t10\t10\t40\t12\t91.5\tHello',
+    '5\t1\t1\t1\t1\t2\t60\t10\t50\t12\t88.5\tworld',
+    '5\t1\t1\t1\t2\t1\t10\t30\t30\t12\t80\tnext',
+    '5\t1\t1\t1\t2\t2\t50\t30\t5\t12\t95\t ',
+    '5\t1\t2\t1\t1\t1\t10\t60\t60\t12\t70\tpara',
+])
+
+
+def fake_tesseract(tmp_path, exit_code=0, output=TSV):
+    """A tesseract stand-in that records its argv and the PGM header it was piped, then prints output."""
+    log = tmp_path / 'calls.jsonl'
+    script = tmp_path / 'tesseract'
+    script.write_text(f'''#!{sys.executable}
+import json, sys
+data = sys.stdin.buffer.read()
+header = data.split(b'\\n', 3)
+with open({str(log)!r}, 'a') as f:
+    f.write(json.dumps({{'argv': sys.argv[1:], 'header': [h.decode() for h in header[:3]], 'pixels': len(header[3])}}) + '\\n')
+if {exit_code}:
+    sys.stderr.write('Error opening data file eng.traineddata')
+    sys.exit({exit_code})
+sys.stdout.write({output!r})
+''')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script), log
+
+
+@pytest.fixture
+def cli_engine(tmp_path):
+    def make(**kwargs):
+        engine = ocr_gui.OCREngine(**kwargs)
+        engine._tesserocr = None  # Exercise the pipe backend even where tesserocr is installed
+        return engine
+    return make
+
+
+def test_cli_backend_pipes_a_pgm_and_parses_tsv(tmp_path, cli_engine):
+    command, log = fake_tesseract(tmp_path)
+    engine = cli_engine(tesseract_cmd=command, tessdata_dir=str(tmp_path))
+    assert engine.backend == 'tesseract-cli'
+    result = engine.recognize(Image.new('RGB', (200, 100), 'white'), 'deu', psm=6)
+    call = json.loads(log.read_text())
+    assert call['argv'] == ['stdin', 'stdout', '-l', 'deu', '--psm', '6', 'tsv', '--tessdata-dir', str(tmp_path)]
+    # Converted to 8-bit grayscale in memory, no temp file or PNG involved
+    assert call['header'] == ['P5', '200 100', '255'] and call['pixels'] == 200 * 100
+    assert result['text'] == 'Hello world\nnext\n\npara\n'
+    assert result['words'] == 4
+    assert result['confidence'] == 82.5
+    assert result['layout']['width'] == 200
+
+
+def test_cli_backend_surfaces_tesseract_errors(tmp_path, cli_engine):
+    command, _ = fake_tesseract(tmp_path, exit_code=1)
+    with pytest.raises(Exception, match='Tesseract failed \\(1\\): Error opening data file'):
+        cli_engine(tesseract_cmd=command).recognize(Image.new('L', (20, 20), 255))
+
+
+def test_get_engine_keeps_one_engine_per_model(monkeypatch):
+    monkeypatch.setattr(ocr_gui, '_ENGINES', {})
+    fast = ocr_gui.get_engine('/opt/tesseract', 'fast')
+    assert ocr_gui.get_engine() is fast and fast.tesseract_cmd == '/opt/tesseract'
+    assert ocr_gui.get_engine(model='best') is not fast
+    tiered = ocr_gui.get_engine(model='tiered@60')
+    assert tiered.fast is fast and tiered.threshold == 60.0
+
+
+class FakeAPI:
+    """Records what a PyTessBaseAPI is handed."""
+    created = []
+
+    def __init__(self, lang, path=None):
+        self.lang = lang
+        self.images = []
+        FakeAPI.created.append(self)
+
+    def SetPageSegMode(self, psm):
+        self.psm = psm
+
+    def SetImageBytes(self, data, width, height, bytes_per_pixel, stride):
+        self.images.append((bytes(data), width, height, bytes_per_pixel, stride))
+
+    def Recognize(self):
+        pass
+
+    def GetUTF8Text(self):
+        return ''
+
+    def GetIterator(self):
+        return None
+
+    def End(self):
+        pass
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', '1', 'P'])
+def test_raw_gray_buffer_is_8_bit_rows(mode):
+    img = Image.new('L', (7, 3), 255)
+    img.putpixel((2, 1), 0)
+    data, width, height, stride = ocr_gui.raw_gray_buffer(img.convert(mode))
+    assert (width, height, stride) == (7, 3, 7)
+    assert data == bytes([255] * 9 + [0] + [255] * 11)
+
+
+def test_images_reach_the_engine_without_encoding(tmp_path, monkeypatch, cli_engine):
+    def refuse(*args, **kwargs):
+        raise AssertionError('image was encoded or written to disk')
+    monkeypatch.setattr(Image.Image, 'save', refuse)
+    monkeypatch.setattr(tempfile, 'NamedTemporaryFile', refuse)
+    monkeypatch.setattr(tempfile, 'mkstemp', refuse)
+    img = Image.new('RGB', (64, 32), 'white')
+    # In-process binding: one API per language, reused, handed the buffer directly
+    binding = types.SimpleNamespace(PyTessBaseAPI=FakeAPI, RIL=None, iterate_level=None)
+    monkeypatch.setitem(sys.modules, 'tesserocr', binding)
+    FakeAPI.created = []
+    engine = ocr_gui.OCREngine(tessdata_dir=str(tmp_path))
+    engine._tesserocr = binding
+    engine.recognize(img, 'eng')
+    engine.recognize(img, 'eng', psm=6)
+    assert len(FakeAPI.created) == 1
+    api = FakeAPI.created[0]
+    assert (api.lang, api.psm) == ('eng', 6)
+    assert api.images == [(bytes([255]) * 64 * 32, 64, 32, 1, 64)] * 2
+    # Pipe fallback
+    command, log = fake_tesseract(tmp_path)
+    cli_engine(tesseract_cmd=command).recognize(img)
+    assert json.loads(log.read_text())['pixels'] == 64 * 32
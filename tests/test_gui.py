@@ -0,0 +1,138 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from PIL import Image, ImageDraw
+
+import ocr_gui
+from test_tiling import InkEngine
+
+
+class FakeApp:
+    """Just enough of OCRApp to run its background setup task without a display."""
+    def __init__(self):
+        self.messages = []
+        self.ui_calls = []
+        self.done = threading.Event()
+
+    def log(self, message):
+        self.messages.append(message)
+
+    def call_in_ui(self, fn, *args):
+        self.ui_calls.append((fn, args))
+        self.done.set()
+
+    def show_setup_modal(self):
+        raise AssertionError('the blocking setup modal is for the Windows installer only')
+
+
+def test_missing_tesseract_outside_windows_shows_install_hint(monkeypatch):
+    monkeypatch.setattr(ocr_gui.os, 'name', 'posix')
+    monkeypatch.setattr(ocr_gui, 'load_tesseract_info', lambda path=None: None)
+    # Tk is only imported when the GUI starts
+    monkeypatch.setattr(ocr_gui, 'messagebox', SimpleNamespace(showwarning=lambda *args: None))
+    app = FakeApp()
+    ocr_gui.OCRApp.auto_setup_tesseract(app)
+    assert app.done.wait(5)
+    (fn, args), = app.ui_calls
+    assert fn is ocr_gui.messagebox.showwarning
+    assert 'apt install tesseract-ocr' in args[1]
+    assert app.messages == [ocr_gui.TESSERACT_INSTALL_HINT]
+
+
+def test_poll_events_survives_failing_callbacks_and_events():
+    import queue
+    app = FakeApp()
+    app.ui_calls = queue.Queue()
+    app.jobs = SimpleNamespace(events=queue.Queue())
+    scheduled, handled = [], []
+    app.root = SimpleNamespace(after=lambda ms, fn: scheduled.append(fn))
+    app.poll_events = lambda: None
+
+    def handle_job_event(kind, job_id, payload):
+        if kind == 'page':
+            raise ValueError('bad page')
+        handled.append(kind)
+    app.handle_job_event = handle_job_event
+    app.ui_calls.put((lambda: 1 / 0, ()))
+    app.ui_calls.put((app.log, ('after the failure',)))
+    for kind in ('started', 'page', 'done'):
+        app.jobs.events.put((kind, 1, None))
+    ocr_gui.OCRApp.poll_events(app)
+    assert handled == ['started', 'done']
+    assert 'after the failure' in app.messages
+    assert any('page event of job 1 failed' in message for message in app.messages)
+    assert len(scheduled) == 1
+
+
+class SlowEngine(InkEngine):
+    """Records how many recognitions overlap and waits on each one until released."""
+    def __init__(self):
+        super().__init__()
+        self.running = 0
+        self.peak = 0
+        self.release = threading.Semaphore(0)
+        self.lock = threading.Lock()
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.release.acquire(timeout=10)
+        with self.lock:
+            self.running -= 1
+        return super().recognize(img, lang_code, psm)
+
+
+def job_events(jobs, count):
+    """Collect events until count jobs have finished one way or another, keyed by job."""
+    events = {}
+    finished = 0
+    while finished < count:
+        kind, job_id, payload = jobs.events.get(timeout=10)
+        events.setdefault(job_id, []).append(kind)
+        finished += kind in ('done', 'failed', 'cancelled')
+    return events
+
+
+def test_job_queue_bounds_concurrency_and_cancels_between_pages(tmp_path, monkeypatch):
+    paths = []
+    for i in range(4):
+        page = Image.new('L', (400, 300), 255)
+        ImageDraw.Draw(page).rectangle((50, 50 + 40 * i, 350, 70 + 40 * i), fill=0)
+        paths.append(tmp_path / f'page{i}.png')
+        page.save(paths[-1])
+    document = tmp_path / 'document.tif'
+    page.save(document, save_all=True, append_images=[page] * 4)
+    engine = SlowEngine()
+    monkeypatch.setattr(ocr_gui, 'ensure_model_langdata', lambda *args: None)
+    monkeypatch.setattr(ocr_gui, 'get_engine', lambda *args: engine)
+    monkeypatch.setattr(ocr_gui, 'get_cache', lambda: ocr_gui.OCRCache(tmp_path / 'cache.db'))
+    jobs = ocr_gui.OCRJobQueue(max_concurrent=2)
+    ids = [jobs.submit(str(path)) for path in paths[:3]]
+    missing = jobs.submit(str(tmp_path / 'missing.png'))
+    deadline = time.monotonic() + 10
+    while engine.running < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert engine.running == 2
+    for _ in range(3):
+        engine.release.release()
+    events = job_events(jobs, 4)
+    assert engine.peak == 2
+    assert all(events[job_id] == ['started', 'log', 'page', 'done'] for job_id in ids)
+    assert events[missing][-1] == 'failed'
+    # A cancelled document stops after the page in progress
+    job_id = jobs.submit(str(document))
+    kind = None
+    while kind != 'page':
+        kind, _, _ = jobs.events.get(timeout=10)
+        if kind == 'started':
+            engine.release.release()
+    jobs.cancel(job_id)
+    for _ in range(4):
+        engine.release.release()
+    events = job_events(jobs, 1)
+    assert events[job_id][-1] == 'cancelled'
+    assert events[job_id].count('page') <= 2
+    jobs.shutdown()
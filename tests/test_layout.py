@@ -0,0 +1,178 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import ocr_gui
+from test_tiling import InkEngine
+
+
+def text_page(width, height, angle=0.0, dpi=300):
+    """Small print in a block with a margin, optionally skewed, and its ink bounding box."""
+    img = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=12)
+    for top in range(height // 5, height * 3 // 5, 24):
+        draw.text((width // 5, top), 'the quick brown fox jumps over the lazy dog', fill=0, font=font)
+    if angle:
+        img = img.rotate(angle, resample=Image.BICUBIC, fillcolor=255)
+    ys, xs = np.nonzero(np.asarray(img) < 128)
+    img.info['dpi'] = (dpi, dpi)
+    return img, (xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+
+
+def assert_near(box, expected, tolerance):
+    left, top, width, height = box
+    assert np.allclose((left, top, left + width, top + height), expected, atol=tolerance), (box, expected)
+
+
+def test_geometry_maps_preprocessed_boxes_to_the_input():
+    img, ink = text_page(1200, 1000, angle=2.0)
+    geometry = {}
+    prepared = ocr_gui.preprocess_image(img, geometry=geometry)
+    assert prepared.size != img.size
+    engine = InkEngine()
+    layout = ocr_gui.PageLayout.from_dict(engine.recognize(prepared)['layout'])
+    mapped = layout.mapped(geometry['to_source'], img.width, img.height)
+    assert_near(mapped.word_boxes[0].tolist(), ink, 12)
+
+
+def test_tiled_and_whole_pages_share_page_coordinates(tmp_path):
+    img, ink = text_page(1600, 1200)
+    path = tmp_path / 'page.png'
+    img.save(path, dpi=(300, 300))
+    for tile_pixels in (4_000_000, 1_000_000):
+        params = {'tile_pixels': tile_pixels, 'tile_size': 700}
+        page, = ocr_gui.recognize_document(str(path), engine=InkEngine(), params=params)
+        layout = ocr_gui.PageLayout.from_dict(page['layout'])
+        assert (layout.width, layout.height) == img.size
+        boxes = layout.word_boxes
+        union = (boxes[:, 0].min(), boxes[:, 1].min(), (boxes[:, 0] + boxes[:, 2]).max(), (boxes[:, 1] + boxes[:, 3]).max())
+        assert np.allclose(union, ink, atol=6), (tile_pixels, union, ink)
+
+
+def test_pdf_page_is_the_decoded_image_at_its_dpi(tmp_path):
+    img, _ = text_page(1275, 1650, dpi=150)
+    path = tmp_path / 'page.png'
+    img.save(path, dpi=(150, 150))
+    out = tmp_path / 'page.pdf'
+    with open(out, 'wb') as f:
+        ocr_gui.export_document(str(path), f, 'pdf', engine=InkEngine())
+    data = out.read_bytes()
+    # 8.5 x 11 in at 150 DPI is US Letter (PNG stores DPI as pixels per metre, hence the tolerance)
+    width, height = map(float, re.search(rb'/MediaBox \[0 0 ([\d.]+) ([\d.]+)\]', data).groups())
+    assert abs(width - 612) < 0.1 and abs(height - 792) < 0.1
+    assert b'/Width 1275 /Height 1650 /ColorSpace /DeviceGray /BitsPerComponent 8' in data
+
+
+def word_block(lines=6, words=8, word_gap=40):
+    """Lines of word-shaped boxes with a thin descender sliver under each word."""
+    img = Image.new('L', (200 + words * (160 + word_gap), 200 + lines * 60), 255)
+    draw = ImageDraw.Draw(img)
+    for line in range(lines):
+        top = 100 + line * 60
+        for word in range(words):
+            left = 100 + word * (160 + word_gap)
+            draw.rectangle((left, top, left + 159, top + 29), fill=0)
+            draw.rectangle((left + 60, top + 32, left + 79, top + 34), fill=0)
+    return img
+
+
+def test_descender_slivers_do_not_split_words_into_regions():
+    img = word_block()
+    assert ocr_gui.estimate_line_height(np.asarray(img) < 128) == 30
+    regions = ocr_gui.find_text_regions(img)
+    assert len(regions) == 1 and regions[0]['lines'] == 6
+
+
+def two_paragraph_page():
+    rows = [('Total:', 100, 50, 80, 20, 96.0, 1, 1), ('<5%', 190, 50, 50, 20, 71.4, 1, 1),
+            ('A&B', 100, 80, 60, 20, 88.0, 2, 1), ('"quoted"', 100, 150, 120, 22, 90.0, 3, 2)]
+    layout = ocr_gui.PageLayout.from_words(1000, 800, rows)
+    return {'page': 2, 'layout': layout.to_dict(), 'text': layout.text()}
+
+
+def test_hocr_carries_words_boxes_and_confidences():
+    out = io.StringIO()
+    writer = ocr_gui.HOCRWriter(out, 'scan <1>.tif')
+    writer.add_page(two_paragraph_page())
+    writer.close()
+    ns = {'h': 'http://www.w3.org/1999/xhtml'}
+    root = ET.fromstring(out.getvalue())
+    assert root.find('h:head/h:title', ns).text == 'scan <1>.tif'
+    page, = root.iterfind('.//h:div[@class="ocr_page"]', ns)
+    assert page.get('title') == 'bbox 0 0 1000 800; ppageno 1'
+    assert len(page.findall('h:p', ns)) == 2 and len(page.findall('.//h:span[@class="ocr_line"]', ns)) == 3
+    words = page.findall('.//h:span[@class="ocrx_word"]', ns)
+    assert [word.text for word in words] == ['Total:', '<5%', 'A&B', '"quoted"']
+    assert words[1].get('title') == 'bbox 190 50 240 70; x_wconf 71'
+    assert page.find('h:p', ns).get('title') == 'bbox 100 50 240 100'
+
+
+def test_alto_carries_words_boxes_and_confidences():
+    out = io.StringIO()
+    writer = ocr_gui.ALTOWriter(out, 'scan <1>.tif')
+    writer.add_page(two_paragraph_page())
+    writer.close()
+    ns = {'a': 'http://www.loc.gov/standards/alto/ns-v4#'}
+    root = ET.fromstring(out.getvalue())
+    assert root.find('a:Description/a:sourceImageInformation/a:fileName', ns).text == 'scan <1>.tif'
+    page, = root.iterfind('a:Layout/a:Page', ns)
+    assert (page.get('PHYSICAL_IMG_NR'), page.get('WIDTH'), page.get('HEIGHT')) == ('2', '1000', '800')
+    blocks = page.findall('a:PrintSpace/a:TextBlock', ns)
+    assert [len(block.findall('a:TextLine', ns)) for block in blocks] == [2, 1]
+    first_line = blocks[0].find('a:TextLine', ns)
+    assert [child.tag.split('}')[1] for child in first_line] == ['String', 'SP', 'String']
+    word = first_line.findall('a:String', ns)[1]
+    assert (word.get('CONTENT'), word.get('HPOS'), word.get('VPOS'), word.get('WIDTH'), word.get('HEIGHT'), word.get('WC')) == \
+        ('<5%', '190', '50', '50', '20', '0.71')
+    assert blocks[1].find('.//a:String', ns).get('CONTENT') == '"quoted"'
+
+
+def test_export_reuses_cached_layouts(tmp_path):
+    img, _ = text_page(800, 600)
+    path = tmp_path / 'page.png'
+    img.save(path)
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db')
+    engine = InkEngine()
+    outputs = []
+    for _ in range(2):
+        out = tmp_path / 'page.hocr'
+        with open(out, 'w', encoding='utf-8') as f:
+            assert ocr_gui.export_document(str(path), f, 'hocr', engine=engine, cache=cache) == 1
+        outputs.append(out.read_text(encoding='utf-8'))
+    assert len(engine.images) == 1
+    assert outputs[0] == outputs[1] and "class='ocrx_word'" in outputs[0]
+    cache.close()
+
+
+class RegionEngine(InkEngine):
+    def __init__(self):
+        super().__init__()
+        self.psms = []
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        self.psms.append(psm)
+        return super().recognize(img, lang_code, psm)
+
+
+def test_only_text_blocks_are_sent_to_the_engine():
+    # A form: a one-line title, a block of lines in the lower right, and white space elsewhere
+    form = Image.new('L', (2400, 3000), 255)
+    draw = ImageDraw.Draw(form)
+    draw.rectangle((200, 200, 900, 240), fill=0)
+    for top in range(2000, 2400, 60):
+        draw.rectangle((1400, top, 2200, top + 30), fill=0)
+    engine = RegionEngine()
+    result = ocr_gui.recognize_layout(engine, form)
+    assert result['regions'] == 2
+    assert sorted(engine.psms) == [ocr_gui.PSM_SINGLE_BLOCK, ocr_gui.PSM_SINGLE_LINE]
+    assert sum(img.width * img.height for img in engine.images) < form.width * form.height * 0.1
+    # Words come back in page coordinates and reading order
+    boxes = ocr_gui.PageLayout.from_dict(result['layout']).word_boxes.tolist()
+    assert [box[:2] for box in boxes] == [[200, 200], [1400, 2000]]
+    engine = RegionEngine()
+    assert ocr_gui.recognize_layout(engine, Image.new('L', (2400, 3000), 255))['text'] == ''
+    assert engine.images == []
@@ -0,0 +1,135 @@
+import cProfile
+import json
+
+import pytest
+from PIL import Image, ImageDraw
+
+import ocr_gui
+from test_tiling import InkEngine
+
+TILED = {'tile_pixels': 1_000_000, 'tile_size': 700}
+
+
+def test_profile_covers_producer_and_pool_threads(tmp_path):
+    img = Image.new('L', (1600, 1200), 255)
+    draw = ImageDraw.Draw(img)
+    for top in range(100, 1100, 40):
+        draw.rectangle((100, top, 1500, top + 12), fill=0)
+    path = tmp_path / 'page.png'
+    img.save(path)
+    metrics = ocr_gui.JobMetrics(str(path), profile=True)
+    pages = list(ocr_gui.recognize_document(str(path), engine=InkEngine(), params={'tile_pixels': 1_000_000, 'tile_size': 700},
+                                            timings=metrics.timings))
+    assert pages[0]['tiles'] > 1
+    metrics.finish(str(tmp_path / 'job.prof'))
+    functions = {name for _, _, name in metrics.stats.stats}
+    # open_for_ocr runs on the producer thread, recognize on the tile pool
+    assert {'open_for_ocr', 'recognize', 'preprocess_image'} <= functions
+    assert 'recognize' in metrics.profile_summary(limit=50)
+    assert (tmp_path / 'job.prof').stat().st_size > 0
+
+
+def test_job_queue_pages_carry_the_job_metrics(tmp_path, monkeypatch):
+    img = Image.new('L', (400, 300), 255)
+    ImageDraw.Draw(img).rectangle((50, 50, 350, 70), fill=0)
+    path = tmp_path / 'page.png'
+    img.save(path)
+    monkeypatch.setattr(ocr_gui, 'ensure_model_langdata', lambda *args: None)
+    monkeypatch.setattr(ocr_gui, 'get_engine', lambda *args: InkEngine())
+    monkeypatch.setattr(ocr_gui, 'get_cache', lambda: ocr_gui.OCRCache(tmp_path / 'cache.db'))
+    jobs = ocr_gui.OCRJobQueue()
+    job_id = jobs.submit(str(path))
+    events = {}
+    while 'done' not in events and 'failed' not in events:
+        kind, event_job, payload = jobs.events.get(timeout=10)
+        assert event_job == job_id
+        events[kind] = payload
+    assert 'failed' not in events, events['failed']
+    page, total, metrics = events['page']
+    # The GUI times its own handling of each page into the job
+    with metrics.stage('ui_update'):
+        pass
+    assert events['done'] is metrics and 'ui_update' in metrics.timings and 'ocr' in metrics.timings
+    jobs.shutdown()
+
+
+class BusyProfile(cProfile.Profile):
+    """A profiler that cannot start, as on Python 3.12+ while another one is active."""
+    def enable(self, *args, **kwargs):
+        raise ValueError('Another profiling tool is already active')
+
+
+def tiled_page(tmp_path):
+    img = Image.new('L', (1600, 1200), 255)
+    draw = ImageDraw.Draw(img)
+    for top in range(100, 1100, 40):
+        draw.rectangle((100, top, 1500, top + 12), fill=0)
+    path = tmp_path / 'page.png'
+    img.save(path)
+    return str(path)
+
+
+def test_job_runs_unprofiled_when_no_profiler_can_start(tmp_path, monkeypatch):
+    path = tiled_page(tmp_path)
+    metrics = ocr_gui.JobMetrics(path, profile=True)
+    # The job's own profiler is running; those for the producer and tile threads are refused
+    monkeypatch.setattr(cProfile, 'Profile', BusyProfile)
+    pages = list(ocr_gui.recognize_document(path, engine=InkEngine(), params=TILED, timings=metrics.timings))
+    assert pages[0]['tiles'] > 1
+    metrics.finish()
+    assert 'recognize_document' in {name for _, _, name in metrics.stats.stats}
+    busy = ocr_gui.JobMetrics(path, profile=True)
+    assert busy.profiler is None
+    assert len(list(ocr_gui.recognize_document(path, engine=InkEngine(), params=TILED))) == 1
+    assert busy.finish().stats is None
+
+
+def test_single_process_profiler_is_not_carried_to_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_gui, 'PROFILER_SEES_ALL_THREADS', True)
+    metrics = ocr_gui.JobMetrics('job', profile=True)
+    try:
+        assert ocr_gui.carry_profile(tiled_page) is tiled_page
+    finally:
+        metrics.finish()
+
+
+def test_producer_failing_to_start_does_not_hang_the_consumer(tmp_path, monkeypatch):
+    def refuse(fn):
+        def run():
+            raise ValueError('Another profiling tool is already active')
+        return run
+    monkeypatch.setattr(ocr_gui, 'carry_profile', refuse)
+    with pytest.raises(ValueError):
+        list(ocr_gui.recognize_document(tiled_page(tmp_path), engine=InkEngine()))
+
+
+def test_metrics_sinks_write_json_lines_and_prometheus_totals(tmp_path):
+    records = [{'job': 'a.png', 'seconds': 1.5, 'timings': {'decode': 0.25, 'ocr': 1.0}, 'peak_rss_kb': 2048, 'error': None},
+               {'job': 'b.png', 'seconds': 0.5, 'timings': {'ocr': 0.5}, 'peak_rss_kb': 4096, 'error': 'bad file'}]
+    for name in ('metrics.jsonl', 'metrics.prom'):
+        sink = ocr_gui.MetricsSink(str(tmp_path / name))
+        for record in records:
+            sink.record(record)
+        sink.close()
+    lines = (tmp_path / 'metrics.jsonl').read_text().splitlines()
+    assert [json.loads(line) for line in lines] == records
+    prom = (tmp_path / 'metrics.prom').read_text()
+    for sample in ('ocr_jobs_total 2', 'ocr_job_failures_total 1', 'ocr_job_seconds_total 2.000000',
+                   'ocr_stage_seconds_total{stage="decode"} 0.250000', 'ocr_stage_seconds_total{stage="ocr"} 1.500000',
+                   'ocr_peak_rss_bytes 4194304'):
+        assert sample in prom.splitlines()
+
+
+def test_job_metrics_time_each_stage(tmp_path):
+    img = Image.new('L', (400, 300), 255)
+    ImageDraw.Draw(img).rectangle((50, 50, 350, 70), fill=0)
+    path = tmp_path / 'page.png'
+    img.save(path)
+    metrics = ocr_gui.JobMetrics(str(path), profile=True)
+    pages = list(ocr_gui.recognize_document(str(path), engine=InkEngine(), timings=metrics.timings))
+    metrics.finish(str(tmp_path / 'job.prof'), pages=len(pages))
+    record = metrics.to_dict()
+    assert {'decode', 'binarize', 'deskew', 'ocr'} <= set(record['timings'])
+    assert record['seconds'] > 0 and record['pages'] == 1
+    assert record['peak_rss_kb'] > 0
+    assert (tmp_path / 'job.prof').stat().st_size > 0
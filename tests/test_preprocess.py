@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+import ocr_gui
+
+SENTENCES = ['The quick brown fox jumps over the lazy dog, again; yes.', 'Pack my box with five dozen liquor jugs, quickly!',
+             'Sphinx of black quartz, judge my vow: it is big.', 'How vexingly quick daft zebras jump, they say.']
+
+
+def text_page(points, dpi=300, size=(2480, 1200), lines=None):
+    """Body text at a point size, and the font's x-height in px."""
+    font = ImageFont.load_default(size=round(points * dpi / 72))
+    img = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(img)
+    top, count = 100, 0
+    while top + font.size * 1.5 < size[1] and (lines is None or count < lines):
+        draw.text((150, top), SENTENCES[count % len(SENTENCES)], font=font, fill=0)
+        top += int(font.size * 1.2)
+        count += 1
+    left, x_top, right, bottom = font.getbbox('x')
+    return img, bottom - x_top
+
+
+@pytest.mark.parametrize('points', [6, 8, 10, 11, 12, 14, 18, 24, 36])
+def test_x_height_is_measured_at_every_point_size(points):
+    img, x_height = text_page(points)
+    ink = np.asarray(img) < 128
+    assert abs(ocr_gui.estimate_x_height(ink) - x_height) <= 2
+    # A single sentence, and residual skew, measure the same
+    one, _ = text_page(points, lines=1)
+    assert abs(ocr_gui.estimate_x_height(np.asarray(one) < 128) - x_height) <= 2
+    skewed = np.asarray(img.rotate(0.3, resample=Image.BICUBIC, fillcolor=255)) < 128
+    assert abs(ocr_gui.estimate_x_height(skewed) - x_height) <= 3
+
+
+def test_descender_slivers_do_not_count_as_lines():
+    img, _ = text_page(12)
+    ink = np.asarray(img) < 128
+    line_height = ocr_gui.estimate_line_height(ink)
+    assert line_height > 40
+    assert all(band[0] >= line_height / 2 for band in ocr_gui.text_bands(ink))
+
+
+@pytest.mark.parametrize('points, scaled', [(6, True), (11, False), (12, False), (14, False), (36, True)])
+def test_only_text_outside_the_x_height_range_is_rescaled(points, scaled):
+    img, x_height = text_page(points)
+    arr = np.asarray(img).astype(np.float64) * 0.8 + 30 + np.random.default_rng(0).normal(0, 12, (img.height, img.width))
+    arr[:, :40] = 20  # a dark scanner edge
+    geometry = {}
+    ocr_gui.preprocess_image(Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8)), geometry=geometry)
+    scale = 1 / geometry['to_source'][0]
+    if not scaled:
+        assert scale == 1.0
+    else:
+        target = min(max(x_height, ocr_gui.PREPROCESS_PARAMS['min_x_height']), ocr_gui.PREPROCESS_PARAMS['max_x_height'])
+        assert abs(x_height * scale - target) <= 2
+
+
+def test_blank_page_is_not_rescaled():
+    geometry = {}
+    assert ocr_gui.preprocess_image(Image.new('L', (800, 600), 255), geometry=geometry).size == (800, 600)
+    assert geometry['to_source'] == ocr_gui.IDENTITY
+
+
+@pytest.mark.parametrize('angle', [-3.0, -1.5, 0.0, 2.0, 4.5])
+def test_skew_is_found_to_within_a_step(angle):
+    img, _ = text_page(12)
+    ink = np.asarray(img.rotate(angle, resample=Image.BICUBIC, fillcolor=255)) < 128
+    assert abs(ocr_gui.estimate_skew(ink) + angle) <= 0.5
+
+
+def test_sauvola_keeps_text_under_uneven_lighting():
+    img, _ = text_page(12, lines=4)
+    arr = np.asarray(img).astype(np.float64)
+    # Light falls off from 255 to about 90 across the page, darker than the text's threshold
+    shade = np.linspace(1.0, 0.35, arr.shape[1])[None, :]
+    lit = np.clip(arr * shade, 0, 255).astype(np.uint8)
+    truth = np.asarray(img) < 128
+    sauvola = ocr_gui.sauvola_binarize(lit)
+    fixed = lit < 128
+    # The shaded background is not ink, yet nearly all of the text still is
+    assert sauvola[~truth].mean() < 0.01 and fixed[~truth].mean() > 0.2
+    assert sauvola[truth].mean() > 0.8
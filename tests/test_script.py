@@ -0,0 +1,101 @@
+import json
+
+from PIL import Image, ImageDraw
+
+import ocr_gui
+from test_engine import fake_tesseract
+from test_tiling import InkEngine
+
+OSD = '''Page number: 0
+Orientation in degrees: 0
+Rotate: 0
+Orientation confidence: 12.41
+Script: Bengali
+Script confidence: 3.52
+'''
+
+
+class ScriptedEngine(InkEngine):
+    """Reports the given scripts for successive pages."""
+    def __init__(self, scripts=()):
+        super().__init__()
+        self.scripts = list(scripts)
+        self.detected = []
+        self.langs = []
+
+    def detect_script(self, img):
+        self.detected.append(img.size)
+        return {'script': self.scripts[len(self.detected) - 1], 'script_confidence': 5.0,
+                'orientation': 0, 'orientation_confidence': 5.0}
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        self.langs.append(lang_code)
+        return super().recognize(img, lang_code, psm)
+
+
+class FixedEngine:
+    def __init__(self, osd):
+        self.osd = osd
+
+    def detect_script(self, img):
+        self.size = img.size
+        return self.osd
+
+
+def page():
+    img = Image.new('L', (800, 600), 255)
+    ImageDraw.Draw(img).rectangle((100, 250, 700, 280), fill=0)
+    return img
+
+
+def test_scripts_map_to_one_model_or_fall_back():
+    def lang(script, confidence=5.0):
+        osd = None if script is None else {'script': script, 'script_confidence': confidence}
+        return ocr_gui.detect_language(FixedEngine(osd), Image.new('L', (100, 100), 255), fallback='deu')['lang']
+    assert lang('Bengali') == 'ben'
+    assert lang('HanT') == 'chi_tra'
+    assert lang('Latin') == 'eng'
+    assert lang('Bengali', confidence=0.5) == 'deu'
+    assert lang('Klingon') == 'deu'
+    assert lang(None) == 'deu'
+
+
+def test_osd_runs_on_a_downscaled_page():
+    engine = FixedEngine(None)
+    ocr_gui.detect_language(engine, Image.new('L', (4000, 3000), 255))
+    assert engine.size[0] * engine.size[1] <= ocr_gui.OSD_MAX_PIXELS
+
+
+def test_each_page_uses_its_scripts_model_and_decisions_are_cached(tmp_path, monkeypatch):
+    fetched = []
+    monkeypatch.setattr(ocr_gui, 'ensure_model_langdata', lambda lang, model='fast', log=None: fetched.append(lang))
+    path = tmp_path / 'mixed.tif'
+    page().save(path, save_all=True, append_images=[page(), page(), page()])
+    cache = ocr_gui.OCRCache(tmp_path / 'cache.db')
+    engine = ScriptedEngine(['Bengali', 'Latin', 'Cyrillic', 'Bengali'])
+    pages = list(ocr_gui.recognize_document(str(path), ocr_gui.AUTO_LANG, engine=engine, cache=cache, params={'deskew': False}))
+    assert [p['lang'] for p in pages] == engine.langs == ['ben', 'eng', 'rus', 'ben']
+    assert pages[0]['script']['script'] == 'Bengali'
+    # Each model is fetched once, however many pages need it
+    assert fetched == ['ben', 'eng', 'rus']
+    engine = ScriptedEngine()
+    again = list(ocr_gui.recognize_document(str(path), ocr_gui.AUTO_LANG, engine=engine, cache=cache, params={'deskew': False}))
+    assert engine.detected == [] and engine.langs == []
+    assert [p['lang'] for p in again] == ['ben', 'eng', 'rus', 'ben'] and all(p['cached'] for p in again)
+    cache.close()
+
+
+def osd_engine(command):
+    engine = ocr_gui.OCREngine(tesseract_cmd=command)
+    engine._tesserocr = None
+    return engine
+
+
+def test_cli_backend_reads_tesseract_osd(tmp_path):
+    command, log = fake_tesseract(tmp_path, output=OSD)
+    osd = osd_engine(command).detect_script(Image.new('L', (50, 50), 255))
+    assert osd == {'script': 'Bengali', 'script_confidence': 3.52, 'orientation': 0, 'orientation_confidence': 12.41}
+    assert json.loads(log.read_text())['argv'][2:6] == ['-l', 'osd', '--psm', '0']
+    command, _ = fake_tesseract(tmp_path, exit_code=1)
+    # Too little text for OSD is an error exit, which means undecided
+    assert osd_engine(command).detect_script(Image.new('L', (50, 50), 255)) is None
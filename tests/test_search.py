@@ -0,0 +1,77 @@
+import json
+import sqlite3
+
+import pytest
+from PIL import Image
+
+import ocr_gui
+
+
+@pytest.fixture(autouse=True)
+def restore_pixel_limit(monkeypatch):
+    # run_cli raises PIL's limit for the rest of the process
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
+
+
+def scan(tmp_path, name, content=b'scan'):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def indexed_documents(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def test_matches_are_ranked_with_snippets(tmp_path):
+    index = ocr_gui.SearchIndex(tmp_path / 'index.db')
+    index.add_document(scan(tmp_path, 'a.png', b'a'), [(1, 'eng', 'Invoice 1043 from Acme. Invoice total due: 120.00 EUR')])
+    index.add_document(scan(tmp_path, 'b.pdf', b'b'), [(1, 'eng', 'Cover letter'), (2, 'eng', 'see the attached invoice and the delivery note '
+                                                                                                + 'with many more words ' * 20)])
+    index.add_document(scan(tmp_path, 'c.png', b'c'), [(1, 'ben', 'কলকাতা শহরের চালান')])
+    index.add_document(scan(tmp_path, 'd.tif', b'd'), [(page, 'eng', f'minutes of meeting {page}') for page in range(1, 6)])
+    matches = index.search('invoice')
+    assert [(m['path'][-5:], m['page']) for m in matches] == [('a.png', 1), ('b.pdf', 2)]
+    assert matches[0]['score'] > matches[1]['score']
+    assert '[Invoice]' in matches[0]['snippet'] and matches[0]['lang'] == 'eng'
+    assert [m['page'] for m in index.search('"delivery note"')] == [2]
+    assert index.search('acme NOT invoice') == []
+    # Not valid FTS5, so its words are matched literally
+    assert [m['page'] for m in index.search('due: "120.00')] == [1]
+    # Bengali vowel signs do not split words
+    assert [m['lang'] for m in index.search('কলকাতা')] == ['ben']
+    assert index.search('   ') == []
+    index.close()
+
+
+def test_unchanged_documents_are_skipped_and_changed_ones_replaced(tmp_path):
+    db_path = tmp_path / 'index.db'
+    index = ocr_gui.SearchIndex(db_path, batch_size=2)
+    path = scan(tmp_path, 'a.png')
+    assert index.add_document(path, [(1, 'eng', 'old wording'), (2, 'eng', 'second page')])
+    # Written in one transaction once batch_size documents are queued
+    assert indexed_documents(db_path) == 0
+    assert index.add_document(scan(tmp_path, 'b.png', b'other'), [(1, 'eng', 'unrelated')])
+    assert indexed_documents(db_path) == 2
+    index.close()
+    index = ocr_gui.SearchIndex(db_path, batch_size=2)
+    assert not index.add_document(path, [(1, 'eng', 'old wording'), (2, 'eng', 'second page')])
+    assert index.add_document(path, [(1, 'eng', 'new wording')])
+    assert index.search('old') == [] and [m['page'] for m in index.search('wording')] == [1]
+    assert index.stats() == {'documents': 2, 'pages': 2}
+    index.close()
+
+
+def test_search_command(tmp_path, capsys):
+    db_path = tmp_path / 'index.db'
+    index = ocr_gui.SearchIndex(db_path)
+    result = {'path': scan(tmp_path, 'a.tif'), 'lang': 'eng', 'text': 'first page\fpurchase order 77', 'page_langs': ['eng', 'deu']}
+    assert ocr_gui.index_result(index, result)
+    index.close()
+    assert ocr_gui.run_cli(['search', 'order', '--index', str(db_path), '--json']) == 0
+    out, err = capsys.readouterr()
+    match = json.loads(out)
+    assert (match['page'], match['lang'], match['snippet']) == (2, 'deu', 'purchase [order] 77')
+    assert '1 match(es) in 1 document(s), 2 page(s)' in err
+    assert ocr_gui.run_cli(['search', 'missing', '--index', str(db_path)]) == 1
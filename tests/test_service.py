@@ -0,0 +1,96 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+import ocr_gui
+from test_tiling import InkEngine
+
+
+class GatedEngine(InkEngine):
+    """Holds every recognition until the test opens the gate."""
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def warm(self, lang_code):
+        pass
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        self.gate.wait(10)
+        return super().recognize(img, lang_code, psm)
+
+
+def png_bytes():
+    img = Image.new('L', (400, 200), 255)
+    ImageDraw.Draw(img).rectangle((50, 80, 350, 110), fill=0)
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def service():
+    engine = GatedEngine()
+    service = ocr_gui.OCRService(engine, workers=1, queue_size=1, timeout=5.0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ocr_gui.make_service_handler(service))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield service
+    engine.gate.set()
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def request(url, data=None, headers=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers or {}), timeout=10) as response:
+            return response.status, dict(response.headers), json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), json.loads(e.read())
+
+
+def test_full_queue_is_refused_with_429(service):
+    data = png_bytes()
+    # One job running and one waiting fill the service
+    held = [service.submit(data), service.submit(data)]
+    status, headers, body = request(service.url + '/ocr', data)
+    assert status == 429 and headers['Retry-After'] == '1'
+    service.engine.gate.set()
+    assert all(future.result(5)['text'].strip() == 'ink' for future in held)
+    status, _, body = request(service.url + '/ocr?lang=eng', data)
+    assert status == 200 and body['text'].strip() == 'ink' and body['pages'][0]['words'] == 1
+    _, _, health = request(service.url + '/health')
+    assert (health['status'], health['completed'], health['rejected']) == ('ok', 3, 1)
+
+
+def test_multipart_upload_and_bad_requests(service):
+    service.engine.gate.set()
+    boundary = 'XyZ'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="note"\r\n\r\nhello\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="scan.png"\r\n'
+            'Content-Type: image/png\r\n\r\n').encode() + png_bytes() + f'\r\n--{boundary}--\r\n'.encode()
+    status, _, result = request(service.url + '/ocr', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    assert status == 200 and result['text'].strip() == 'ink'
+    assert request(service.url + '/ocr?lang=eng;rm', png_bytes())[0] == 400
+    assert request(service.url + '/ocr', b'not an image')[0] == 500
+    assert request(service.url + '/missing')[0] == 404
+
+
+def test_slow_job_times_out_but_keeps_its_slot(service):
+    service.timeout = 0.2
+    status, _, body = request(service.url + '/ocr', png_bytes())
+    assert status == 504
+    # The job is still running, so with the one queue slot taken the service is full again
+    assert service.submit(png_bytes()) is not None
+    assert service.submit(png_bytes()) is None
+    service.engine.gate.set()
+    _, _, health = request(service.url + '/health')
+    assert health['timed_out'] == 1 and health['rejected'] == 1
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import ocr_gui
+
+
+def age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_fresh_lease_is_not_taken(tmp_path):
+    lease = str(tmp_path / 'chunk.lease')
+    assert ocr_gui.claim_lease(lease, 'a', lease_seconds=60)
+    assert not ocr_gui.claim_lease(lease, 'b', lease_seconds=60)
+    assert ocr_gui.lease_owner(lease) == 'a'
+
+
+def test_stale_lease_goes_to_exactly_one_contender(tmp_path):
+    for round_no in range(20):
+        lease = str(tmp_path / f'chunk-{round_no}.lease')
+        assert ocr_gui.claim_lease(lease, 'dead', lease_seconds=60)
+        age(lease, 120)
+        start = threading.Barrier(8)
+        winners = []
+
+        def contend(node):
+            start.wait()
+            if ocr_gui.claim_lease(lease, node, lease_seconds=60):
+                winners.append(node)
+        threads = [threading.Thread(target=contend, args=(f'node{i}',)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(winners) == 1 and ocr_gui.lease_owner(lease) == winners[0]
+    assert sorted(name for name in os.listdir(tmp_path) if 'takeover' in name or name.endswith('.tmp')) == []
+
+
+def test_takeover_marker_left_by_a_dead_node_expires(tmp_path):
+    lease = str(tmp_path / 'chunk.lease')
+    assert ocr_gui.claim_lease(lease, 'dead', lease_seconds=60)
+    age(lease, 120)
+    with open(lease, encoding='utf-8') as f:
+        marker = f"{lease}.takeover.{hashlib.sha1(f.read().encode('utf-8')).hexdigest()[:16]}"
+    with open(marker, 'w') as f:
+        f.write('crashed')
+    assert not ocr_gui.claim_lease(lease, 'b', lease_seconds=60)
+    age(marker, 120)
+    assert ocr_gui.claim_lease(lease, 'b', lease_seconds=60)
+    assert ocr_gui.lease_owner(lease) == 'b'
+
+
+def test_shared_dir_of_another_run_is_refused(tmp_path):
+    for name in ('one', 'two'):
+        (tmp_path / name).mkdir()
+        Image.new('L', (10, 10), 255).save(tmp_path / name / 'page.png')
+    shared = str(tmp_path / 'shared')
+    os.makedirs(shared)
+    plan = ocr_gui.load_shard_plan(shared, str(tmp_path / 'one'), 'a')
+    assert plan['chunks'] == [[str(tmp_path / 'one' / 'page.png')]]
+    with pytest.raises(Exception, match='fresh shared directory'):
+        ocr_gui.run_shared_batch(str(tmp_path / 'two'), shared)
+    with open(os.path.join(shared, 'plan.json'), encoding='utf-8') as f:
+        assert json.load(f)['target'] == str(tmp_path / 'one')
+    assert not os.path.exists(os.path.join(shared, 'results.jsonl'))
@@ -0,0 +1,63 @@
+from PIL import Image
+
+import ocr_gui
+
+
+class FixedEngine:
+    """Returns one word at a fixed confidence, or raises like Tesseract without its model."""
+    backend = 'test'
+    tesseract_cmd = None
+
+    def __init__(self, confidence, tessdata_dir=None, error=None):
+        self.confidence = confidence
+        self.tessdata_dir = tessdata_dir
+        self.error = error
+        self.calls = 0
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        self.calls += 1
+        if self.error:
+            raise Exception(self.error)
+        layout = ocr_gui.PageLayout.from_words(img.width, img.height, [('word', 0, 0, 10, 10, self.confidence, 1, 1)])
+        return ocr_gui.layout_result(layout.text(), layout)
+
+
+def test_missing_best_model_keeps_fast_result_and_stops_escalating(tmp_path):
+    fast = FixedEngine(40.0)
+    best = FixedEngine(95.0, tessdata_dir=str(tmp_path), error="Failed loading language 'eng'")
+    engine = ocr_gui.TieredEngine(fast, best)
+    img = Image.new('L', (20, 20), 255)
+    for _ in range(3):
+        assert engine.recognize(img)['confidence'] == 40.0
+    assert best.calls == 1
+    stats = engine.stats()
+    assert stats['fallbacks'] == 1 and stats['missing_best'] == ['eng']
+    assert 'kept fast' in ocr_gui.format_tier_stats(stats)
+
+
+def test_transient_best_failure_is_retried_next_time(tmp_path):
+    (tmp_path / 'eng.traineddata').write_bytes(b'model')
+    fast = FixedEngine(40.0)
+    best = FixedEngine(95.0, tessdata_dir=str(tmp_path), error='Tesseract failed (-9)')
+    engine = ocr_gui.TieredEngine(fast, best)
+    img = Image.new('L', (20, 20), 255)
+    engine.recognize(img)
+    best.error = None
+    assert engine.recognize(img)['confidence'] == 95.0
+    assert engine.stats()['fallbacks'] == 1
+
+
+def test_only_low_confidence_results_are_escalated_and_the_better_one_kept():
+    img = Image.new('L', (20, 20), 255)
+    fast, best = FixedEngine(85.0), FixedEngine(92.0)
+    engine = ocr_gui.TieredEngine(fast, best, threshold=80.0)
+    assert engine.recognize(img)['confidence'] == 85.0 and best.calls == 0
+    fast.confidence = 60.0
+    assert engine.recognize(img)['confidence'] == 92.0
+    # A best result that is no more confident does not replace the fast one
+    best.confidence = 55.0
+    assert engine.recognize(img, psm=7)['confidence'] == 60.0
+    stats = engine.stats()
+    assert (stats['fast']['calls'], stats['best']['calls'], stats['escalated'], stats['improved']) == (3, 2, 2, 1)
+    assert stats['fast']['mean_confidence'] == round((85 + 60 + 60) / 3, 2)
+    assert 'escalated 2 (67%) below 80, 1 improved' in ocr_gui.format_tier_stats(stats)
@@ -0,0 +1,80 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import ocr_gui
+
+
+class InkEngine:
+    """Stands in for OCREngine: 'reads' one word per image that has any ink."""
+    model = 'fast'
+    backend = 'test'
+
+    def __init__(self):
+        self.images = []
+
+    def version(self):
+        return 'test'
+
+    def recognize(self, img, lang_code='eng', psm=None):
+        self.images.append(img)
+        arr = np.asarray(img.convert('L'))
+        rows = []
+        if (arr < 128).any():
+            ys, xs = np.nonzero(arr < 128)
+            rows.append(('ink', int(xs.min()), int(ys.min()), int(np.ptp(xs)) + 1, int(np.ptp(ys)) + 1, 90.0, 1, 1))
+        layout = ocr_gui.PageLayout.from_words(img.width, img.height, rows)
+        return ocr_gui.layout_result(layout.text(), layout)
+
+
+def bilevel_page(width=3000, height=2000):
+    img = Image.new('1', (width, height), 1)
+    draw = ImageDraw.Draw(img)
+    for top in range(200, height - 200, 300):
+        draw.rectangle((200, top, width - 200, top + 40), fill=0)
+    return img
+
+
+def test_otsu_threshold_splits_bilevel_histogram():
+    hist = [0] * 256
+    hist[0], hist[255] = 100, 900
+    assert ocr_gui.otsu_threshold_from_histogram(hist) == 128
+
+
+def test_tiled_bilevel_page_is_not_blank():
+    engine = InkEngine()
+    result = ocr_gui.recognize_tiled(engine, bilevel_page(), params={'tile_size': 1024})
+    assert result['tiles'] > 1
+    assert engine.images
+    assert result['text'].strip()
+
+
+def test_tiling_is_decided_on_the_decoded_page(tmp_path):
+    # Small text is upscaled by preprocessing, which must not turn the page into a tiled one
+    img = Image.new('L', (1000, 1000), 255)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=10)
+    for top in range(100, 900, 20):
+        draw.text((100, top), 'the quick brown fox jumps over the lazy dog ' * 3, fill=0, font=font)
+    path = tmp_path / 'page.png'
+    img.save(path)
+    engine = InkEngine()
+    params = {'tile_pixels': 1_500_000, 'tile_size': 512}
+    pages = list(ocr_gui.recognize_document(str(path), engine=engine, params=params))
+    assert 'tiles' not in pages[0]
+    assert len(engine.images) == 1 and engine.images[0].width > img.width
+    assert pages[0]['text'].strip()
+
+
+def words(*rows):
+    return ocr_gui.PageLayout.from_words(3000, 2000, [(text, left, top, width, 20, 90.0, line, 1)
+                                                      for text, left, top, width, line in rows])
+
+
+def test_column_seam_keeps_each_word_once():
+    # Tiles meet at x=1000 and overlap from 900 to 1100; each line crosses the seam
+    left = words(('total', 700, 100, 150, 1), ('amount', 920, 100, 180, 1), ('exam', 980, 300, 120, 2))
+    right = words(('amount', 920, 100, 180, 1), ('example', 980, 300, 260, 2), ('due', 1300, 300, 80, 2))
+    left, right = ocr_gui._drop_seam_duplicates(left, right, (900, 0, 1100, 2000))
+    assert left.word_texts() == ['total', 'amount']
+    assert right.word_texts() == ['example', 'due']
+    assert right.line_boxes.tolist() == [[980, 300, 400, 20]]
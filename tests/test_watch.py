@@ -0,0 +1,61 @@
+import os
+import time
+
+from PIL import Image, ImageDraw
+
+import ocr_gui
+from test_batch import WarmInkEngine
+
+
+def settle(*paths):
+    stamp = time.time() - 60
+    for path in paths:
+        os.utime(path, (stamp, stamp))
+
+
+def add_page(path):
+    img = Image.new('L', (400, 300), 255)
+    ImageDraw.Draw(img).rectangle((50, 50, 350, 70), fill=0)
+    img.save(path)
+    settle(path, os.path.dirname(path))
+
+
+def test_poller_lists_only_changed_directories(tmp_path, monkeypatch):
+    for i in range(20):
+        (tmp_path / f'dir{i}').mkdir()
+        add_page(str(tmp_path / f'dir{i}' / 'page.png'))
+    settle(tmp_path)
+    poller = ocr_gui.DirectoryPoller(str(tmp_path))
+    assert len(poller.poll()) == 20
+    assert poller.poll() == []
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: listed.append(path) or scandir(path))
+    add_page(str(tmp_path / 'dir7' / 'new.tif'))
+    (tmp_path / 'dir3' / 'nested').mkdir()
+    add_page(str(tmp_path / 'dir3' / 'nested' / 'deep.pdf'))
+    settle(tmp_path / 'dir3')
+    # Everything in a changed directory comes back; the manifest tells which files are new
+    assert poller.poll() == [str(tmp_path / name) for name in ('dir3/nested/deep.pdf', 'dir3/page.png', 'dir7/new.tif', 'dir7/page.png')]
+    assert sorted(listed) == [str(tmp_path / 'dir3'), str(tmp_path / 'dir3' / 'nested'), str(tmp_path / 'dir7')]
+    assert len(poller.rescan()) == 22
+
+
+def test_recently_changed_directory_is_listed_again(tmp_path):
+    add_page(str(tmp_path / 'one.png'))
+    poller = ocr_gui.DirectoryPoller(str(tmp_path))
+    os.utime(tmp_path)
+    assert poller.poll() == [str(tmp_path / 'one.png')]
+    # Same mtime tick as a file landing right after the listing; look again rather than trust it
+    assert poller.poll() == [str(tmp_path / 'one.png')]
+
+
+def test_watch_once_without_watchdog_processes_the_backlog(tmp_path, monkeypatch):
+    inbox = tmp_path / 'inbox'
+    (inbox / 'sub').mkdir(parents=True)
+    add_page(str(inbox / 'a.png'))
+    add_page(str(inbox / 'sub' / 'b.png'))
+    monkeypatch.setattr(ocr_gui, 'get_engine', lambda *args, **kwargs: WarmInkEngine())
+    monkeypatch.setattr(ocr_gui, 'ensure_model_langdata', lambda *args: None)
+    assert ocr_gui.run_watch(str(inbox), str(tmp_path / 'out'), workers=1, cache_path=None, once=True) == (2, 0)
+    assert (tmp_path / 'out' / 'sub' / 'b.txt').read_text().strip() == 'ink'